@@ -0,0 +1,106 @@
+import threading
+from bisect import bisect_left, insort
+
+
+class AlertIndex:
+    """In-process index of active price alerts, sorted by target price per product
+
+    A price change only has to look at the tail of one product's sorted list,
+    so finding the triggered alerts is O(log n + k). Alerts can be created
+    by any web worker, so the index is a per-cycle cache used only by the
+    refresh cycle and the alert sweep: each reloads it from the database,
+    and within a process it is kept in sync on alert create, delete and
+    trigger. Request handlers query the database instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # product_id -> sorted [(target_price, alert_id), ...]
+        self._by_product = {}
+        # alert_id -> (product_id, target_price)
+        self._alerts = {}
+        self.loaded = False
+
+    def load(self, rows):
+        """Replace the index contents with (alert_id, product_id, target_price) rows"""
+        by_product = {}
+        alerts = {}
+        for alert_id, product_id, target_price in rows:
+            if target_price is None:
+                continue
+            by_product.setdefault(product_id, []).append((target_price, alert_id))
+            alerts[alert_id] = (product_id, target_price)
+        for entries in by_product.values():
+            entries.sort()
+
+        with self._lock:
+            self._by_product = by_product
+            self._alerts = alerts
+            self.loaded = True
+
+    def add(self, alert_id, product_id, target_price):
+        with self._lock:
+            self._remove_locked(alert_id)
+            insort(self._by_product.setdefault(product_id, []), (target_price, alert_id))
+            self._alerts[alert_id] = (product_id, target_price)
+
+    def remove(self, alert_id):
+        with self._lock:
+            self._remove_locked(alert_id)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            for _, alert_id in self._by_product.pop(product_id, []):
+                self._alerts.pop(alert_id, None)
+
+    def triggered(self, product_id, price):
+        """Return ids of alerts on a product whose target_price is at or above price"""
+        if price is None:
+            return []
+        with self._lock:
+            entries = self._by_product.get(product_id)
+            if not entries:
+                return []
+            start = bisect_left(entries, (price, float('-inf')))
+            return [alert_id for _, alert_id in entries[start:]]
+
+    def product_ids(self):
+        """Return ids of products that have at least one active alert"""
+        with self._lock:
+            return list(self._by_product)
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def _remove_locked(self, alert_id):
+        existing = self._alerts.pop(alert_id, None)
+        if existing is None:
+            return
+        product_id, target_price = existing
+        entries = self._by_product.get(product_id, [])
+        position = bisect_left(entries, (target_price, alert_id))
+        if position < len(entries) and entries[position] == (target_price, alert_id):
+            del entries[position]
+        if not entries:
+            self._by_product.pop(product_id, None)
+
+
+alert_index = AlertIndex()
+
+
+def rebuild_alert_index():
+    """Load every active alert from the database into the index"""
+    from database import db
+    from models import PriceAlert
+
+    rows = db.session.query(PriceAlert.id, PriceAlert.product_id, PriceAlert.target_price).filter(
+        PriceAlert.is_active == True
+    ).yield_per(10000)
+    alert_index.load(rows)
+    return len(alert_index)
+
+
+def ensure_alert_index():
+    """Load the index if this process has not yet; cycles call rebuild_alert_index instead"""
+    if not alert_index.loaded:
+        rebuild_alert_index()
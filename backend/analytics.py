@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from history_store import load_history
+from series_cache import get_series_cache
+
+LOW_WINDOWS = (30, 90, 365)
+# Window the "rolling" median is taken over
+MEDIAN_WINDOW_DAYS = 30
+# Alert target suggestions: name -> percentile of the window's prices
+SUGGESTION_WINDOW_DAYS = 30
+TARGET_SUGGESTIONS = {'low_30d': 0, 'p10_30d': 10, 'p25_30d': 25, 'median_30d': 50}
+
+
+def load_histories(product_ids, days=max(LOW_WINDOWS)):
+    """Load the price history of many products in one query as NumPy arrays
+
+    Returns (product_ids, timestamps, prices) sorted by product then time,
+    with timestamps as datetime64[s].
+    """
+    if not product_ids:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[s]'), np.empty(0, dtype=np.float64))
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    series_cache = get_series_cache()
+    cached = series_cache.read(product_ids, cutoff) if series_cache else None
+    if cached is not None:
+        pids, _, timestamps, prices = cached
+        return pids, timestamps.astype('datetime64[s]'), prices
+
+    rows = load_history(product_ids, cutoff)
+
+    if not rows:
+        return load_histories([], days)
+
+    _, pids, prices, timestamps = zip(*rows)
+    return (
+        np.fromiter(pids, dtype=np.int64, count=len(rows)),
+        np.array(timestamps, dtype='datetime64[s]'),
+        np.fromiter(prices, dtype=np.float64, count=len(rows))
+    )
+
+
+def _windowed_min(prices, mask, starts):
+    masked = np.where(mask, prices, np.inf)
+    lows = np.minimum.reduceat(masked, starts)
+    return np.where(np.isinf(lows), np.nan, lows)
+
+
+def _window_percentiles(pids, prices, group_of, groups, mask, percentiles):
+    """Per-product percentiles (linear interpolation) of the prices selected by mask
+
+    Rows are time-ordered, so only the masked rows need sorting by
+    (product, price); each percentile is then read off every product's run
+    at once. Products without rows in the window get NaN.
+    """
+    window_prices = prices[mask]
+    order = np.lexsort((window_prices, pids[mask]))
+    sorted_prices = np.append(window_prices[order], np.nan)
+    window_counts = np.bincount(group_of[mask], minlength=groups)
+    window_starts = np.concatenate(([0], np.cumsum(window_counts)[:-1]))
+    has_rows = window_counts > 0
+
+    results = []
+    for percentile in percentiles:
+        position = (window_counts - 1) * (percentile / 100)
+        lower = np.where(has_rows, window_starts + np.floor(position).astype(np.int64), len(window_prices))
+        upper = np.where(has_rows, window_starts + np.ceil(position).astype(np.int64), len(window_prices))
+        fraction = position - np.floor(position)
+        results.append(sorted_prices[lower] + (sorted_prices[upper] - sorted_prices[lower]) * fraction)
+    return results
+
+
+def compute_price_stats(pids, timestamps, prices, current_prices=None, now=None):
+    """Compute per-product price statistics over pre-sorted history arrays
+
+    ``pids``/``timestamps``/``prices`` must be sorted by product then time
+    (as returned by load_histories). ``current_prices`` optionally maps
+    product id to the live price; otherwise the latest history price is used.
+    Returns {product_id: stats}.
+    """
+    if len(pids) == 0:
+        return {}
+
+    now = np.datetime64(now or datetime.utcnow(), 's')
+
+    # Group boundaries: every product occupies one contiguous run
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(pids)) + 1))
+    ends = np.append(starts[1:], len(pids))
+    counts = ends - starts
+    group_pids = pids[starts]
+    group_of = np.repeat(np.arange(len(starts)), counts)
+
+    age_days = (now - timestamps) / np.timedelta64(1, 'D')
+
+    lows = {window: _windowed_min(prices, age_days <= window, starts) for window in LOW_WINDOWS}
+    averages = np.add.reduceat(prices, starts) / counts
+
+    # Volatility: standard deviation of consecutive log returns within a product
+    log_prices = np.log(np.maximum(prices, 1e-9))
+    returns = np.diff(log_prices)
+    same_product = pids[1:] == pids[:-1]
+    returns = np.where(same_product, returns, 0.0)
+    n_returns = np.bincount(group_of[1:][same_product], minlength=len(starts))
+    sum_returns = np.bincount(group_of[1:], weights=returns, minlength=len(starts))
+    sum_squares = np.bincount(group_of[1:], weights=returns * returns, minlength=len(starts))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_returns = sum_returns / n_returns
+        volatility = np.sqrt(np.maximum(sum_squares / n_returns - mean_returns ** 2, 0.0))
+    volatility = np.where(n_returns > 1, volatility, np.nan)
+
+    # Median over the recent window
+    medians = _window_percentiles(pids, prices, group_of, len(starts), age_days <= MEDIAN_WINDOW_DAYS, (50,))[0]
+
+    latest = prices[ends - 1]
+    if current_prices:
+        latest = np.array([
+            current_prices.get(int(pid)) if current_prices.get(int(pid)) is not None else fallback
+            for pid, fallback in zip(group_pids, latest)
+        ], dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drop_vs_median = (medians - latest) / medians * 100
+
+    def clean(value):
+        return None if np.isnan(value) else round(float(value), 4)
+
+    stats = {}
+    for i, pid in enumerate(group_pids.tolist()):
+        stats[pid] = {
+            'current_price': clean(latest[i]),
+            'lowest_30d': clean(lows[30][i]),
+            'lowest_90d': clean(lows[90][i]),
+            'lowest_365d': clean(lows[365][i]),
+            'average': clean(averages[i]),
+            'volatility': clean(volatility[i]),
+            'rolling_median': clean(medians[i]),
+            'drop_vs_median_pct': clean(drop_vs_median[i]),
+            'data_points': int(counts[i])
+        }
+    return stats
+
+
+def get_products_analytics(products):
+    """Price statistics for a list of Product rows, keyed by product id"""
+    product_ids = [product.id for product in products]
+    pids, timestamps, prices = load_histories(product_ids)
+    return compute_price_stats(
+        pids, timestamps, prices,
+        current_prices={product.id: product.current_price for product in products}
+    )
+
+
+def suggest_target_prices(product_ids, now=None):
+    """Suggested alert target prices per product from its recent history, in one batched pass
+
+    Returns {product_id: {name: price}} for the names in TARGET_SUGGESTIONS;
+    products without history in the window are left out.
+    """
+    pids, timestamps, prices = load_histories(product_ids, days=SUGGESTION_WINDOW_DAYS)
+    if len(pids) == 0:
+        return {}
+
+    now = np.datetime64(now or datetime.utcnow(), 's')
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(pids)) + 1))
+    counts = np.diff(np.append(starts, len(pids)))
+    group_of = np.repeat(np.arange(len(starts)), counts)
+    in_window = (now - timestamps) / np.timedelta64(1, 'D') <= SUGGESTION_WINDOW_DAYS
+
+    names = list(TARGET_SUGGESTIONS)
+    values = _window_percentiles(pids, prices, group_of, len(starts), in_window,
+                                 [TARGET_SUGGESTIONS[name] for name in names])
+    suggestions = {}
+    for i, pid in enumerate(pids[starts].tolist()):
+        if np.isnan(values[0][i]):
+            continue
+        suggestions[pid] = {name: round(float(column[i]), 2) for name, column in zip(names, values)}
+    return suggestions
@@ -1,11 +1,87 @@
 # auth.py
+import os
 import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify
+from werkzeug.local import LocalProxy
 from models import User, UserSession
 from database import db
 
+AUTH_CONFIG = {
+    # Seconds a token lookup is trusted before the database is asked again;
+    # bounds how long a session revoked by another process stays usable here
+    'SESSION_CACHE_TTL': float(os.getenv('SESSION_CACHE_TTL', 60)),
+    'SESSION_CACHE_SIZE': int(os.getenv('SESSION_CACHE_SIZE', 100000))
+}
+
+
+class SessionCache:
+    """Token -> user id lookups, each trusted for at most ttl seconds
+
+    Entries are kept in insertion order, which is also the order their TTL
+    runs out in, so expired entries are dropped from the front in amortized
+    constant time. An entry never outlives its session's expires_at.
+    Unknown and expired tokens are cached too (as None) so repeated bad
+    tokens don't reach the database either.
+    """
+
+    def __init__(self, ttl=AUTH_CONFIG['SESSION_CACHE_TTL'], max_size=AUTH_CONFIG['SESSION_CACHE_SIZE']):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # token -> (user_id or None, monotonic deadline)
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        """Return (hit, user_id); user_id is None for a cached invalid token"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                return False, None
+            return True, entry[0]
+
+    def put(self, token, user_id, expires_at=None):
+        now = time.monotonic()
+        deadline = now + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, now + (expires_at - datetime.utcnow()).total_seconds())
+        with self._lock:
+            self._entries.pop(token, None)
+            self._entries[token] = (user_id, deadline)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self, now):
+        # Entries cut short by their session's expiry may sit behind live
+        # ones; get() checks every deadline anyway
+        entries = self._entries
+        while entries:
+            token, (_, deadline) = next(iter(entries.items()))
+            if deadline > now:
+                break
+            del entries[token]
+
+
+session_cache = SessionCache()
+
+
 def generate_session_token():
     """Generate a secure session token"""
     return secrets.token_urlsafe(32)
@@ -14,76 +90,92 @@ def create_user_session(user_id, expires_in_days=30):
     """Create a new session for a user"""
     session_token = generate_session_token()
     expires_at = datetime.utcnow() + timedelta(days=expires_in_days)
-    
+
     session = UserSession(
         user_id=user_id,
         session_token=session_token,
         expires_at=expires_at
     )
-    
+
     db.session.add(session)
     db.session.commit()
-    
+
+    session_cache.put(session_token, user_id, expires_at)
     return session_token
 
-def get_current_user():
-    """Get the current authenticated user from the session token"""
+def resolve_session(token):
+    """Return the user id of an active, unexpired session token, or None"""
+    hit, user_id = session_cache.get(token)
+    if hit:
+        return user_id
+
+    row = db.session.query(UserSession.user_id, UserSession.expires_at).filter_by(
+        session_token=token,
+        is_active=True
+    ).first()
+
+    # Expired sessions are only rejected here; cleanup_expired_sessions
+    # deactivates them in bulk
+    if row is None or row.expires_at <= datetime.utcnow():
+        session_cache.put(token, None)
+        return None
+
+    session_cache.put(token, row.user_id, row.expires_at)
+    return row.user_id
+
+def _bearer_token():
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
-    
-    token = auth_header.split(' ')[1]
-    
-    session = UserSession.query.filter_by(
-        session_token=token, 
-        is_active=True
-    ).first()
-    
-    if not session or session.is_expired():
-        if session:
-            session.is_active = False
-            db.session.commit()
+    return auth_header.split(' ')[1]
+
+def get_current_user():
+    """Get the current authenticated user from the session token"""
+    token = _bearer_token()
+    user_id = resolve_session(token) if token else None
+    if user_id is None:
         return None
-    
-    return session.user
+    return db.session.get(User, user_id)
 
 def login_required(f):
     """Decorator to require authentication for endpoints"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user = get_current_user()
-        if not user:
+        token = _bearer_token()
+        user_id = resolve_session(token) if token else None
+        if user_id is None:
             return jsonify({'error': 'Authentication required'}), 401
-        
-        # Add user to request context
-        request.current_user = user
+
+        # Add user to request context; the user row is only loaded if the
+        # endpoint reads it, and then once per request (identity map)
+        request.current_user_id = user_id
+        request.current_user = LocalProxy(lambda: db.session.get(User, user_id))
         return f(*args, **kwargs)
-    
+
     return decorated_function
 
 def logout_user(session_token):
     """Logout a user by deactivating their session"""
-    session = UserSession.query.filter_by(
-        session_token=session_token, 
+    updated = UserSession.query.filter_by(
+        session_token=session_token,
         is_active=True
-    ).first()
-    
-    if session:
-        session.is_active = False
-        db.session.commit()
-        return True
-    
-    return False
-
-def cleanup_expired_sessions():
-    """Clean up expired sessions - can be run periodically"""
-    expired_sessions = UserSession.query.filter(
-        UserSession.expires_at < datetime.utcnow(),
-        UserSession.is_active == True
-    ).all()
-    
-    for session in expired_sessions:
-        session.is_active = False
-    
+    ).update({UserSession.is_active: False}, synchronize_session=False)
+    db.session.commit()
+
+    session_cache.invalidate(session_token)
+    return bool(updated)
+
+def cleanup_expired_sessions(delete=False):
+    """Deactivate every expired session in one UPDATE (or remove them in one DELETE)
+
+    Returns the number of sessions affected. Can be run periodically.
+    """
+    expired = UserSession.query.filter(UserSession.expires_at < datetime.utcnow())
+    if delete:
+        count = expired.delete(synchronize_session=False)
+    else:
+        count = expired.filter(UserSession.is_active == True).update(
+            {UserSession.is_active: False}, synchronize_session=False
+        )
     db.session.commit()
-    return len(expired_sessions)
\ No newline at end of file
+    return count
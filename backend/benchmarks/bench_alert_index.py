@@ -0,0 +1,85 @@
+"""Alert matching with the in-memory threshold index.
+
+Loads a million active alerts into AlertIndex and times bulk load, matching a
+new price for one product, and add/remove. A linear scan over the same alerts
+(what the old scheduled sweep amounted to) is timed for comparison, along
+with rebuilding the index from a seeded SQLite database.
+
+    python benchmarks/bench_alert_index.py --alerts 1000000 --products 100000
+"""
+import argparse
+import random
+import time
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1000000)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--db-products', type=int, default=20000, help='Products seeded for the rebuild-from-DB timing')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    from alert_index import AlertIndex
+
+    rng = random.Random(7)
+    base_prices = [rng.uniform(200, 80000) for _ in range(args.products)]
+    rows = []
+    for alert_id in range(1, args.alerts + 1):
+        product_id = rng.randrange(args.products)
+        rows.append((alert_id, product_id, round(base_prices[product_id] * rng.uniform(0.5, 1.0), 2)))
+
+    results = {}
+    index = AlertIndex()
+    results['load'] = common.measure(lambda: index.load(rows), repeat=args.repeat, warmup=0)
+    results['load']['alerts'] = len(index)
+
+    lookups = [(product_id, base_prices[product_id] * rng.uniform(0.6, 1.0))
+               for product_id in (rng.randrange(args.products) for _ in range(args.lookups))]
+
+    def match_all():
+        for product_id, price in lookups:
+            index.triggered(product_id, price)
+
+    results['triggered'] = common.measure(match_all, repeat=args.repeat)
+    results['triggered']['per_lookup_us'] = results['triggered']['median'] / args.lookups * 1e6
+
+    def linear_scan():
+        # Scan every alert for a handful of price changes
+        for product_id, price in lookups[:10]:
+            [alert_id for alert_id, alert_product, target in rows if alert_product == product_id and target >= price]
+
+    results['linear_scan'] = common.measure(linear_scan, repeat=args.repeat, warmup=0)
+    results['linear_scan']['per_lookup_us'] = results['linear_scan']['median'] / 10 * 1e6
+
+    next_id = [args.alerts + 1]
+
+    def add_remove():
+        for product_id, price in lookups[:1000]:
+            alert_id = next_id[0]
+            next_id[0] += 1
+            index.add(alert_id, product_id, price)
+            index.remove(alert_id)
+
+    results['add_remove'] = common.measure(add_remove, repeat=args.repeat)
+    results['add_remove']['per_pair_us'] = results['add_remove']['median'] / 1000 * 1e6
+
+    app = common.load_app()
+    from alert_index import rebuild_alert_index
+    from database import db
+    with app.app_context():
+        common.seed_database(db, users=10, products_per_user=args.db_products // 10,
+                             history_per_product=0, alerts_per_product=5)
+        start = time.perf_counter()
+        loaded = rebuild_alert_index()
+        results['rebuild_from_db'] = {'seconds': time.perf_counter() - start, 'alerts': loaded}
+
+    common.write_results('alert_index', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
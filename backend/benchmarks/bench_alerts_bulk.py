@@ -0,0 +1,90 @@
+"""Bulk alert creation and batched target suggestions vs one request / one query per product.
+
+With --series-cache the batched suggestions read the memory-mapped series
+cache instead of the database, as deployments with SERIES_CACHE_DIR do.
+
+    python benchmarks/bench_alerts_bulk.py --products 500 --history-per-product 200 [--series-cache]
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Triggered alerts are queued for a digest that is never flushed, so no mail is attempted
+os.environ.setdefault('ALERT_DIGEST', '1')
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=500, help='Products of the user creating alerts (at most 500)')
+    parser.add_argument('--history-per-product', type=int, default=200, help='History points, 3 hours apart')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--series-cache', action='store_true', help='Serve history from a series cache in a temp dir')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    if args.series_cache:
+        os.environ['SERIES_CACHE_DIR'] = tempfile.mkdtemp(prefix='pricepulse-series-')
+
+    app = common.load_app()
+
+    import numpy as np
+    from analytics import suggest_target_prices
+    from database import db
+    from history_store import load_history
+    from models import Product
+
+    with app.app_context():
+        seeded = common.seed_database(
+            db, users=1, products_per_user=args.products, history_per_product=args.history_per_product,
+            alerts_per_product=0, history_interval=timedelta(hours=3)
+        )
+        # Fixed targets below the current price; suggested ones may trigger
+        targets = {product_id: round(price * 0.5, 2) for product_id, price in db.session.query(Product.id, Product.current_price)}
+
+    client = app.test_client()
+    headers = common.auth_header(app, seeded['user_ids'][0])
+    product_ids = seeded['product_ids']
+
+    def one_per_request():
+        for product_id in product_ids:
+            client.post('/api/alerts', headers=headers, json={'product_id': product_id, 'target_price': targets[product_id]})
+
+    def bulk(target):
+        def run():
+            items = [{'product_id': product_id, 'target_price': target or targets[product_id]} for product_id in product_ids]
+            response = client.post('/api/alerts/bulk', headers=headers, json={'alerts': items})
+            assert response.status_code == 200, response.get_json()
+        return run
+
+    results = {
+        'alerts_per_run': len(product_ids),
+        'create_one_per_request': common.measure(one_per_request, repeat=args.repeat, warmup=0),
+        'create_bulk': common.measure(bulk(None), repeat=args.repeat, warmup=0),
+        'create_bulk_suggested_p10': common.measure(bulk('p10_30d'), repeat=args.repeat, warmup=0)
+    }
+
+    def per_product_suggestions():
+        # One history query and one percentile pass per product
+        cutoff = datetime.utcnow() - timedelta(days=30)
+        suggestions = {}
+        for product_id in product_ids:
+            prices = np.array([price for _, _, price, _ in load_history([product_id], cutoff)])
+            if len(prices):
+                suggestions[product_id] = {
+                    'low_30d': prices.min(), 'p10_30d': np.percentile(prices, 10),
+                    'p25_30d': np.percentile(prices, 25), 'median_30d': np.median(prices)
+                }
+        return suggestions
+
+    with app.app_context():
+        results['suggestions_per_product'] = common.measure(per_product_suggestions, repeat=args.repeat)
+        results['suggestions_batched'] = common.measure(lambda: suggest_target_prices(product_ids), repeat=args.repeat)
+
+    common.write_results('alerts_bulk', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
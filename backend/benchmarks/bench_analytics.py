@@ -0,0 +1,73 @@
+"""Vectorized price analytics over PriceHistory.
+
+Times compute_price_stats on in-memory arrays for 10k products x 1 year of
+history, plus the end-to-end /api/products/analytics request (bulk load +
+compute) for one user on a seeded SQLite database.
+
+    python benchmarks/bench_analytics.py --products 10000 --points-per-day 1
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import common
+
+
+def synthetic_history(products, days, points_per_day, seed=3):
+    rng = np.random.default_rng(seed)
+    per_product = days * points_per_day
+    now = np.datetime64(datetime.utcnow(), 's')
+    step = np.timedelta64(int(86400 / points_per_day), 's')
+
+    pids = np.repeat(np.arange(products, dtype=np.int64), per_product)
+    offsets = np.tile(np.arange(per_product, 0, -1), products)
+    timestamps = now - offsets * step
+    start_prices = rng.uniform(200, 80000, products)
+    walk = np.exp(np.cumsum(rng.normal(0, 0.01, (products, per_product)), axis=1))
+    prices = (start_prices[:, None] * walk).ravel()
+    return pids, timestamps, prices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--points-per-day', type=int, default=1)
+    parser.add_argument('--endpoint-products', type=int, default=500, help='Products of the user hitting the endpoint')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    from analytics import compute_price_stats
+    from database import db
+
+    pids, timestamps, prices = synthetic_history(args.products, args.days, args.points_per_day)
+    results = {}
+    results['compute_price_stats'] = common.measure(
+        lambda: compute_price_stats(pids, timestamps, prices), repeat=args.repeat
+    )
+    results['compute_price_stats']['rows'] = int(len(prices))
+
+    with app.app_context():
+        seeded = common.seed_database(
+            db, users=1, products_per_user=args.endpoint_products,
+            history_per_product=args.days * args.points_per_day, alerts_per_product=0,
+            history_interval=timedelta(days=1) / args.points_per_day
+        )
+
+    client = app.test_client()
+    headers = common.auth_header(app, seeded['user_ids'][0])
+    results['analytics_endpoint'] = common.measure(
+        lambda: client.get('/api/products/analytics', headers=headers), repeat=args.repeat
+    )
+    results['analytics_endpoint']['products'] = args.endpoint_products
+    results['analytics_endpoint']['rows'] = args.endpoint_products * args.days * args.points_per_day
+
+    common.write_results('analytics', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Core backend benchmarks.
+
+Seeds a throwaway SQLite database, serves the saved Amazon page from a local
+stub server and times the refresh cycle, alert checks, the product list and
+history endpoints and the LLM pattern extractor.
+
+    python benchmarks/bench_backend.py --users 10 --products-per-user 20 --output before.json
+"""
+import argparse
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--products-per-user', type=int, default=20)
+    parser.add_argument('--history-per-product', type=int, default=500)
+    parser.add_argument('--alerts-per-product', type=int, default=1)
+    parser.add_argument('--page-kb', type=int, default=400, help='Pad the stub product page to roughly this size')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    import email_service
+    from database import db
+    from llm_service import LLMService
+    from models import Product
+
+    # Never talk to a real SMTP server; failed sends keep alerts active so
+    # every repetition does the same work
+    email_service.send_email_alert = lambda *a, **k: False
+
+    results = {}
+    with app.app_context():
+        seeded = common.seed_database(
+            db,
+            users=args.users,
+            products_per_user=args.products_per_user,
+            history_per_product=args.history_per_product,
+            alerts_per_product=args.alerts_per_product
+        )
+
+        with common.StubAmazonServer(page_kb=args.page_kb) as stub:
+            common.redirect_scraper_to(stub.base_url)
+            from scraper import update_all_products
+
+            def refresh_cold():
+                # Clear fingerprints so every page goes through the full parse
+                Product.query.update({Product.page_fingerprint: None})
+                db.session.commit()
+                update_all_products()
+
+            results['update_all_products'] = common.measure(refresh_cold, repeat=args.repeat)
+            results['update_all_products_unchanged'] = common.measure(update_all_products, repeat=args.repeat)
+
+        results['check_price_alerts'] = common.measure(email_service.check_price_alerts, repeat=args.repeat)
+
+        names = [name for name, in db.session.query(Product.name).all()]
+        llm_service = LLMService()
+        results['llm_pattern_extractor'] = common.measure(
+            lambda: [llm_service._extract_metadata_with_patterns(name) for name in names],
+            repeat=args.repeat
+        )
+        results['llm_pattern_extractor']['items'] = len(names)
+
+    client = app.test_client()
+    user_id = seeded['user_ids'][0]
+    headers = common.auth_header(app, user_id)
+    product_id = seeded['product_ids'][0]
+
+    results['get_products'] = common.measure(
+        lambda: client.get('/api/products', headers=headers), repeat=args.repeat
+    )
+    results['get_products_page'] = common.measure(
+        lambda: client.get('/api/products?fields=id,name,image,current_price,in_stock&limit=50', headers=headers),
+        repeat=args.repeat
+    )
+    results['get_price_history'] = common.measure(
+        lambda: client.get(f"/api/products/{product_id}/history?days=365", headers=headers), repeat=args.repeat
+    )
+
+    user_product_ids = ','.join(str(pid) for pid in seeded['product_ids'][:args.products_per_user])
+    results['get_price_history_batch'] = common.measure(
+        lambda: client.get(f"/api/products/history?ids={user_product_ids}&days=365", headers=headers),
+        repeat=args.repeat
+    )
+    results['get_price_history_batch']['products'] = args.products_per_user
+
+    common.write_results('backend', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""API read latency while a refresh cycle writes in the background.
+
+Runs update_all_products in a thread, as the scheduler does, while reader
+threads hit the product, history and deals endpoints, and reports read
+latency and failures. Compare journal modes in separate runs:
+
+    python benchmarks/bench_contention.py --journal-mode wal
+    python benchmarks/bench_contention.py --journal-mode delete
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--journal-mode', default='wal', help='SQLite journal mode (wal, delete, truncate...)')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--products-per-user', type=int, default=20)
+    parser.add_argument('--history-per-product', type=int, default=500)
+    parser.add_argument('--alerts-per-product', type=int, default=1)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--cycles', type=int, default=1)
+    parser.add_argument('--page-kb', type=int, default=100)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    # Read by the database module at import time
+    os.environ['SQLITE_JOURNAL_MODE'] = args.journal_mode
+
+    import common
+
+    app = common.load_app()
+
+    import email_service
+    from database import db
+    from models import Product
+
+    email_service.send_email_alert = lambda *a, **k: False
+
+    with app.app_context():
+        seeded = common.seed_database(
+            db,
+            users=args.users,
+            products_per_user=args.products_per_user,
+            history_per_product=args.history_per_product,
+            alerts_per_product=args.alerts_per_product
+        )
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    done = threading.Event()
+    cycle_timings = []
+    cycle_errors = []
+
+    def refresh_cycles():
+        from scraper import update_all_products
+        try:
+            with app.app_context():
+                for _ in range(args.cycles):
+                    # Force full parses so every product is written
+                    Product.query.update({Product.page_fingerprint: None})
+                    db.session.commit()
+                    start = time.perf_counter()
+                    update_all_products()
+                    cycle_timings.append(time.perf_counter() - start)
+        except Exception as e:
+            cycle_errors.append(repr(e))
+        finally:
+            done.set()
+
+    def reader(index, latencies, failures):
+        client = app.test_client()
+        user_id = seeded['user_ids'][index % len(seeded['user_ids'])]
+        headers = common.auth_header(app, user_id)
+        first_product = (user_id - 1) * args.products_per_user + 1
+        urls = [
+            '/api/products',
+            f"/api/products/{first_product}/history?days=30",
+            '/api/deals?limit=20'
+        ]
+        i = 0
+        while not done.is_set():
+            url = urls[i % len(urls)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status = client.get(url, headers=headers).status_code
+            except Exception as e:
+                failures.append(repr(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                failures.append(status)
+
+    latencies = [[] for _ in range(args.readers)]
+    failures = [[] for _ in range(args.readers)]
+
+    with common.StubAmazonServer(page_kb=args.page_kb) as stub:
+        common.redirect_scraper_to(stub.base_url)
+        threads = [threading.Thread(target=reader, args=(i, latencies[i], failures[i])) for i in range(args.readers)]
+        writer = threading.Thread(target=refresh_cycles)
+        for thread in threads:
+            thread.start()
+        writer.start()
+        writer.join()
+        for thread in threads:
+            thread.join()
+
+    reads = sorted(latency for per_reader in latencies for latency in per_reader)
+    read_failures = [failure for per_reader in failures for failure in per_reader]
+    results = {
+        'journal_mode': journal_mode,
+        'refresh_cycle': {
+            'runs': len(cycle_timings),
+            'median': statistics.median(cycle_timings) if cycle_timings else None,
+            'errors': cycle_errors
+        },
+        'reads': {
+            'count': len(reads),
+            'failed': len(read_failures),
+            'failures': sorted({str(failure) for failure in read_failures})[:10]
+        }
+    }
+    if reads:
+        results['reads'].update({
+            'median': statistics.median(reads),
+            'p95': reads[int(0.95 * (len(reads) - 1))],
+            'p99': reads[int(0.99 * (len(reads) - 1))],
+            'max': reads[-1]
+        })
+
+    common.write_results('contention', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Catalog-wide deal detection.
+
+Seeds a catalog of listings with current and baseline prices and times
+update_deals: the first run fills the top-K table, later runs rescore the
+whole catalog and apply only the differences.
+
+    python benchmarks/bench_deals.py --listings 1000000
+"""
+import argparse
+import random
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=1000000)
+    parser.add_argument('--top-k', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    from database import db
+    from deals import update_deals
+    from models import Product, User
+
+    rng = random.Random(11)
+    results = {}
+    with app.app_context():
+        db.session.add(User(id=1, email='bench@example.com', password_hash='x'))
+        db.session.commit()
+        insert = Product.__table__.insert()
+        batch = []
+        for product_id in range(1, args.listings + 1):
+            baseline = rng.uniform(200, 80000)
+            batch.append({
+                'id': product_id,
+                'user_id': 1,
+                'url': f"https://www.amazon.in/dp/B{product_id:09d}",
+                'name': f"Listing {product_id}",
+                'current_price': round(baseline * rng.uniform(0.6, 1.1), 2),
+                'baseline_price': baseline,
+                'in_stock': True
+            })
+            if len(batch) == 100000:
+                db.session.execute(insert, batch)
+                batch = []
+        if batch:
+            db.session.execute(insert, batch)
+        db.session.commit()
+
+        summary = {}
+        results['first_run'] = common.measure(lambda: summary.update(update_deals(top_k=args.top_k)), repeat=1, warmup=0)
+        results['first_run']['summary'] = dict(summary)
+
+        def reprice_and_rescore():
+            # Move a slice of prices, as a refresh cycle would, then rescore
+            offset = rng.randrange(args.listings - 1000)
+            Product.query.filter(Product.id.between(offset, offset + 1000)).update(
+                {Product.current_price: Product.current_price * 0.8}, synchronize_session=False
+            )
+            db.session.commit()
+            summary.update(update_deals(top_k=args.top_k))
+
+        results['incremental_run'] = common.measure(reprice_and_rescore, repeat=args.repeat, warmup=0)
+        results['incremental_run']['summary'] = dict(summary)
+
+    client = app.test_client()
+    headers = common.auth_header(app, 1)
+    results['deals_endpoint'] = common.measure(
+        lambda: client.get('/api/deals?limit=50', headers=headers), repeat=20
+    )
+
+    common.write_results('deals', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Bulk price history export: streamed CSV/NDJSON/Parquet vs fetching /history product by product.
+
+Reports time, size and peak Python memory (tracemalloc) of each; the
+streamed peaks should stay flat as --history-per-product grows.
+
+    python benchmarks/bench_export.py --products 200 --history-per-product 2000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import timedelta
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--history-per-product', type=int, default=2000)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    from history_export import available_formats
+    from database import db
+
+    with app.app_context():
+        seeded = common.seed_database(
+            db, users=1, products_per_user=args.products, history_per_product=args.history_per_product,
+            alerts_per_product=0, history_interval=timedelta(minutes=30)
+        )
+
+    client = app.test_client()
+    headers = common.auth_header(app, seeded['user_ids'][0])
+    days = args.history_per_product // 48 + 2
+
+    def streamed(fmt):
+        def run():
+            response = client.get(f"/api/export/history?format={fmt}", headers=headers)
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+            return size
+        return run
+
+    def per_product():
+        # What a bulk export costs without the endpoint
+        return sum(
+            len(client.get(f"/api/products/{product_id}/history?days={days}", headers=headers).get_data())
+            for product_id in seeded['product_ids']
+        )
+
+    cases = {f"stream_{fmt}": streamed(fmt) for fmt in available_formats()}
+    cases['per_product_history'] = per_product
+
+    rows = args.products * args.history_per_product
+    results = {'rows': rows}
+    for name, run in cases.items():
+        start = time.perf_counter()
+        size = run()
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            'seconds': seconds,
+            'rows_per_second': rows / seconds,
+            'bytes': size,
+            'peak_memory_mb': peak / 2 ** 20
+        }
+
+    common.write_results('export', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
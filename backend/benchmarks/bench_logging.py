@@ -0,0 +1,89 @@
+"""Request latency with debug logging on versus off.
+
+Times a comparison precompute for one product - the chattiest path, logging
+per query, per search result and per dedupe - with Google CSE responses stubbed.
+Log output goes to a temporary file.
+
+    python benchmarks/bench_logging.py --repeat 200 --output logging.json
+"""
+import argparse
+import logging
+import os
+import tempfile
+import types
+
+import common
+
+os.environ.setdefault('GOOGLE_API_KEY', 'benchmark-key')
+os.environ.setdefault('GOOGLE_CSE_ID', 'benchmark-cse')
+
+
+def fake_cse_response(items):
+    payload = {'items': [{
+        'title': f"Samsung Galaxy M14 5G variant {i} - ₹{13000 + i * 37:,}",
+        'snippet': 'In stock. Free delivery.' if i % 2 else 'Check the latest offers on this phone.',
+        'link': f"https://www.flipkart.com/item/{i}"
+    } for i in range(items)]}
+    return types.SimpleNamespace(
+        status_code=200,
+        json=lambda: payload,
+        raise_for_status=lambda: None
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10, help='Search results returned per CSE query')
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    import llm_service
+    from comparisons import precompute_comparisons
+    from database import db
+    from models import Comparison
+    from logging_config import configure_logging, JSONFormatter
+
+    llm_service.requests = types.SimpleNamespace(
+        get=lambda *a, **k: fake_cse_response(args.items),
+        post=lambda *a, **k: types.SimpleNamespace(status_code=503)
+    )
+
+    with app.app_context():
+        common.seed_database(db, users=1, products_per_user=1, history_per_product=1)
+
+    def recompute():
+        with app.app_context():
+            Comparison.query.delete()
+            precompute_comparisons(daily_queries=10 ** 9)
+
+    log_path = os.path.join(tempfile.mkdtemp(prefix='pricepulse-bench-logs-'), 'bench.log')
+    results = {}
+    with open(log_path, 'a', encoding='utf-8') as log_file:
+        modes = (
+            ('debug_off', 'INFO', 1.0),
+            ('debug_on', 'DEBUG', 1.0),
+            ('debug_on_sampled_10pct', 'DEBUG', 0.1)
+        )
+        for name, level, sample_rate in modes:
+            configure_logging(level=level, fmt='json', debug_sample_rate=sample_rate, stream=log_file)
+            results[name] = common.measure(recompute, repeat=args.repeat)
+
+        # Reference point: the same debug output written synchronously on the request thread
+        root = logging.getLogger()
+        saved_handlers = root.handlers[:]
+        sync_handler = logging.StreamHandler(log_file)
+        sync_handler.setFormatter(JSONFormatter())
+        root.handlers = [sync_handler]
+        root.setLevel(logging.DEBUG)
+        results['debug_on_synchronous_handler'] = common.measure(recompute, repeat=args.repeat)
+        root.handlers = saved_handlers
+        configure_logging()
+
+    common.write_results('logging', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
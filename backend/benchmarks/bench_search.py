@@ -0,0 +1,52 @@
+"""Product search: full-text index vs substring scan vs filtering the full list client-side.
+
+    python benchmarks/bench_search.py --products 20000 --query "galaxy m1"
+"""
+import argparse
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=20000, help='Products of the searching user')
+    parser.add_argument('--query', default='galaxy m1')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    import search_index
+    from database import db
+
+    with app.app_context():
+        seeded = common.seed_database(db, users=1, products_per_user=args.products, history_per_product=0, alerts_per_product=0)
+
+    client = app.test_client()
+    headers = common.auth_header(app, seeded['user_ids'][0])
+    search_url = f"/api/products/search?q={args.query}&limit=20"
+    terms = args.query.lower().split()
+
+    def client_side_filter():
+        # What the frontend does without the endpoint
+        products = client.get('/api/products', headers=headers).get_json()
+        return [p for p in products if all(term in (p['name'] or '').lower() for term in terms)][:20]
+
+    results = {
+        'first_page_items': len(client.get(search_url, headers=headers).get_json()['items']),
+        'fts': common.measure(lambda: client.get(search_url, headers=headers), repeat=args.repeat),
+        'full_list_client_filter': common.measure(client_side_filter, repeat=args.repeat)
+    }
+
+    # The fallback used when no index exists
+    has_index = search_index._has_index
+    search_index._has_index = lambda: False
+    results['substring_scan'] = common.measure(lambda: client.get(search_url, headers=headers), repeat=args.repeat)
+    search_index._has_index = has_index
+
+    common.write_results('search', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Payload size and latency of the history endpoint per serializer and encoding.
+
+    python benchmarks/bench_serialization.py --history-per-product 17520
+"""
+import argparse
+from datetime import timedelta
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history-per-product', type=int, default=17520, help='Default: one year at 30 minute intervals')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    import compression
+    from database import db
+    from serialization import init_json
+
+    with app.app_context():
+        seeded = common.seed_database(
+            db, users=1, products_per_user=1, history_per_product=args.history_per_product,
+            alerts_per_product=0, history_interval=timedelta(days=365) / args.history_per_product
+        )
+
+    client = app.test_client()
+    headers = common.auth_header(app, seeded['user_ids'][0])
+    url = f"/api/products/{seeded['product_ids'][0]}/history?days=366"
+
+    encodings = ['identity', 'gzip']
+    if compression.brotli is not None:
+        encodings.append('br')
+
+    results = {}
+    for serializer in ('json', 'orjson'):
+        provider = init_json(app, serializer)
+        for encoding in encodings:
+            request_headers = dict(headers, **{'Accept-Encoding': encoding})
+            response = client.get(url, headers=request_headers)
+            name = f"{serializer}_{encoding}"
+            results[name] = common.measure(lambda: client.get(url, headers=request_headers), repeat=args.repeat)
+            results[name]['provider'] = type(provider).__name__
+            results[name]['bytes'] = len(response.get_data())
+    init_json(app)
+
+    common.write_results('serialization', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""History and analytics endpoints served from the database vs the shared series cache.
+
+    python benchmarks/bench_series_cache.py --products 200 --history-per-product 17520
+"""
+import argparse
+import os
+import tempfile
+from datetime import timedelta
+
+os.environ.setdefault('SERIES_CACHE_DIR', tempfile.mkdtemp(prefix='pricepulse-series-'))
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--history-per-product', type=int, default=17520, help='Default: one year at 30 minute intervals')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    import series_cache
+    from database import db
+
+    with app.app_context():
+        seeded = common.seed_database(
+            db, users=1, products_per_user=args.products, history_per_product=args.history_per_product,
+            alerts_per_product=0, history_interval=timedelta(days=365) / args.history_per_product
+        )
+        cache = series_cache.get_series_cache()
+        results = {'rebuild': common.measure(cache.rebuild, repeat=1, warmup=0)}
+
+    client = app.test_client()
+    headers = common.auth_header(app, seeded['user_ids'][0])
+    batch_ids = ','.join(str(pid) for pid in seeded['product_ids'][:50])
+    requests = {
+        'history_30d': f"/api/products/{seeded['product_ids'][0]}/history?days=30",
+        'history_365d': f"/api/products/{seeded['product_ids'][0]}/history?days=365",
+        'batch_history_50x30d': f"/api/products/history?ids={batch_ids}&days=30",
+        'analytics': '/api/products/analytics'
+    }
+
+    for source in ('database', 'cache'):
+        # The endpoints fall back to the database when no cache is configured
+        series_cache._series_cache = cache if source == 'cache' else None
+        series_cache.SERIES_CONFIG['SERIES_CACHE_DIR'] = cache.root if source == 'cache' else None
+        for name, url in requests.items():
+            results[f"{name}_{source}"] = common.measure(lambda: client.get(url, headers=headers), repeat=args.repeat)
+
+    common.write_results('series_cache', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Session expiry and per-request token checks with a large session table.
+
+Compares the old cleanup (load every expired session, flip them one by one)
+with a single bulk UPDATE, and the old per-request lookup (session row plus
+user) with resolve_session cold and warm.
+
+    python benchmarks/bench_sessions.py --sessions 1000000
+"""
+import argparse
+import random
+import secrets
+import time
+from datetime import datetime, timedelta
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--expired-fraction', type=float, default=0.5)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = common.load_app()
+
+    import auth
+    from database import db
+    from models import UserSession
+
+    rng = random.Random(42)
+    results = {}
+
+    with app.app_context():
+        common.seed_database(db, users=args.users, products_per_user=0, history_per_product=0, alerts_per_product=0)
+
+        now = datetime.utcnow()
+        tokens = []
+        start = time.perf_counter()
+        for batch_start in range(0, args.sessions, 50000):
+            rows = []
+            for _ in range(batch_start, min(batch_start + 50000, args.sessions)):
+                token = secrets.token_urlsafe(32)
+                expired = rng.random() < args.expired_fraction
+                rows.append({
+                    'user_id': rng.randint(1, args.users),
+                    'session_token': token,
+                    'created_at': now - timedelta(days=31),
+                    'expires_at': now - timedelta(days=1) if expired else now + timedelta(days=29),
+                    'is_active': True
+                })
+                if not expired:
+                    tokens.append(token)
+            db.session.execute(db.insert(UserSession), rows)
+        db.session.commit()
+        results['insert_seconds'] = time.perf_counter() - start
+
+        def legacy_cleanup():
+            expired_sessions = UserSession.query.filter(
+                UserSession.expires_at < datetime.utcnow(),
+                UserSession.is_active == True
+            ).all()
+            for session in expired_sessions:
+                session.is_active = False
+            db.session.commit()
+            return len(expired_sessions)
+
+        def reactivate():
+            UserSession.query.update({UserSession.is_active: True}, synchronize_session=False)
+            db.session.commit()
+            db.session.expunge_all()
+
+        for name, cleanup in (('cleanup_legacy', legacy_cleanup), ('cleanup_bulk_update', auth.cleanup_expired_sessions)):
+            start = time.perf_counter()
+            count = cleanup()
+            results[name] = {'seconds': time.perf_counter() - start, 'sessions': count}
+            reactivate()
+
+        sample = rng.sample(tokens, min(args.lookups, len(tokens)))
+
+        def legacy_lookup(token):
+            session = UserSession.query.filter_by(session_token=token, is_active=True).first()
+            if not session or session.is_expired():
+                return None
+            return session.user
+
+        def per_lookup(name, lookup):
+            start = time.perf_counter()
+            for token in sample:
+                lookup(token)
+            elapsed = time.perf_counter() - start
+            results[name] = {'lookups': len(sample), 'per_lookup_us': elapsed / len(sample) * 1e6}
+
+        per_lookup('lookup_legacy', legacy_lookup)
+        db.session.expunge_all()
+        auth.session_cache.clear()
+        per_lookup('lookup_resolve_cold', auth.resolve_session)
+        per_lookup('lookup_resolve_cached', auth.resolve_session)
+
+    common.write_results('sessions', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Cold start: time from importing the backend to its first responses.
+
+Every run is a fresh interpreter. It times importing main, creating the
+app and serving the first request (/api/health) and the first database
+request (/api/products). Point --backend-dir at another checkout to compare
+commits, including ones from before the app factory:
+
+    git worktree add /tmp/pricepulse-old HEAD~1
+    python benchmarks/bench_startup.py --backend-dir /tmp/pricepulse-old/backend
+    python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import common
+
+# Both layouts are supported: create_app() and a module-level app that sets
+# itself up (and starts its scheduler) on import
+SETUP = r'''
+import main
+app = main.create_app() if hasattr(main, 'create_app') else main.app
+with app.app_context():
+    if hasattr(main, 'init_schema'):
+        main.init_schema()
+    from database import db
+    from models import User
+    db.session.add(User(id=1, email='startup@example.com', name='Startup', password_hash='x'))
+    db.session.commit()
+scheduler = getattr(main, 'scheduler', None)
+if scheduler is not None and scheduler.running:
+    scheduler.shutdown(wait=False)
+'''
+
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app() if hasattr(main, 'create_app') else main.app
+created = time.perf_counter()
+client = app.test_client()
+health = client.get('/api/health').status_code
+first_request = time.perf_counter()
+import jwt
+token = jwt.encode({'user_id': 1}, app.config['SECRET_KEY'])
+products = client.get('/api/products', headers={'Authorization': 'Bearer ' + token}).status_code
+first_db_request = time.perf_counter()
+scheduler = getattr(main, 'scheduler', None)
+if scheduler is not None and scheduler.running:
+    scheduler.shutdown(wait=False)
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': first_request - created,
+    'first_db_request': first_db_request - first_request,
+    'to_first_request': first_request - start,
+    'to_first_db_request': first_db_request - start,
+    'status': [health, products],
+    'modules': len(sys.modules)
+}))
+'''
+
+
+def run_python(code, backend_dir):
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=backend_dir, env=os.environ.copy(),
+        check=True, capture_output=True, text=True
+    ).stdout
+    return output.strip().splitlines()[-1] if output.strip() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend-dir', default=common.BACKEND_DIR, help='Backend checkout to start (default: this one)')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    run_python(SETUP, args.backend_dir)
+
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = json.loads(run_python(PROBE, args.backend_dir))
+        result['process'] = time.perf_counter() - start
+        runs.append(result)
+
+    results = {'status': runs[0]['status'], 'modules': runs[0]['modules']}
+    for phase in ('import', 'create_app', 'first_request', 'first_db_request', 'to_first_request', 'to_first_db_request', 'process'):
+        timings = sorted(run[phase] for run in runs)
+        results[phase] = {'median': statistics.median(timings), 'min': timings[0], 'max': timings[-1]}
+
+    common.write_results('startup', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Webhook alert delivery throughput against a local HTTP sink.
+
+The sink runs in its own process and counts the events it receives;
+--sink-latency slows every response down and --fail-rate answers some
+requests with 503 to exercise retries.
+Times the caller's side of submit() (what the scheduler thread pays), the
+dispatcher's delivery rate, serial one-POST-per-event delivery for
+comparison, and a full alert sweep with the webhook channel.
+
+    python benchmarks/bench_webhooks.py --events 50000 --sink-latency 0.02 --fail-rate 0.05
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def run_sink(port_value, events_value, requests_value, latency, fail_rate):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so pooled connections are reused
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            if latency:
+                time.sleep(latency)
+            if random.random() < fail_rate:
+                status = 503
+            else:
+                status = 200
+                count = len(json.loads(body)['events'])
+                with events_value.get_lock():
+                    events_value.value += count
+            with requests_value.get_lock():
+                requests_value.value += 1
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    port_value.value = server.server_address[1]
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--serial-events', type=int, default=1000, help='Events sent one POST at a time for comparison')
+    parser.add_argument('--alerts', type=int, default=5000, help='Triggered alerts in the sweep through the alert pipeline')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--sink-latency', type=float, default=0.0, help='Seconds the sink takes to answer each POST')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of sink responses that are 503')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    port = multiprocessing.Value('i', 0)
+    received = multiprocessing.Value('q', 0)
+    requests_seen = multiprocessing.Value('q', 0)
+    sink = multiprocessing.Process(target=run_sink, args=(port, received, requests_seen, args.sink_latency, args.fail_rate), daemon=True)
+    sink.start()
+    while not port.value:
+        time.sleep(0.01)
+    sink_url = f"http://127.0.0.1:{port.value}/hook"
+
+    # The alert sweep below sends through the webhook channel only
+    os.environ['ALERT_CHANNELS'] = 'webhook'
+    os.environ['WEBHOOK_URL'] = sink_url
+    # The sink is on loopback, which is refused unless allowlisted
+    os.environ['WEBHOOK_ALLOWED_HOSTS'] = '127.0.0.1'
+    os.environ['WEBHOOK_BATCH_SIZE'] = str(args.batch_size)
+    os.environ['WEBHOOK_CONCURRENCY'] = str(args.concurrency)
+    os.environ['WEBHOOK_BACKOFF_BASE'] = '0.05'
+
+    import common
+    import requests
+    from metrics import WEBHOOK_EVENTS
+    from webhooks import WebhookDispatcher, get_webhook_dispatcher
+
+    def reset_sink():
+        received.value = 0
+        requests_seen.value = 0
+
+    results = {}
+    event = {'type': 'price_alert', 'alert_id': 1, 'product_id': 1, 'name': 'Benchmark Product', 'price': 999.0, 'target_price': 1000.0}
+
+    dispatcher = WebhookDispatcher(batch_size=args.batch_size, concurrency=args.concurrency, backoff_base=0.05)
+    # Warm up the loop thread and the connection pool
+    dispatcher.submit(sink_url, event)
+    dispatcher.flush()
+    reset_sink()
+    retried_before = WEBHOOK_EVENTS.value(result='retried')
+    failed_before = WEBHOOK_EVENTS.value(result='failed')
+
+    start = time.perf_counter()
+    for alert_id in range(args.events):
+        dispatcher.submit(sink_url, dict(event, alert_id=alert_id))
+    submitted = time.perf_counter() - start
+    dispatcher.flush()
+    delivered = time.perf_counter() - start
+    dispatcher.close()
+    results['dispatcher'] = {
+        'events': args.events,
+        'submit_us_per_event': submitted / args.events * 1e6,
+        'seconds': delivered,
+        'events_per_second': received.value / delivered,
+        'received': received.value,
+        'requests': requests_seen.value,
+        'retried_events': WEBHOOK_EVENTS.value(result='retried') - retried_before,
+        'failed_events': WEBHOOK_EVENTS.value(result='failed') - failed_before
+    }
+
+    # One blocking POST per event, the way alert emails go out
+    reset_sink()
+    session = requests.Session()
+    start = time.perf_counter()
+    for alert_id in range(args.serial_events):
+        session.post(sink_url, json={'events': [dict(event, alert_id=alert_id)]}, timeout=10)
+    elapsed = time.perf_counter() - start
+    results['serial_post_per_event'] = {
+        'events': args.serial_events,
+        'seconds': elapsed,
+        'events_per_second': received.value / elapsed
+    }
+
+    # A scheduler sweep over triggered alerts, sent through the webhook channel
+    app = common.load_app()
+    from database import db
+    from email_service import check_price_alerts
+    from models import PriceAlert
+    with app.app_context():
+        common.seed_database(db, users=10, products_per_user=args.alerts // 10, history_per_product=0, alerts_per_product=1)
+        PriceAlert.query.update({PriceAlert.target_price: 10 ** 9}, synchronize_session=False)
+        db.session.commit()
+
+        reset_sink()
+        start = time.perf_counter()
+        check_price_alerts()
+        sweep = time.perf_counter() - start
+        get_webhook_dispatcher().flush()
+        delivered = time.perf_counter() - start
+        results['alert_sweep'] = {
+            'alerts': args.alerts,
+            'sweep_seconds': sweep,
+            'delivered_seconds': delivered,
+            'received': received.value,
+            'deactivated': PriceAlert.query.filter_by(is_active=False).count()
+        }
+
+    sink.terminate()
+    common.write_results('webhooks', vars(args), results, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
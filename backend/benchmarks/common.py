@@ -0,0 +1,238 @@
+"""Shared helpers for the backend benchmarks.
+
+Import this module before anything from the backend: it points the app at a
+throwaway SQLite database, removes the scraper's politeness delay and puts the
+backend directory on sys.path.
+"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+BENCH_DB_PATH = os.path.join(tempfile.mkdtemp(prefix='pricepulse-bench-'), 'bench.db')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{BENCH_DB_PATH}")
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+# No pacing against the local stub server
+os.environ.setdefault('SCRAPE_RATE_INITIAL', '1000000')
+os.environ.setdefault('SCRAPE_RATE_MAX', '1000000')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def load_app():
+    """Create the Flask app, without background jobs, and its schema"""
+    import main
+    app = main.create_app({'SCHEDULER_ENABLED': False})
+    with app.app_context():
+        main.init_schema()
+    return app
+
+
+def auth_header(app, user_id):
+    import jwt
+    token = jwt.encode({
+        'user_id': user_id,
+        'exp': datetime.utcnow() + timedelta(days=1)
+    }, app.config['SECRET_KEY'])
+    return {'Authorization': f"Bearer {token}"}
+
+
+def seed_database(db, users=10, products_per_user=50, history_per_product=200, alerts_per_product=1,
+                  history_interval=timedelta(minutes=30), seed=42):
+    """Bulk insert a reproducible data set and return the seeded ids"""
+    from history_store import record_prices
+    from models import User, Product, PriceAlert
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    db.session.bulk_insert_mappings(User, [{
+        'id': user_id,
+        'email': f"bench{user_id}@example.com",
+        'name': f"Bench User {user_id}",
+        'password_hash': 'x',
+        'created_at': now
+    } for user_id in range(1, users + 1)])
+
+    products = []
+    product_id = 0
+    for user_id in range(1, users + 1):
+        for _ in range(products_per_user):
+            product_id += 1
+            price = round(rng.uniform(200, 80000), 2)
+            products.append({
+                'id': product_id,
+                'user_id': user_id,
+                'url': f"https://www.amazon.in/dp/B{product_id:09d}",
+                'name': f"Benchmark Product {product_id} Samsung Galaxy M{product_id % 60} 5G 128GB",
+                'image': f"https://m.media-amazon.com/images/I/{product_id}.jpg",
+                'current_price': price,
+                'original_price': round(price * 1.3, 2),
+                'currency': '₹',
+                'description': 'Benchmark description. ' * 40,
+                'rating': round(rng.uniform(1, 5), 1),
+                'in_stock': True,
+                'last_updated': now
+            })
+    db.session.bulk_insert_mappings(Product, products)
+
+    # Insert history in chunks so large volumes don't build one giant list
+    interval = history_interval
+    chunk = []
+    for product in products:
+        price = product['current_price']
+        for i in range(history_per_product):
+            price = max(1.0, round(price * rng.uniform(0.97, 1.03), 2))
+            chunk.append({
+                'product_id': product['id'],
+                'price': price,
+                'timestamp': now - interval * (history_per_product - i)
+            })
+        if len(chunk) >= 50000:
+            record_prices(chunk)
+            chunk = []
+    if chunk:
+        record_prices(chunk)
+
+    db.session.bulk_insert_mappings(PriceAlert, [{
+        'user_id': product['user_id'],
+        'product_id': product['id'],
+        'target_price': round(product['current_price'] * rng.uniform(0.5, 0.95), 2),
+        'is_active': True,
+        'created_at': now
+    } for product in products for _ in range(alerts_per_product)])
+
+    db.session.commit()
+    return {
+        'user_ids': list(range(1, users + 1)),
+        'product_ids': [product['id'] for product in products]
+    }
+
+
+class StubAmazonServer:
+    """Serve the saved product page for every path on a local port"""
+
+    def __init__(self, page_kb=0, latency=0.0):
+        with open(os.path.join(FIXTURES_DIR, 'amazon_product.html'), 'rb') as f:
+            page = f.read()
+        if page_kb:
+            # Pad with inert markup so parse cost resembles a real ~1 MB page
+            filler = b'<div class="a-section"><span class="a-size-base">filler</span></div>\n'
+            page = page.replace(b'<!-- PADDING -->', filler * (page_kb * 1024 // len(filler)))
+        self.page = page
+        self.latency = latency
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(stub.page)))
+                self.end_headers()
+                self.wfile.write(stub.page)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _RedirectedRequests:
+    """Stand-in for the requests module that sends Amazon URLs to a stub server"""
+
+    def __init__(self, real_requests, base_url):
+        self._real = real_requests
+        self._base_url = base_url
+
+    def get(self, url, *args, **kwargs):
+        parts = urlsplit(url)
+        if 'amazon.' in parts.netloc:
+            url = f"{self._base_url}{parts.path}"
+        return self._real.get(url, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+def redirect_scraper_to(base_url):
+    """Route the scraper's page fetches to the stub server"""
+    import scraper
+    scraper.requests = _RedirectedRequests(scraper.requests, base_url)
+
+
+def measure(func, repeat=5, warmup=1):
+    """Run func repeatedly and return timing statistics in seconds"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'p95': timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        'max': timings[-1]
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name, params, results, output=None):
+    """Emit results as JSON so runs can be diffed across commits"""
+    report = {
+        'benchmark': name,
+        'commit': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': sys.version.split()[0],
+        'params': params,
+        'results': results
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    return report
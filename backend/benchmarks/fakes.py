@@ -0,0 +1,97 @@
+"""Fake Amazon, Google Custom Search and Hugging Face backends for load tests.
+
+The fakes subclass the real AmazonScraper, MultiPlatformSearcher and
+LLMService and only replace their network calls, so page parsing, result
+parsing and quota accounting still run. Each call sleeps for the configured
+latency (uniformly within +-50%) before serving a fixture. install_fakes()
+swaps them into the backend modules; the app imports these classes where it
+uses them, so everything created afterwards gets the fakes.
+"""
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from common import FIXTURES_DIR
+
+_calls = Counter()
+_calls_lock = threading.Lock()
+
+
+def _wait(service, latency):
+    with _calls_lock:
+        _calls[service] += 1
+    if latency:
+        time.sleep(latency * random.uniform(0.5, 1.5))
+
+
+def call_counts():
+    """Calls served by each fake backend so far"""
+    with _calls_lock:
+        return dict(_calls)
+
+
+def _search_fixture():
+    """Custom Search response shaped like the real API, with prices in the snippets"""
+    return {'items': [{
+        'title': f"Samsung Galaxy M{14 + i} 5G (128GB) - ₹{12999 + i * 1500:,}",
+        'snippet': f"Buy online at ₹{12999 + i * 1500:,}. In stock. Free delivery.",
+        'link': f"https://www.example.com/item/{i}"
+    } for i in range(5)]}
+
+
+def install_fakes(scrape_latency=0.5, search_latency=0.2, llm_latency=0.5):
+    """Replace the scraper, searcher and LLM classes in the backend modules with fakes"""
+    import llm_service
+    import scraper
+
+    with open(os.path.join(FIXTURES_DIR, 'amazon_product.html'), 'rb') as f:
+        page = f.read()
+    fingerprint = scraper.page_fingerprint(page)
+    search_results = _search_fixture()
+
+    class FakeAmazonScraper(scraper.AmazonScraper):
+        def scrape_product(self, url, previous_fingerprint=None):
+            if not self.is_valid_amazon_url(url):
+                return {'error': 'Invalid Amazon URL'}
+            normalized_url = self.normalize_url(url)
+            _wait('amazon', scrape_latency)
+            if previous_fingerprint == fingerprint:
+                return {'url': normalized_url, 'unchanged': True, 'fingerprint': fingerprint}
+
+            product_data = self.extract_product_data(page.decode('utf-8'), normalized_url)
+            # Distinct listings, so searches and comparisons see different products
+            asin = self.extract_asin(normalized_url) or normalized_url
+            product_data['name'] = f"{product_data['name']} {asin}"
+            if product_data['current_price']:
+                product_data['current_price'] = round(product_data['current_price'] * random.uniform(0.9, 1.1), 2)
+            product_data['fingerprint'] = fingerprint
+            return product_data
+
+        def probe(self, url):
+            _wait('amazon', scrape_latency)
+            return 200
+
+    class FakeMultiPlatformSearcher(llm_service.MultiPlatformSearcher):
+        def __init__(self):
+            super().__init__()
+            self.google_api_key = self.google_cse_id = 'fake'
+
+        def _search_platform(self, query, config):
+            self.queries_sent += 1
+            _wait('google_cse', search_latency)
+            return self._parse_results(search_results, config)
+
+    class FakeLLMService(llm_service.LLMService):
+        def __init__(self):
+            super().__init__()
+            self.hf_api_key = 'fake'
+
+        def _call_hf_api(self, prompt):
+            _wait('huggingface', llm_latency)
+            return {'generated_text': 'Samsung'}
+
+    scraper.AmazonScraper = FakeAmazonScraper
+    llm_service.MultiPlatformSearcher = FakeMultiPlatformSearcher
+    llm_service.LLMService = FakeLLMService
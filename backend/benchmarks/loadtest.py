@@ -0,0 +1,205 @@
+"""Load test: concurrent virtual users against the real app with faked Amazon, Google and Hugging Face.
+
+The app is served over HTTP by a threaded server in this process, with
+the fakes from fakes.py (configurable latency) in place of the network
+calls. Every virtual user registers, adds --initial-products products and
+then picks actions from --mix until --duration runs out. A background
+thread runs the comparison precompute job, so /compare turns from 202 to
+200 during the run. Latency percentiles and throughput are reported per
+endpoint.
+
+    python benchmarks/loadtest.py --users 20 --duration 30 --scrape-latency 0.8
+    python benchmarks/loadtest.py --mix list=60,history=30,compare=10
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+# Before the backend is imported: quiet request logs, and a search budget
+# that doesn't run out during the run
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('CSE_DAILY_QUERIES', '1000000')
+
+import common
+import fakes
+
+DEFAULT_MIX = 'list=40,history=25,compare=15,add=10,login=10'
+
+_product_numbers = itertools.count(1)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class VirtualUser:
+    """One simulated account driving the API over its own HTTP session"""
+
+    def __init__(self, base_url, number, rng):
+        import requests
+        self.http = requests.Session()
+        self.base_url = base_url
+        self.email = f"load{number}-{os.getpid()}@example.com"
+        self.rng = rng
+        self.product_ids = []
+        # endpoint -> latencies in seconds; endpoint -> Counter of statuses
+        self.latencies = {}
+        self.statuses = {}
+
+    def request(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=60, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, type(e).__name__
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        self.statuses.setdefault(endpoint, Counter())[status] += 1
+        return response if status in (200, 201, 202) else None
+
+    def register(self):
+        credentials = {'email': self.email, 'password': 'load-test', 'name': 'Load Test'}
+        response = self.request('POST /api/auth/register', 'POST', '/api/auth/register', json=credentials)
+        if response is not None:
+            self.http.headers['Authorization'] = f"Bearer {response.json()['token']}"
+        return response is not None
+
+    def login(self):
+        response = self.request('POST /api/auth/login', 'POST', '/api/auth/login',
+                                json={'email': self.email, 'password': 'load-test'})
+        if response is not None:
+            self.http.headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+    def add(self):
+        url = f"https://www.amazon.in/dp/L{next(_product_numbers):09d}"
+        response = self.request('POST /api/products', 'POST', '/api/products', json={'url': url})
+        if response is not None:
+            self.product_ids.append(response.json()['id'])
+
+    def list(self):
+        self.request('GET /api/products', 'GET', '/api/products')
+
+    def history(self):
+        if not self.product_ids:
+            return self.add()
+        product_id = self.rng.choice(self.product_ids)
+        self.request('GET /api/products/<id>/history', 'GET', f"/api/products/{product_id}/history?days=30")
+
+    def compare(self):
+        if not self.product_ids:
+            return self.add()
+        product_id = self.rng.choice(self.product_ids)
+        self.request('GET /api/products/<id>/compare', 'GET', f"/api/products/{product_id}/compare")
+
+    def run(self, mix, initial_products, deadline, think_time):
+        if not self.register():
+            return
+        for _ in range(initial_products):
+            self.add()
+        actions, weights = zip(*mix.items())
+        while time.perf_counter() < deadline:
+            getattr(self, self.rng.choices(actions, weights)[0])()
+            if think_time:
+                time.sleep(self.rng.expovariate(1 / think_time))
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        if action.strip() not in ('login', 'add', 'list', 'history', 'compare'):
+            raise argparse.ArgumentTypeError(f"Unknown action: {action}")
+        mix[action.strip()] = float(weight or 1)
+    return mix
+
+
+def run_precompute(app, stop, interval):
+    from comparisons import precompute_comparisons
+    while not stop.wait(interval):
+        with app.app_context():
+            precompute_comparisons()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run after the users start')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help=f"Action weights (default {DEFAULT_MIX})")
+    parser.add_argument('--initial-products', type=int, default=2, help='Products each user adds before the mix')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean pause between a user\'s actions (seconds)')
+    parser.add_argument('--scrape-latency', type=float, default=0.5, help='Fake Amazon page latency (seconds)')
+    parser.add_argument('--search-latency', type=float, default=0.2, help='Fake Custom Search latency per query (seconds)')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Fake Hugging Face latency (seconds)')
+    parser.add_argument('--precompute-interval', type=float, default=5, help='Seconds between comparison precompute runs')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+
+    app = common.load_app()
+    fakes.install_fakes(args.scrape_latency, args.search_latency, args.llm_latency)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    stop = threading.Event()
+    threading.Thread(target=run_precompute, args=(app, stop, args.precompute_interval), daemon=True).start()
+
+    users = [VirtualUser(base_url, number, random.Random(args.seed + number)) for number in range(args.users)]
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=user.run, args=(args.mix, args.initial_products, deadline, args.think_time))
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    server.shutdown()
+
+    latencies, statuses = {}, {}
+    for user in users:
+        for endpoint, values in user.latencies.items():
+            latencies.setdefault(endpoint, []).extend(values)
+        for endpoint, counts in user.statuses.items():
+            statuses.setdefault(endpoint, Counter()).update(counts)
+
+    endpoints = {}
+    for endpoint, values in sorted(latencies.items()):
+        values.sort()
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'throughput_rps': len(values) / elapsed,
+            'errors': sum(count for status, count in statuses[endpoint].items() if status not in (200, 201, 202)),
+            'status': {str(status): count for status, count in statuses[endpoint].items()},
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000
+        }
+
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    params = dict(vars(args), mix=args.mix)
+    common.write_results('loadtest', params, {
+        'elapsed_seconds': elapsed,
+        'requests': total,
+        'throughput_rps': total / elapsed,
+        'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+        'fake_backend_calls': fakes.call_counts(),
+        'endpoints': endpoints
+    }, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, update
+
+from database import db
+from models import Product, PriceAlert, Comparison, SearchQuotaUsage
+from metrics import SEARCH_QUOTA_REMAINING, COMPARISONS_COMPUTED
+
+logger = logging.getLogger(__name__)
+
+COMPARISON_CONFIG = {
+    # Custom Search queries the job may send per UTC day (the free tier allows 100)
+    'CSE_DAILY_QUERIES': int(os.getenv('CSE_DAILY_QUERIES', 90)),
+    # Comparisons older than this are recomputed and reported as stale
+    'COMPARISON_MAX_AGE_HOURS': float(os.getenv('COMPARISON_MAX_AGE_HOURS', 72)),
+    # Seconds between writes of the view counts collected by each process
+    'VIEW_FLUSH_INTERVAL': float(os.getenv('VIEW_FLUSH_INTERVAL', 60))
+}
+
+# Product id -> views counted in this process and not yet written
+_pending_views = {}
+_views_lock = threading.Lock()
+_view_flusher = None
+
+
+def is_stale(comparison, now=None):
+    max_age = timedelta(hours=COMPARISON_CONFIG['COMPARISON_MAX_AGE_HOURS'])
+    return (now or datetime.utcnow()) - comparison.computed_at > max_age
+
+
+def get_comparison(url):
+    """Stored comparison for a listing, or None if it has not been computed yet"""
+    return Comparison.query.filter_by(url=url).first()
+
+
+def record_view(product):
+    """Count a detail or comparison view of a product
+
+    Views are counted in memory and written in batches by a background
+    thread, so read requests never take the database's write lock.
+    """
+    global _view_flusher
+    with _views_lock:
+        _pending_views[product.id] = _pending_views.get(product.id, 0) + 1
+        if _view_flusher is None:
+            _view_flusher = threading.Thread(
+                target=_flush_views_periodically, args=(current_app._get_current_object(),),
+                name='view-flusher', daemon=True
+            )
+            _view_flusher.start()
+
+
+def flush_views():
+    """Add the views counted in this process to Product.view_count; returns the products updated"""
+    with _views_lock:
+        pending = dict(_pending_views)
+        _pending_views.clear()
+    if not pending:
+        return 0
+
+    table = Product.__table__
+    try:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('product_id'))
+            .values(view_count=table.c.view_count + bindparam('views')),
+            [{'product_id': product_id, 'views': views} for product_id, views in pending.items()]
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Keep the counts for the next attempt
+        with _views_lock:
+            for product_id, views in pending.items():
+                _pending_views[product_id] = _pending_views.get(product_id, 0) + views
+        raise
+    return len(pending)
+
+
+def _flush_views_periodically(app):
+    while True:
+        time.sleep(COMPARISON_CONFIG['VIEW_FLUSH_INTERVAL'])
+        try:
+            with app.app_context():
+                flush_views()
+        except Exception:
+            logger.exception('Could not save product views')
+
+
+def quota_used(day):
+    return db.session.query(SearchQuotaUsage.queries).filter_by(day=day).scalar() or 0
+
+
+def _record_quota(day, queries):
+    # Incremented in SQL so concurrent workers never lose each other's usage
+    updated = SearchQuotaUsage.query.filter_by(day=day).update(
+        {SearchQuotaUsage.queries: SearchQuotaUsage.queries + queries}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(SearchQuotaUsage(day=day, queries=queries))
+
+
+def comparison_candidates(now=None):
+    """Listings whose comparison is missing or stale, most important first
+
+    Returns (url, product_id) pairs, one per listing, ordered by whether any
+    tracker has an active alert on it, then by total views, then by how long
+    ago the comparison was computed (never computed first).
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=COMPARISON_CONFIG['COMPARISON_MAX_AGE_HOURS'])
+
+    alerted = db.exists().where(PriceAlert.product_id == Product.id, PriceAlert.is_active == True)
+    has_alert = db.func.max(db.case((alerted, 1), else_=0))
+    views = db.func.sum(Product.view_count)
+
+    rows = db.session.query(Product.url, db.func.min(Product.id)).outerjoin(
+        Comparison, Comparison.url == Product.url
+    ).filter(
+        Product.name.isnot(None),
+        Product.scrape_status != 'dead',
+        db.or_(Comparison.computed_at.is_(None), Comparison.computed_at < cutoff)
+    ).group_by(Product.url, Comparison.computed_at).order_by(
+        has_alert.desc(), views.desc(), Comparison.computed_at.asc().nullsfirst()
+    ).all()
+    return [(url, product_id) for url, product_id in rows]
+
+
+def precompute_comparisons(daily_queries=None, now=None):
+    """Spend what is left of today's search quota refreshing comparisons
+
+    Listings are handled in comparison_candidates order and the run stops at
+    the first one whose searches would not fit in the remaining quota, so a
+    small budget always goes to the most important listings. Every product
+    is committed together with its quota usage. Returns a summary dict.
+    """
+    from llm_service import LLMService, MultiPlatformSearcher
+
+    daily_queries = COMPARISON_CONFIG['CSE_DAILY_QUERIES'] if daily_queries is None else daily_queries
+    now = now or datetime.utcnow()
+    today = now.date()
+    start = time.perf_counter()
+
+    # Views counted by this process so far take part in the ranking
+    flush_views()
+
+    # Listings nobody tracks any more
+    Comparison.query.filter(~Comparison.url.in_(db.select(Product.url))).delete(synchronize_session=False)
+    db.session.commit()
+
+    searcher = MultiPlatformSearcher()
+    remaining = max(daily_queries - quota_used(today), 0)
+    summary = {'candidates': 0, 'computed': 0, 'queries': 0, 'remaining': remaining}
+    if not searcher.has_credentials():
+        logger.warning('Skipping comparison precompute: missing Google API credentials')
+        return summary
+
+    llm_service = LLMService()
+    candidates = comparison_candidates(now)
+    summary['candidates'] = len(candidates)
+
+    for url, product_id in candidates:
+        product = db.session.get(Product, product_id)
+        metadata = llm_service.extract_product_metadata(product.name, product.description or "")
+        if searcher.query_cost(metadata, product.name) > remaining:
+            break
+
+        sent, failed = searcher.queries_sent, searcher.queries_failed
+        alternatives = searcher.search_across_platforms(metadata, product.name)
+        used = searcher.queries_sent - sent
+        remaining -= used
+        _record_quota(today, used)
+
+        if used and searcher.queries_failed - failed == used:
+            # Every search failed (quota exhausted upstream, bad key, outage);
+            # keep the previous result and try again next run
+            db.session.commit()
+            logger.warning('All comparison searches failed, stopping', extra={'url': url})
+            break
+
+        comparison = get_comparison(url) or Comparison(url=url)
+        comparison.product_metadata = metadata
+        comparison.alternatives = alternatives
+        comparison.queries_used = used
+        comparison.computed_at = datetime.utcnow()
+        db.session.add(comparison)
+        db.session.commit()
+        COMPARISONS_COMPUTED.inc()
+        summary['computed'] += 1
+
+    summary['queries'] = summary['remaining'] - remaining
+    summary['remaining'] = remaining
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    SEARCH_QUOTA_REMAINING.set(remaining)
+    logger.info('Comparison precompute finished', extra=summary)
+    return summary
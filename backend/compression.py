@@ -0,0 +1,55 @@
+import gzip
+import os
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_CONFIG = {
+    'COMPRESSION_ENABLED': os.getenv('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    # Responses smaller than this are not worth the CPU
+    'COMPRESSION_MIN_SIZE': int(os.getenv('COMPRESSION_MIN_SIZE', 1024)),
+    'COMPRESSION_GZIP_LEVEL': int(os.getenv('COMPRESSION_GZIP_LEVEL', 6)),
+    'COMPRESSION_BROTLI_QUALITY': int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+}
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv', 'application/x-ndjson')
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESSION_CONFIG['COMPRESSION_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=COMPRESSION_CONFIG['COMPRESSION_GZIP_LEVEL'])
+
+
+def init_compression(app):
+    """Compress responses with brotli or gzip as negotiated by Accept-Encoding"""
+    if not COMPRESSION_CONFIG['COMPRESSION_ENABLED']:
+        return
+
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough
+                or response.is_streamed
+                or response.status_code < 200
+                or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(supported)
+        if not encoding:
+            return response
+
+        data = response.get_data()
+        if len(data) < COMPRESSION_CONFIG['COMPRESSION_MIN_SIZE']:
+            return response
+
+        response.set_data(compress_body(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
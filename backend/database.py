@@ -1,8 +1,114 @@
+import logging
+import os
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, literal, text
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
 db = SQLAlchemy()
+
+DATABASE_CONFIG = {
+    'DATABASE_URL': os.getenv('DATABASE_URL', 'sqlite:///pricepulse.db'),
+    # SQLite: WAL lets API reads proceed while the scheduler is writing
+    'SQLITE_JOURNAL_MODE': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+    # NORMAL is durable across application crashes in WAL mode; only an OS
+    # crash or power loss can roll back the last transactions
+    'SQLITE_SYNCHRONOUS': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+    # Negative values are KiB, so -65536 is a 64 MiB page cache per connection
+    'SQLITE_CACHE_SIZE': int(os.getenv('SQLITE_CACHE_SIZE', -65536)),
+    'SQLITE_MMAP_SIZE': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Milliseconds a connection waits on a locked database before failing
+    'SQLITE_BUSY_TIMEOUT': int(os.getenv('SQLITE_BUSY_TIMEOUT', 10000)),
+    # Connection pool for server databases (Postgres, MySQL)
+    'DB_POOL_SIZE': int(os.getenv('DB_POOL_SIZE', 10)),
+    'DB_MAX_OVERFLOW': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+    'DB_POOL_TIMEOUT': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    'DB_POOL_RECYCLE': int(os.getenv('DB_POOL_RECYCLE', 1800))
+}
+
+
+def engine_options(url):
+    """SQLAlchemy engine options suited to the database behind url"""
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {
+            # pysqlite's own lock timeout, in seconds
+            'connect_args': {'timeout': DATABASE_CONFIG['SQLITE_BUSY_TIMEOUT'] / 1000}
+        }
+    return {
+        'pool_size': DATABASE_CONFIG['DB_POOL_SIZE'],
+        'max_overflow': DATABASE_CONFIG['DB_MAX_OVERFLOW'],
+        'pool_timeout': DATABASE_CONFIG['DB_POOL_TIMEOUT'],
+        'pool_recycle': DATABASE_CONFIG['DB_POOL_RECYCLE'],
+        # Drop connections the server closed while they sat in the pool
+        'pool_pre_ping': True
+    }
+
+
+def configure_database(app):
+    """Point the app at DATABASE_URL with engine options for its backend"""
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', DATABASE_CONFIG['DATABASE_URL'])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={DATABASE_CONFIG['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA synchronous={DATABASE_CONFIG['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA cache_size={DATABASE_CONFIG['SQLITE_CACHE_SIZE']}")
+    cursor.execute(f"PRAGMA mmap_size={DATABASE_CONFIG['SQLITE_MMAP_SIZE']}")
+    cursor.execute(f"PRAGMA busy_timeout={DATABASE_CONFIG['SQLITE_BUSY_TIMEOUT']}")
+    cursor.close()
+
+
 def init_db(app):
+    """Bind db to the app; tables are created by init_schema (flask --app main init-db)"""
+    configure_database(app)
     db.init_app(app)
     with app.app_context():
-        db.create_all() 
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+
+
+def add_missing_columns():
+    """Add model columns and indexes that existing tables predate
+
+    create_all() only creates missing tables, so columns added to a model
+    later are added here with ALTER TABLE. NOT NULL columns get their model
+    default as the column default so existing rows have a value.
+    """
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (f"ALTER TABLE {preparer.format_table(table)} "
+                   f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}")
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                ddl += f" DEFAULT {literal(default).compile(dialect=dialect, compile_kwargs={'literal_binds': True})}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            connection.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+        # Indexes declared on the model (new columns' included)
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+    if added:
+        logger.info('Added columns to existing tables', extra={'columns': added})
+    db.session.commit()
+    return added
+
+
 def get_db():
-    return db
\ No newline at end of file
+    return db
@@ -0,0 +1,120 @@
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from database import db
+from models import Product, Deal
+
+DEALS_CONFIG = {
+    'DEALS_TOP_K': int(os.getenv('DEALS_TOP_K', 100)),
+    # Only drops of at least this many percent below baseline count as deals
+    'DEALS_MIN_DROP_PCT': float(os.getenv('DEALS_MIN_DROP_PCT', 5)),
+    # Weight of each new observation in the exponentially weighted baseline
+    'DEALS_BASELINE_ALPHA': float(os.getenv('DEALS_BASELINE_ALPHA', 0.02))
+}
+
+
+def update_baseline(baseline, price):
+    """Fold a newly observed price into a product's baseline price"""
+    if price is None:
+        return baseline
+    if baseline is None:
+        return price
+    alpha = DEALS_CONFIG['DEALS_BASELINE_ALPHA']
+    return baseline + alpha * (price - baseline)
+
+
+def update_deals(top_k=None, min_drop_pct=None):
+    """Rescore every listing against its baseline and refresh the top-K deals table
+
+    One query pulls (id, current price, baseline) for the whole catalog, the
+    scores are computed with NumPy and only rows entering, leaving or
+    changing in the top K are written. Returns a summary dict.
+    """
+    top_k = top_k or DEALS_CONFIG['DEALS_TOP_K']
+    if min_drop_pct is None:
+        min_drop_pct = DEALS_CONFIG['DEALS_MIN_DROP_PCT']
+    start = time.perf_counter()
+
+    # Listings added before baselines existed start from their current price
+    Product.query.filter(Product.baseline_price.is_(None), Product.current_price.isnot(None)).update(
+        {Product.baseline_price: Product.current_price}, synchronize_session=False
+    )
+
+    rows = db.session.query(Product.id, Product.current_price, Product.baseline_price).filter(
+        Product.current_price.isnot(None),
+        Product.baseline_price > 0,
+        Product.in_stock == True
+    ).all()
+
+    candidates = []
+    if rows:
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        current = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        baseline = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        drop_pct = (baseline - current) / baseline * 100
+
+        qualifying = np.flatnonzero(drop_pct >= min_drop_pct)
+        # Several users can track the same listing, so take extra candidates
+        # and de-duplicate by URL afterwards
+        limit = min(len(qualifying), top_k * 4)
+        if limit:
+            best = qualifying[np.argpartition(-drop_pct[qualifying], limit - 1)[:limit]]
+            best = best[np.argsort(-drop_pct[best], kind='stable')]
+            candidates = [(int(ids[i]), float(drop_pct[i])) for i in best]
+
+    products = {
+        product.id: product
+        for product in Product.query.filter(Product.id.in_([pid for pid, _ in candidates])).all()
+    } if candidates else {}
+
+    ranked = []
+    seen_urls = set()
+    for product_id, drop in candidates:
+        product = products.get(product_id)
+        if not product or product.url in seen_urls:
+            continue
+        seen_urls.add(product.url)
+        ranked.append((product, drop))
+        if len(ranked) == top_k:
+            break
+
+    # Apply the difference to the deals table
+    existing = {deal.url: deal for deal in Deal.query.all()}
+    now = datetime.utcnow()
+    inserted = updated = 0
+    for rank, (product, drop) in enumerate(ranked, start=1):
+        deal = existing.pop(product.url, None)
+        values = {
+            'product_id': product.id,
+            'rank': rank,
+            'name': product.name,
+            'image': product.image,
+            'currency': product.currency,
+            'current_price': product.current_price,
+            'baseline_price': round(product.baseline_price, 2),
+            'drop_pct': round(drop, 2)
+        }
+        if deal is None:
+            db.session.add(Deal(url=product.url, detected_at=now, updated_at=now, **values))
+            inserted += 1
+        elif any(getattr(deal, key) != value for key, value in values.items()):
+            for key, value in values.items():
+                setattr(deal, key, value)
+            deal.updated_at = now
+            updated += 1
+
+    for deal in existing.values():
+        db.session.delete(deal)
+
+    db.session.commit()
+    return {
+        'listings': len(rows),
+        'deals': len(ranked),
+        'inserted': inserted,
+        'updated': updated,
+        'removed': len(existing),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
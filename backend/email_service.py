@@ -1,8 +1,19 @@
 import smtplib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from jinja2 import Environment
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from database import db
 from models import PriceAlert, Product, User
+from alert_index import alert_index, ensure_alert_index, rebuild_alert_index
+from metrics import EMAIL_SEND_SECONDS, EMAILS_SENT, ALERT_CHECK_SECONDS
+from webhooks import send_webhook_alert
+
+logger = logging.getLogger(__name__)
 
 # Email configuration
 import os
@@ -11,12 +22,69 @@ EMAIL_CONFIG = {
     'SENDER_EMAIL': os.getenv('SENDER_EMAIL'),
     'SENDER_PASSWORD': os.getenv('SENDER_PASSWORD'),
     'SMTP_SERVER': os.getenv('SMTP_SERVER'),
-    'SMTP_PORT': int(os.getenv('SMTP_PORT', 587))
+    'SMTP_PORT': int(os.getenv('SMTP_PORT', 587)),
+    # Digest mode: one email per user for all alerts triggered in a cycle
+    'ALERT_DIGEST': os.getenv('ALERT_DIGEST', '').lower() in ('1', 'true', 'yes'),
+    # Seconds to hold triggered alerts so later ones join the same digest
+    'ALERT_DIGEST_WINDOW': int(os.getenv('ALERT_DIGEST_WINDOW', 0)),
+    # Channels every triggered alert goes out on (see ALERT_CHANNELS below)
+    'ALERT_CHANNELS': [name.strip() for name in os.getenv('ALERT_CHANNELS', 'email').split(',') if name.strip()],
+    # Failed delivery rounds before a triggered alert is given up on, and the
+    # wait before each retry (seconds, doubling per failed round)
+    'ALERT_MAX_ATTEMPTS': int(os.getenv('ALERT_MAX_ATTEMPTS', 5)),
+    'ALERT_RETRY_BACKOFF': int(os.getenv('ALERT_RETRY_BACKOFF', 900)),
+    'ALERT_RETRY_BACKOFF_MAX': int(os.getenv('ALERT_RETRY_BACKOFF_MAX', 86400))
 }
 
+# Compiled once at import; autoescaping keeps product names from breaking the HTML
+DIGEST_TEMPLATE = Environment(autoescape=True).from_string("""
+<html>
+<body>
+<h2>PricePulse Price Alerts</h2>
+<p>Good news{% if user.name %}, {{ user.name }}{% endif %}! {{ items|length }} product{{ 's' if items|length != 1 }} you're tracking reached your target price.</p>
+<table cellpadding="6">
+{% for item in items %}
+<tr>
+<td><img src="{{ item.product.image }}" alt="{{ item.product.name }}" style="max-width: 80px;"></td>
+<td>
+<strong>{{ item.product.name }}</strong><br>
+Current price: <strong>{{ item.product.currency }}{{ '%.2f'|format(item.product.current_price) }}</strong><br>
+Your target price: {{ item.product.currency }}{{ '%.2f'|format(item.alert.target_price) }}<br>
+<a href="{{ item.product.url }}">View product on Amazon</a>
+</td>
+</tr>
+{% endfor %}
+</table>
+<p>Thank you for using PricePulse!</p>
+</body>
+</html>
+""")
+
+# user_id -> {alert_id: time first queued}
+_pending_digest = {}
+_pending_lock = threading.Lock()
+
+
+@contextmanager
+def smtp_connection():
+    """Open one authenticated SMTP session that several messages can share"""
+    server = smtplib.SMTP(EMAIL_CONFIG['SMTP_SERVER'], EMAIL_CONFIG['SMTP_PORT'])
+    try:
+        server.starttls()  # Secure the connection
+        server.login(EMAIL_CONFIG['SENDER_EMAIL'], EMAIL_CONFIG['SENDER_PASSWORD'])
+        yield server
+    finally:
+        try:
+            server.quit()
+        except smtplib.SMTPException:
+            server.close()
 
-def send_email_alert(recipient, subject, message):
-    """Send an email alert using the configured email settings"""
+@EMAIL_SEND_SECONDS.time()
+def send_email_alert(recipient, subject, message, server=None):
+    """Send an email alert using the configured email settings
+    
+    Pass an open ``server`` from smtp_connection() to reuse its session.
+    """
     try:
         # Create message
         msg = MIMEMultipart()
@@ -27,62 +95,262 @@ def send_email_alert(recipient, subject, message):
         # Attach message body
         msg.attach(MIMEText(message, 'html'))
         
-        # Connect to SMTP server
-        server = smtplib.SMTP(EMAIL_CONFIG['SMTP_SERVER'], EMAIL_CONFIG['SMTP_PORT'])
-        server.starttls()  # Secure the connection
-        server.login(EMAIL_CONFIG['SENDER_EMAIL'], EMAIL_CONFIG['SENDER_PASSWORD'])
-        
-        # Send email
-        server.send_message(msg)
-        server.quit()
+        if server is not None:
+            server.send_message(msg)
+        else:
+            with smtp_connection() as own_server:
+                own_server.send_message(msg)
         
+        EMAILS_SENT.inc(result='sent')
         return True
     except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+        EMAILS_SENT.inc(result='failed')
+        logger.error('Failed to send email', extra={'recipient': recipient, 'error': str(e)})
         return False
 
+def _send_price_alert(alert, product, user):
+    """Email a user that a product reached their alert's target price"""
+    # Format prices with currency
+    current_price = f"{product.currency}{product.current_price:.2f}"
+    target_price = f"{product.currency}{alert.target_price:.2f}"
+    
+    # Create email subject and body
+    subject = f"Price Alert: {product.name} is now {current_price}"
+    
+    message = f"""
+    <html>
+    <body>
+    <h2>PricePulse Price Alert</h2>
+    <p>Good news! A product you're tracking has reached your target price.</p>
+    
+    <h3>{product.name}</h3>
+    <p><img src="{product.image}" alt="{product.name}" style="max-width: 200px;"></p>
+    <p>Current price: <strong>{current_price}</strong></p>
+    <p>Your target price: {target_price}</p>
+    
+    <p><a href="{product.url}">View product on Amazon</a></p>
+    
+    <p>Thank you for using PricePulse!</p>
+    </body>
+    </html>
+    """
+    
+    return send_email_alert(user.email, subject, message)
+
+# Alert channels: name -> send(alert, product, user), returning True once the
+# alert has been handed off, False if sending failed and None if the channel
+# does not apply to the user. register_alert_channel() adds more.
+ALERT_CHANNELS = {
+    'email': _send_price_alert,
+    'webhook': send_webhook_alert
+}
+
+def register_alert_channel(name, send):
+    """Make a channel available to ALERT_CHANNELS"""
+    ALERT_CHANNELS[name] = send
+
+def _unsent_channels(alert):
+    """Configured channels that still have to deliver the alert's current trigger"""
+    sent = alert.channels_sent()
+    return [name for name in EMAIL_CONFIG['ALERT_CHANNELS'] if name in ALERT_CHANNELS and name not in sent]
+
+def _send_to_channels(alert, product, user, skip=()):
+    """Send an alert on each configured channel that has not delivered it yet
+    
+    Channels that take it, or do not apply to the user, are recorded on the
+    alert, so after a failure the next sweep retries only the channels that
+    failed; delivery is at least once. True once no channel is left.
+    """
+    for name in EMAIL_CONFIG['ALERT_CHANNELS']:
+        if name not in ALERT_CHANNELS:
+            logger.warning('Unknown alert channel', extra={'channel': name})
+    failed = False
+    for name in _unsent_channels(alert):
+        if name in skip:
+            continue
+        if ALERT_CHANNELS[name](alert, product, user) is False:
+            failed = True
+        else:
+            alert.mark_sent(name)
+    if failed:
+        alert.record_failure()
+    return not _unsent_channels(alert)
+
+def _retry_due(alert):
+    """Whether an alert with failed deliveries has waited out its backoff"""
+    if not alert.failed_attempts or alert.last_failed_at is None:
+        return True
+    delay = min(EMAIL_CONFIG['ALERT_RETRY_BACKOFF_MAX'],
+                EMAIL_CONFIG['ALERT_RETRY_BACKOFF'] * 2 ** (alert.failed_attempts - 1))
+    return datetime.utcnow() >= alert.last_failed_at + timedelta(seconds=delay)
+
+def _notify_triggered(products, alert_ids):
+    """Send and deactivate the given alerts; products maps product id to Product"""
+    if not alert_ids:
+        return 0
+    
+    alerts = PriceAlert.query.options(db.selectinload(PriceAlert.user)).filter(
+        PriceAlert.id.in_(alert_ids), PriceAlert.is_active == True
+    ).all()
+    sent = 0
+    for alert in alerts:
+        if not alert.user:
+            continue
+        product = products[alert.product_id]
+        
+        if alert.failed_attempts >= EMAIL_CONFIG['ALERT_MAX_ATTEMPTS']:
+            logger.error('Giving up on price alert delivery', extra={
+                'alert_id': alert.id,
+                'attempts': alert.failed_attempts,
+                'unsent_channels': _unsent_channels(alert)
+            })
+            alert.is_active = False
+            alert_index.remove(alert.id)
+            continue
+        if not _retry_due(alert):
+            continue
+        
+        logger.info('Price alert triggered', extra={
+            'product_id': product.id,
+            'alert_id': alert.id,
+            'price': product.current_price,
+            'target_price': alert.target_price
+        })
+        
+        if EMAIL_CONFIG['ALERT_DIGEST'] and 'email' in _unsent_channels(alert):
+            # Emailed (and deactivated) later by flush_alert_digests; the
+            # other channels go out now, once per queued alert
+            with _pending_lock:
+                queued = _pending_digest.setdefault(alert.user_id, {})
+                newly_queued = alert.id not in queued
+                queued.setdefault(alert.id, time.monotonic())
+            if newly_queued:
+                _send_to_channels(alert, product, alert.user, skip=('email',))
+            continue
+        
+        # Alerts stay active (and indexed) while a channel has not delivered,
+        # so the periodic sweep retries that channel
+        if _send_to_channels(alert, product, alert.user):
+            alert.is_active = False
+            alert_index.remove(alert.id)
+            sent += 1
+    
+    db.session.commit()
+    return sent
+
+def _triggered_from_db(products):
+    """Ids of active alerts at or above their product's current price, read from the database"""
+    prices = {product.id: product.current_price for product in products if product.current_price is not None}
+    if not prices:
+        return []
+    rows = db.session.query(PriceAlert.id, PriceAlert.product_id, PriceAlert.target_price).filter(
+        PriceAlert.product_id.in_(list(prices)), PriceAlert.is_active == True
+    )
+    return [alert_id for alert_id, product_id, target_price in rows
+            if target_price is not None and target_price >= prices[product_id]]
+
+@ALERT_CHECK_SECONDS.time(source='refresh')
+def check_product_alerts(product, use_index=False):
+    """Notify the alerts a product's current price has just triggered
+    
+    Requests read the product's alerts from the database, since other
+    workers may have changed them. The refresh cycle, which reloads the
+    in-memory index when it starts, passes use_index=True.
+    """
+    if product.current_price is None:
+        return 0
+    if use_index:
+        ensure_alert_index()
+        alert_ids = alert_index.triggered(product.id, product.current_price)
+    else:
+        alert_ids = _triggered_from_db([product])
+    return _notify_triggered({product.id: product}, alert_ids)
+
+def check_products_alerts(products):
+    """check_product_alerts for many products, with one alert query and one commit"""
+    return _notify_triggered({product.id: product for product in products}, _triggered_from_db(products))
+
+@ALERT_CHECK_SECONDS.time(source='scheduler')
 def check_price_alerts():
     """Check all price alerts against current prices and send notifications if needed"""
-    # Get all active alerts
-    alerts = PriceAlert.query.filter_by(is_active=True).all()
+    # Only products that have active alerts are looked at, and for each the
+    # index returns just the alerts at or above the current price. Reloaded
+    # every sweep so alerts created by other processes are included.
+    rebuild_alert_index()
+    product_ids = alert_index.product_ids()
+    
+    for start in range(0, len(product_ids), 500):
+        products = Product.query.filter(Product.id.in_(product_ids[start:start + 500])).all()
+        alert_ids = []
+        for product in products:
+            alert_ids.extend(alert_index.triggered(product.id, product.current_price))
+        _notify_triggered({product.id: product for product in products}, alert_ids)
+    
+    if EMAIL_CONFIG['ALERT_DIGEST']:
+        flush_alert_digests()
+
+def flush_alert_digests(force=False):
+    """Send one digest per user for alerts queued longer than the coalescing window
+    
+    Every digest in a flush goes through a single SMTP connection. Returns
+    the number of digests sent.
+    """
+    now = time.monotonic()
+    window = EMAIL_CONFIG['ALERT_DIGEST_WINDOW']
+    with _pending_lock:
+        due = {
+            user_id: list(queued)
+            for user_id, queued in _pending_digest.items()
+            if force or now - min(queued.values()) >= window
+        }
+        for user_id in due:
+            del _pending_digest[user_id]
+    
+    if not due:
+        return 0
     
+    alert_ids = [alert_id for ids in due.values() for alert_id in ids]
+    alerts = PriceAlert.query.filter(PriceAlert.id.in_(alert_ids), PriceAlert.is_active == True).all()
+    products = {
+        product.id: product
+        for product in Product.query.filter(Product.id.in_({alert.product_id for alert in alerts})).all()
+    }
+    users = {user.id: user for user in User.query.filter(User.id.in_(list(due))).all()}
+    
+    by_user = {}
     for alert in alerts:
-        product = Product.query.get(alert.product_id)
-        user = User.query.get(alert.user_id)
-        
-        # Skip if product or user doesn't exist
-        if not product or not user:
+        product = products.get(alert.product_id)
+        # Skip alerts whose price went back up while they were queued
+        if not product or product.current_price is None or product.current_price > alert.target_price:
             continue
-            
-        # Check if current price meets or is below target price
-        if product.current_price <= alert.target_price:
-            # Format prices with currency
-            current_price = f"{product.currency}{product.current_price:.2f}"
-            target_price = f"{product.currency}{alert.target_price:.2f}"
-            
-            # Create email subject and body
-            subject = f"Price Alert: {product.name} is now {current_price}"
-            
-            message = f"""
-            <html>
-            <body>
-            <h2>PricePulse Price Alert</h2>
-            <p>Good news! A product you're tracking has reached your target price.</p>
-            
-            <h3>{product.name}</h3>
-            <p><img src="{product.image}" alt="{product.name}" style="max-width: 200px;"></p>
-            <p>Current price: <strong>{current_price}</strong></p>
-            <p>Your target price: {target_price}</p>
-            
-            <p><a href="{product.url}">View product on Amazon</a></p>
-            
-            <p>Thank you for using PricePulse!</p>
-            </body>
-            </html>
-            """
-            
-            # Send the email
-            if send_email_alert(user.email, subject, message):
-                # Deactivate alert
-                alert.is_active = False
-                db.session.commit()
\ No newline at end of file
+        by_user.setdefault(alert.user_id, []).append({'alert': alert, 'product': product})
+    
+    sent = 0
+    try:
+        with smtp_connection() as server:
+            for user_id, items in by_user.items():
+                user = users.get(user_id)
+                if not user:
+                    continue
+                subject = (f"Price Alert: {items[0]['product'].name} is now "
+                           f"{items[0]['product'].currency}{items[0]['product'].current_price:.2f}"
+                           if len(items) == 1 else f"Price Alerts: {len(items)} products reached your target price")
+                message = DIGEST_TEMPLATE.render(user=user, items=items)
+                if send_email_alert(user.email, subject, message, server=server):
+                    for item in items:
+                        alert = item['alert']
+                        alert.mark_sent('email')
+                        # A channel that failed keeps the alert for the next sweep
+                        if not _unsent_channels(alert):
+                            alert.is_active = False
+                            alert_index.remove(alert.id)
+                    sent += 1
+                else:
+                    for item in items:
+                        item['alert'].record_failure()
+    except Exception as e:
+        # Unsent alerts are still active, so the next sweep queues them again
+        logger.error('Failed to send alert digests', extra={'error': str(e)})
+    
+    db.session.commit()
+    return sent
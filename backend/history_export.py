@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from database import db
+from history_store import (
+    AggregatedPoint, HISTORY_COLUMNS, add_months, forget_partitions, history_table, is_missing_table,
+    list_partitions, partition_name
+)
+from models import PriceHistoryDaily, Product
+
+EXPORT_CONFIG = {
+    # Rows fetched from the cursor (and written out) at a time; also the Parquet row group size
+    'EXPORT_BATCH_SIZE': int(os.getenv('EXPORT_BATCH_SIZE', 10000))
+}
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+def available_formats():
+    """Export formats usable in this install (Parquet needs pyarrow)"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pyarrow is not None]
+
+
+def iter_history_batches(user_id=None, product_ids=None, since=None, until=None, batch_size=None):
+    """Lists of history rows (id, product_id, price, timestamp), read through server-side cursors
+
+    Daily aggregates of retired months come first (id None), then each raw
+    partition oldest first, by product and time within it. Only one batch
+    is held in memory at a time.
+    """
+    batch_size = batch_size or EXPORT_CONFIG['EXPORT_BATCH_SIZE']
+    since = since.replace(tzinfo=None) if since else None
+    until = until.replace(tzinfo=None) if until else None
+
+    def owned(product_column):
+        conditions = []
+        if user_id is not None:
+            conditions.append(product_column.in_(select(Product.id).where(Product.user_id == user_id)))
+        if product_ids is not None:
+            conditions.append(product_column.in_(sorted(set(product_ids))))
+        return conditions
+
+    def stream(statement):
+        result = db.session.execute(statement.execution_options(yield_per=batch_size))
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    def aggregates(start, end):
+        daily = select(PriceHistoryDaily.product_id, PriceHistoryDaily.day, PriceHistoryDaily.close_price).where(
+            *owned(PriceHistoryDaily.product_id)
+        )
+        if start is not None:
+            daily = daily.where(PriceHistoryDaily.day >= start.date())
+        if end is not None:
+            daily = daily.where(PriceHistoryDaily.day < end.date())
+        for batch in stream(daily.order_by(PriceHistoryDaily.product_id, PriceHistoryDaily.day)):
+            yield [
+                AggregatedPoint(None, product_id, price, datetime(day.year, day.month, day.day))
+                for product_id, day, price in batch
+            ]
+
+    months = list_partitions()
+    raw_start = months[0] if months else None
+
+    if raw_start is None or since is None or since < raw_start:
+        ends = [end for end in (until, raw_start) if end is not None]
+        yield from aggregates(since, min(ends) if ends else None)
+
+    for month in months:
+        month_end = add_months(month, 1)
+        if (since is not None and month_end <= since) or (until is not None and month >= until):
+            continue
+        # Partitions are read directly on both databases so rows come out month by month
+        t = history_table(partition_name(month))
+        statement = select(t.c.id, t.c.product_id, t.c.price, t.c.timestamp).where(
+            t.c.price.isnot(None), *owned(t.c.product_id)
+        )
+        if since is not None:
+            statement = statement.where(t.c.timestamp >= since)
+        if until is not None:
+            statement = statement.where(t.c.timestamp < until)
+        try:
+            result = db.session.execute(
+                statement.order_by(t.c.product_id, t.c.timestamp).execution_options(yield_per=batch_size)
+            )
+        except (OperationalError, ProgrammingError) as e:
+            if not is_missing_table(e):
+                raise
+            # Retired by another process after the export started: the month
+            # is in the daily aggregates now (the export only reads, so the
+            # failed transaction can simply be rolled back)
+            db.session.rollback()
+            forget_partitions()
+            yield from aggregates(max(month, since) if since else month, min(month_end, until) if until else month_end)
+            continue
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HISTORY_COLUMNS)
+    yield buffer.getvalue().encode('utf-8')
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((history_id, product_id, price, timestamp.isoformat())
+                         for history_id, product_id, price, timestamp in batch)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        if orjson is not None:
+            option = orjson.OPT_APPEND_NEWLINE
+            yield b''.join(
+                orjson.dumps(dict(zip(HISTORY_COLUMNS, row)), option=option) for row in batch
+            )
+        else:
+            yield ''.join(
+                json.dumps({'id': history_id, 'product_id': product_id, 'price': price,
+                            'timestamp': timestamp.isoformat()}) + '\n'
+                for history_id, product_id, price, timestamp in batch
+            ).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what the Parquet writer emits until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_chunks(batches):
+    if pyarrow is None:
+        raise RuntimeError('Parquet export needs pyarrow')
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('product_id', pyarrow.int64()),
+        ('price', pyarrow.float64()),
+        ('timestamp', pyarrow.timestamp('us'))
+    ])
+    sink = _ChunkSink()
+    # One row group per batch, handed on as soon as it is written
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in batches:
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_history(fmt, **filters):
+    """Byte chunks of the price history export in fmt; filters as for iter_history_batches"""
+    writers = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks, 'parquet': _parquet_chunks}
+    if fmt not in writers:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    return writers[fmt](iter_history_batches(**filters))
@@ -0,0 +1,449 @@
+import csv
+import gzip
+import io
+import logging
+import os
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+from operator import itemgetter
+
+from flask import current_app
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, MetaData, Table, column, delete, inspect, select, table, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from database import db
+from models import PriceHistoryDaily
+from series_cache import get_series_cache, track_deletion, track_history
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CONFIG = {
+    # Whole months of raw rows kept, counting the current one; older months
+    # are rolled into daily aggregates, archived and dropped
+    'HISTORY_RETENTION_MONTHS': int(os.getenv('HISTORY_RETENTION_MONTHS', 13)),
+    # Relative paths are resolved against the app's instance folder; empty disables archiving
+    'HISTORY_ARCHIVE_DIR': os.getenv('HISTORY_ARCHIVE_DIR', 'history-archive'),
+    'HISTORY_ARCHIVE_CODEC': os.getenv('HISTORY_ARCHIVE_CODEC', 'zstd' if zstandard else 'gzip'),
+    # Seconds a process trusts its list of partitions; partitions created or
+    # dropped by another process (e.g. the scheduler) show up after this
+    'HISTORY_PARTITION_CACHE_TTL': float(os.getenv('HISTORY_PARTITION_CACHE_TTL', 60))
+}
+
+PARENT_TABLE = 'price_history'
+# Postgres moves a pre-partitioning price_history table here until it is copied over
+LEGACY_TABLE = 'price_history_legacy'
+PARTITION_PATTERN = re.compile(r'^price_history_(\d{4})_(\d{2})$')
+HISTORY_COLUMNS = ('id', 'product_id', 'price', 'timestamp')
+
+# History point rebuilt from a daily aggregate; same attributes as raw rows
+AggregatedPoint = namedtuple('AggregatedPoint', HISTORY_COLUMNS)
+
+_metadata = MetaData()
+
+# Database URL -> (loaded at, set of partition months)
+_partition_cache = {}
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def history_table(name):
+    """Lightweight table construct for reading a partition or the parent"""
+    return table(name, column('id'), column('product_id'), column('price'), column('timestamp', DateTime))
+
+
+def _parent_table():
+    """Postgres parent table, range partitioned on timestamp"""
+    if PARENT_TABLE in _metadata.tables:
+        return _metadata.tables[PARENT_TABLE]
+    return Table(
+        PARENT_TABLE, _metadata,
+        # The partition key has to be part of the primary key
+        Column('id', BigInteger, primary_key=True, autoincrement=True),
+        Column('timestamp', DateTime, primary_key=True, default=datetime.utcnow),
+        Column('product_id', Integer, nullable=False),
+        Column('price', Float),
+        Index(f"ix_{PARENT_TABLE}_product_time", 'product_id', 'timestamp'),
+        postgresql_partition_by='RANGE ("timestamp")'
+    )
+
+
+def _sqlite_partition_table(name):
+    if name in _metadata.tables:
+        return _metadata.tables[name]
+    return Table(
+        name, _metadata,
+        Column('id', Integer, primary_key=True),
+        Column('product_id', Integer, nullable=False),
+        Column('price', Float),
+        Column('timestamp', DateTime, nullable=False, default=datetime.utcnow),
+        Index(f"ix_{name}_product_time", 'product_id', 'timestamp'),
+        sqlite_autoincrement=True
+    )
+
+
+def list_partitions():
+    """Months that have a raw history partition, oldest first"""
+    return sorted(_partition_months())
+
+
+def _partition_months():
+    """Partition months from a per-process cache, reread from the catalog once it expires"""
+    key = str(db.engine.url)
+    cached = _partition_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < HISTORY_CONFIG['HISTORY_PARTITION_CACHE_TTL']:
+        return cached[1]
+
+    months = set()
+    for name in inspect(db.session.connection()).get_table_names():
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            months.add(datetime(int(match.group(1)), int(match.group(2)), 1))
+    _partition_cache[key] = (time.monotonic(), months)
+    return months
+
+
+def forget_partitions():
+    """Drop this process's cached partition list, e.g. after a partition turned out to be gone"""
+    _partition_cache.pop(str(db.engine.url), None)
+
+
+def is_missing_table(error):
+    """True if a database error says a table does not exist, as a partition retired by another process"""
+    if not isinstance(error, (OperationalError, ProgrammingError)):
+        return False
+    orig = error.orig
+    # 42P01 is Postgres' undefined_table
+    return getattr(orig, 'pgcode', None) == '42P01' or 'no such table' in str(orig)
+
+
+def ensure_partition(month):
+    """Create the partition holding month if needed and return the table to insert into"""
+    name = partition_name(month)
+    connection = db.session.connection()
+    # Known partitions skip the catalog; anything else is checked (or created)
+    # and the cache reloaded so readers see it
+    known = month in _partition_months()
+
+    if _is_postgres():
+        if not known:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+            forget_partitions()
+        return _parent_table()
+
+    partition = _sqlite_partition_table(name)
+    if not known:
+        if not inspect(connection).has_table(name):
+            partition.create(connection)
+            connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, 0)"), {'name': name})
+        forget_partitions()
+    # Partitions share one id sequence: continue from the highest id handed
+    # out by any of them, since months can be created ahead or backfilled
+    connection.execute(text(
+        "UPDATE sqlite_sequence SET seq = "
+        "(SELECT MAX(seq) FROM sqlite_sequence WHERE name GLOB 'price_history_[0-9]*') WHERE name = :name"
+    ), {'name': name})
+    return partition
+
+
+def record_prices(rows):
+    """Insert history rows (product_id, price and optionally timestamp) into their monthly partitions
+
+    Runs on the current session, so the rows are committed with the caller's transaction.
+    """
+    now = datetime.utcnow()
+    by_month = {}
+    for row in rows:
+        row = dict(row)
+        if row.get('timestamp') is None:
+            row['timestamp'] = now
+        by_month.setdefault(month_start(row['timestamp']), []).append(row)
+
+    for month, month_rows in sorted(by_month.items()):
+        partition = ensure_partition(month)
+        if get_series_cache() is None:
+            db.session.execute(partition.insert(), month_rows)
+            continue
+        # The shared series cache needs the ids, and picks the rows up on commit
+        ids = db.session.execute(
+            partition.insert().returning(partition.c.id, sort_by_parameter_order=True), month_rows
+        ).scalars().all()
+        track_history(
+            (row['product_id'], history_id, row['timestamp'], row['price'])
+            for row, history_id in zip(month_rows, ids)
+        )
+
+
+def load_history(product_ids, since):
+    """History rows (id, product_id, price, timestamp) of several products since a time
+
+    Rows are ordered by product then time. Only partitions overlapping the
+    window are read; any part of the window older than the oldest raw
+    partition is served from daily aggregates (one point per day, id None).
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return []
+
+    # Stored timestamps are naive, so compare partition bounds naively too
+    since_naive = since.replace(tzinfo=None)
+    for attempt in range(2):
+        months = list_partitions()
+        if _is_postgres():
+            # The planner prunes partitions outside the timestamp filter
+            tables = [history_table(PARENT_TABLE)] if months else []
+        else:
+            tables = [history_table(partition_name(month)) for month in months if add_months(month, 1) > since_naive]
+        try:
+            rows = _load_raw(tables, product_ids, since)
+            break
+        except (OperationalError, ProgrammingError) as e:
+            # Retention in another process dropped a cached partition; its
+            # rows are aggregates now, so reread the list and start over
+            if attempt or not is_missing_table(e):
+                raise
+            forget_partitions()
+
+    sources = len(tables)
+    raw_start = months[0] if months else None
+    if raw_start is None or since_naive < raw_start:
+        aggregates = _load_aggregates(product_ids, since_naive, raw_start)
+        if aggregates:
+            # Aggregated days all precede the raw rows
+            rows = aggregates + rows
+            sources += 1
+    if sources > 1:
+        # Sources were read oldest first, so a stable sort on product alone
+        # leaves each product's rows in time order
+        rows.sort(key=itemgetter(1))
+    return rows
+
+
+def _load_raw(tables, product_ids, since):
+    rows = []
+    for t in tables:
+        for start in range(0, len(product_ids), 500):
+            rows.extend(db.session.execute(
+                select(t.c.id, t.c.product_id, t.c.price, t.c.timestamp).where(
+                    t.c.product_id.in_(product_ids[start:start + 500]),
+                    t.c.timestamp >= since,
+                    t.c.price.isnot(None)
+                ).order_by(t.c.product_id, t.c.timestamp)
+            ).all())
+    return rows
+
+
+def _load_aggregates(product_ids, since, until=None):
+    query = db.session.query(PriceHistoryDaily.product_id, PriceHistoryDaily.day, PriceHistoryDaily.close_price).filter(
+        PriceHistoryDaily.product_id.in_(product_ids),
+        PriceHistoryDaily.day >= since.date()
+    )
+    if until is not None:
+        query = query.filter(PriceHistoryDaily.day < until.date())
+    query = query.order_by(PriceHistoryDaily.product_id, PriceHistoryDaily.day)
+    return [
+        AggregatedPoint(None, product_id, price, datetime(day.year, day.month, day.day))
+        for product_id, day, price in query
+    ]
+
+
+def delete_product_history(product_ids):
+    """Delete the raw and aggregated history of products with one statement per partition"""
+    if _is_postgres():
+        tables = [history_table(PARENT_TABLE)]
+    else:
+        tables = [history_table(partition_name(month)) for month in list_partitions()]
+    for t in tables:
+        try:
+            db.session.execute(delete(t).where(t.c.product_id.in_(product_ids)))
+        except (OperationalError, ProgrammingError) as e:
+            # Already retired by another process; its aggregates go below
+            if not is_missing_table(e):
+                raise
+            forget_partitions()
+    db.session.execute(delete(PriceHistoryDaily).where(PriceHistoryDaily.product_id.in_(product_ids)))
+    track_deletion(product_ids)
+
+
+def apply_retention(retention_months=None, archive_dir=None, now=None):
+    """Roll partitions older than the retention window into daily aggregates, archive and drop them
+
+    Each expired month is archived to a compressed CSV, aggregated and then
+    dropped as a whole table instead of deleted row by row. The steps are
+    idempotent, so a run interrupted part way is finished by the next one.
+    """
+    if retention_months is None:
+        retention_months = HISTORY_CONFIG['HISTORY_RETENTION_MONTHS']
+    if archive_dir is None:
+        archive_dir = HISTORY_CONFIG['HISTORY_ARCHIVE_DIR']
+    if archive_dir and not os.path.isabs(archive_dir):
+        archive_dir = os.path.join(current_app.instance_path, archive_dir)
+
+    cutoff = add_months(month_start(now or datetime.utcnow()), 1 - retention_months)
+    retired = []
+    for month in list_partitions():
+        if month >= cutoff:
+            break
+        rows, days = _retire_partition(month, archive_dir)
+        logger.info('Retired price history partition', extra={
+            'partition': partition_name(month), 'rows': rows, 'aggregates': days
+        })
+        retired.append({'partition': partition_name(month), 'rows': rows, 'aggregates': days})
+    return retired
+
+
+def _retire_partition(month, archive_dir):
+    name = partition_name(month)
+    t = history_table(name)
+    result = db.session.execute(
+        select(t.c.id, t.c.product_id, t.c.price, t.c.timestamp).order_by(t.c.product_id, t.c.timestamp),
+        execution_options={'yield_per': 10000}
+    )
+
+    archive = _ArchiveWriter(archive_dir, name) if archive_dir else None
+    aggregates = []
+    current = None
+    rows = 0
+    for row in result:
+        rows += 1
+        if archive:
+            archive.write(row)
+        if row.price is None:
+            continue
+        key = (row.product_id, row.timestamp.date())
+        if current is None or current['key'] != key:
+            current = {'key': key, 'min': row.price, 'max': row.price, 'sum': 0.0, 'count': 0}
+            aggregates.append(current)
+        current['min'] = min(current['min'], row.price)
+        current['max'] = max(current['max'], row.price)
+        current['sum'] += row.price
+        current['count'] += 1
+        current['close'] = row.price
+    if archive:
+        archive.close()
+
+    # Replace any aggregates left by an interrupted run of the same month
+    db.session.execute(delete(PriceHistoryDaily).where(
+        PriceHistoryDaily.day >= month.date(),
+        PriceHistoryDaily.day < add_months(month, 1).date()
+    ))
+    if aggregates:
+        db.session.execute(PriceHistoryDaily.__table__.insert(), [{
+            'product_id': aggregate['key'][0],
+            'day': aggregate['key'][1],
+            'min_price': aggregate['min'],
+            'max_price': aggregate['max'],
+            'avg_price': aggregate['sum'] / aggregate['count'],
+            'close_price': aggregate['close'],
+            'samples': aggregate['count']
+        } for aggregate in aggregates])
+    db.session.execute(text(f"DROP TABLE {name}"))
+    db.session.commit()
+    forget_partitions()
+    if name in _metadata.tables:
+        _metadata.remove(_metadata.tables[name])
+    return rows, len(aggregates)
+
+
+class _ArchiveWriter:
+    """Compressed CSV of a partition's raw rows, moved into place only once complete"""
+
+    def __init__(self, archive_dir, name):
+        codec = HISTORY_CONFIG['HISTORY_ARCHIVE_CODEC']
+        if codec == 'zstd' and zstandard is None:
+            codec = 'gzip'
+        os.makedirs(archive_dir, exist_ok=True)
+        self.path = os.path.join(archive_dir, f"{name}.csv.{'zst' if codec == 'zstd' else 'gz'}")
+        self._tmp_path = f"{self.path}.tmp"
+        self._raw = open(self._tmp_path, 'wb')
+        if codec == 'zstd':
+            compressed = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            compressed = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        self._text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(HISTORY_COLUMNS)
+
+    def write(self, row):
+        self._writer.writerow((row.id, row.product_id, row.price, row.timestamp.isoformat()))
+
+    def close(self):
+        self._text.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def init_history_store():
+    """Create the partitioned history tables and move over rows from an unpartitioned price_history"""
+    connection = db.session.connection()
+    inspector = inspect(connection)
+
+    if _is_postgres():
+        partitioned = connection.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :name"
+        ), {'name': PARENT_TABLE}).first()
+        if inspector.has_table(PARENT_TABLE) and not partitioned:
+            connection.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE}"))
+        _parent_table().create(connection, checkfirst=True)
+        legacy = LEGACY_TABLE if inspect(connection).has_table(LEGACY_TABLE) else None
+    else:
+        legacy = PARENT_TABLE if inspector.has_table(PARENT_TABLE) else None
+
+    # Keep the current and next month ready so inserts never wait on DDL at month end
+    current = month_start(datetime.utcnow())
+    ensure_partition(current)
+    ensure_partition(add_months(current, 1))
+
+    if legacy:
+        copied = _migrate_legacy(legacy)
+        logger.info('Moved legacy price history into monthly partitions', extra={'rows': copied})
+    db.session.commit()
+
+
+def _migrate_legacy(name, batch_size=50000):
+    source = history_table(name)
+    copied = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(source.c.id, source.c.product_id, source.c.price, source.c.timestamp)
+            .where(source.c.id > last_id).order_by(source.c.id).limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        record_prices([row._asdict() for row in batch])
+        copied += len(batch)
+        last_id = batch[-1].id
+
+    if _is_postgres() and copied:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{PARENT_TABLE}', 'id'), (SELECT MAX(id) FROM {PARENT_TABLE}))"
+        ))
+    db.session.execute(text(f"DROP TABLE {name}"))
+    return copied
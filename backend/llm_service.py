@@ -1,10 +1,14 @@
 import requests
 import json
+import logging
 import re
 from typing import Dict, List, Optional
 import os
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
+from metrics import EXTERNAL_CALL_SECONDS, EXTERNAL_CALL_ERRORS
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -34,12 +38,12 @@ class LLMService:
                         if brand.lower() != 'unknown':
                             metadata['brand'] = brand.title()
                 except Exception as e:
-                    print(f"LLM API call failed: {e}")
+                    logger.warning('LLM API call failed', extra={'error': str(e)})
             
             return metadata
             
         except Exception as e:
-            print(f"Metadata extraction error: {e}")
+            logger.exception('Metadata extraction error')
             return self._fallback_metadata(product_name)
     
     def _extract_metadata_with_patterns(self, name: str, description: str = "") -> Dict:
@@ -117,15 +121,20 @@ class LLMService:
 
     def _call_hf_api(self, prompt: str) -> Optional[Dict]:
         try:
-            response = requests.post(
-                f"https://api-inference.huggingface.co/models/{self.hf_model}",
-                headers=self.headers,
-                json={"inputs": prompt},
-                timeout=10
-            )
-            return response.json() if response.status_code == 200 else None
+            with EXTERNAL_CALL_SECONDS.time(service='huggingface'):
+                response = requests.post(
+                    f"https://api-inference.huggingface.co/models/{self.hf_model}",
+                    headers=self.headers,
+                    json={"inputs": prompt},
+                    timeout=10
+                )
+            if response.status_code != 200:
+                EXTERNAL_CALL_ERRORS.inc(service='huggingface')
+                return None
+            return response.json()
         except Exception as e:
-            print(f"Hugging Face API error: {e}")
+            EXTERNAL_CALL_ERRORS.inc(service='huggingface')
+            logger.warning('Hugging Face API error', extra={'error': str(e)})
             return None
 
     def _fallback_metadata(self, name: str) -> Dict:
@@ -138,9 +147,15 @@ class LLMService:
         }
 
 class MultiPlatformSearcher:
+    # Custom Search queries sent per platform for one product
+    QUERIES_PER_PLATFORM = 2
+
     def __init__(self):
         self.google_api_key = os.getenv('GOOGLE_API_KEY')
         self.google_cse_id = os.getenv('GOOGLE_CSE_ID')
+        # Custom Search calls made by this instance, for quota accounting
+        self.queries_sent = 0
+        self.queries_failed = 0
         self.platform_configs = {
             'flipkart': {
                 'site': 'flipkart.com',
@@ -160,27 +175,35 @@ class MultiPlatformSearcher:
         all_results = []  # Fixed: Use different variable name
         search_queries = self._generate_search_queries(metadata, primary_product_name)
         
-        print(f"Searching with queries: {search_queries}")  # Debug log
+        logger.debug('Searching with queries', extra={'queries': search_queries})
         
         for platform, config in self.platform_configs.items():
             try:
                 platform_results = []
-                for query in search_queries[:2]:  # Limit to first 2 queries
+                for query in search_queries[:self.QUERIES_PER_PLATFORM]:
                     search_results = self._search_platform(query, config)  # Fixed: Use different variable name
                     platform_results.extend(search_results)
-                    print(f"Found {len(search_results)} results for {platform} with query: {query}")  # Debug log
+                    logger.debug('Platform search finished', extra={'platform': platform, 'query': query, 'results': len(search_results)})
                 
                 # Deduplicate and add to all results
                 unique_platform_results = self._deduplicate(platform_results)[:5]
                 all_results.extend(unique_platform_results)
                 
             except Exception as e:
-                print(f"Error searching {platform}: {e}")
+                logger.warning('Error searching platform', extra={'platform': platform, 'error': str(e)})
         
         final_results = self._sort_and_filter(all_results)
-        print(f"Total final results: {len(final_results)}")  # Debug log
+        logger.info('Cross-platform search finished', extra={'results': len(final_results)})
         return final_results
 
+    def has_credentials(self) -> bool:
+        return bool(self.google_api_key and self.google_cse_id)
+
+    def query_cost(self, metadata: Dict, primary_product_name: str) -> int:
+        """Number of Custom Search queries search_across_platforms will send"""
+        queries = self._generate_search_queries(metadata, primary_product_name)[:self.QUERIES_PER_PLATFORM]
+        return len(self.platform_configs) * len(queries)
+
     def _generate_search_queries(self, metadata: Dict, primary_name: str) -> List[str]:
         queries = [primary_name]
         if metadata.get('brand') and metadata.get('model'):
@@ -194,39 +217,51 @@ class MultiPlatformSearcher:
             if q and q not in unique_queries:
                 unique_queries.append(q)
         
-        print(f"Generated search queries: {unique_queries}")  # Debug log
+        logger.debug('Generated search queries', extra={'queries': unique_queries})
         return unique_queries
 
     def _search_platform(self, query: str, config: Dict) -> List[Dict]:
         try:
             # Check if API credentials are available
             if not self.google_api_key or not self.google_cse_id:
-                print(f"Missing Google API credentials - API Key: {bool(self.google_api_key)}, CSE ID: {bool(self.google_cse_id)}")
+                logger.warning('Missing Google API credentials', extra={'has_api_key': bool(self.google_api_key), 'has_cse_id': bool(self.google_cse_id)})
                 return []
             
             encoded_query = quote_plus(f"{query} site:{config['site']}")
             url = f"https://www.googleapis.com/customsearch/v1?q={encoded_query}&key={self.google_api_key}&cx={self.google_cse_id}&num=5"
             
-            print(f"Searching URL: {url}")  # Debug log
+            # Never log the URL itself - it carries the API key
+            logger.debug('Searching platform', extra={'site': config['site'], 'query': query})
             
-            response = requests.get(url, timeout=15)
+            self.queries_sent += 1
+            with EXTERNAL_CALL_SECONDS.time(service='google_cse'):
+                response = requests.get(url, timeout=15)
             response.raise_for_status()
             
             response_data = response.json()
             results = self._parse_results(response_data, config)
             
-            print(f"Parsed {len(results)} results from {config['site']}")  # Debug log
+            logger.debug('Parsed search results', extra={'site': config['site'], 'results': len(results)})
             return results
             
         except Exception as e:
-            print(f"Search error for {config['site']}: {e}")
+            self.queries_failed += 1
+            EXTERNAL_CALL_ERRORS.inc(service='google_cse')
+            # requests puts the full URL (with the API key) in its messages,
+            # so only the exception type and status code are logged
+            response = getattr(e, 'response', None)
+            logger.warning('Search error', extra={
+                'site': config['site'],
+                'error': type(e).__name__,
+                'status_code': response.status_code if response is not None else None
+            })
             return []
 
     def _parse_results(self, data: Dict, config: Dict) -> List[Dict]:
         results = []
         items = data.get('items', [])
         
-        print(f"Processing {len(items)} items from search results")  # Debug log
+        logger.debug('Processing search result items', extra={'items': len(items)})
         
         for item in items:
             try:
@@ -251,16 +286,16 @@ class MultiPlatformSearcher:
                         }
                         
                         results.append(result)
-                        print(f"Added result: {title[:50]}... - ₹{price}")  # Debug log
+                        logger.debug('Added result', extra={'title': title[:50], 'price': price})
                         
                     except ValueError as ve:
-                        print(f"Price parsing error: {ve}")
+                        logger.debug('Price parsing error', extra={'error': str(ve)})
                         continue
                 else:
-                    print(f"No price found in: {price_str[:100]}...")  # Debug log
+                    logger.debug('No price found', extra={'text': price_str[:100]})
                     
             except Exception as e:
-                print(f"Error processing item: {e}")
+                logger.warning('Error processing search item', extra={'error': str(e)})
                 continue
         
         return results
@@ -286,7 +321,7 @@ class MultiPlatformSearcher:
                 seen.add(identifier)
                 unique.append(item)
                 
-        print(f"Deduplicated: {len(items)} -> {len(unique)} items")  # Debug log
+        logger.debug('Deduplicated results', extra={'before': len(items), 'after': len(unique)})
         return unique
 
     def _sort_and_filter(self, items: List[Dict]) -> List[Dict]:
@@ -299,5 +334,5 @@ class MultiPlatformSearcher:
         # Return top 10 cheapest
         result = sorted_items[:10]
         
-        print(f"Final filtering: {len(items)} -> {len(valid_items)} valid -> {len(result)} returned")  # Debug log
+        logger.debug('Filtered results', extra={'before': len(items), 'valid': len(valid_items), 'returned': len(result)})
         return result
\ No newline at end of file
@@ -0,0 +1,125 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+LOGGING_CONFIG = {
+    'LOG_LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
+    'LOG_FORMAT': os.getenv('LOG_FORMAT', 'text'),
+    # Fraction of DEBUG records kept - per-item debug events are very chatty
+    'LOG_DEBUG_SAMPLE_RATE': float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))
+}
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED_ATTRS}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the ``extra`` fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Human readable lines with the ``extra`` fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+
+class DebugSampler(logging.Filter):
+    """Keep only a random fraction of DEBUG records, pass everything else"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are and leave formatting to the listener's handlers
+
+    The stock prepare() merges args into the message and formats exc_info on
+    the calling thread. Skipping it means mutable args are rendered as they
+    are when the listener gets to them, a fine trade for log lines.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(level=None, fmt=None, debug_sample_rate=None, stream=None):
+    """Route all logging through a queue drained by a background thread
+
+    Request and scheduler threads only pay for putting the record on the
+    queue; formatting and the blocking write happen on the listener thread.
+    Safe to call again to reconfigure.
+    """
+    global _listener
+
+    level = (level or LOGGING_CONFIG['LOG_LEVEL']).upper()
+    fmt = fmt or LOGGING_CONFIG['LOG_FORMAT']
+    if debug_sample_rate is None:
+        debug_sample_rate = LOGGING_CONFIG['LOG_DEBUG_SAMPLE_RATE']
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == 'json' else KeyValueFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    return _listener
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
@@ -1,53 +1,130 @@
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, Blueprint, jsonify, request, make_response, current_app, stream_with_context
+import click
+import json
 from flask_cors import CORS
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from apscheduler.schedulers.background import BackgroundScheduler
+from flask_login import LoginManager
 import os
 from datetime import datetime, timedelta, timezone
 import jwt
 from functools import wraps
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 load_dotenv()
 
-# Import our modules
-from llm_service import LLMService, MultiPlatformSearcher
-from database import init_db
-from models import User, Product, PriceHistory, PriceAlert
-from scraper import AmazonScraper, update_all_products
-from email_service import check_price_alerts, send_email_alert
+# Import our modules. Subsystems that pull in BeautifulSoup, NumPy, requests
+# or APScheduler are imported where they are used, so the app starts fast.
+from database import db, init_db, add_missing_columns
+from models import (
+    User, Product, PriceAlert, Deal, PRODUCT_LIST_FIELDS, PRICE_HISTORY_PROJECTION,
+    QUARANTINE_STATUSES, QUARANTINE_PROJECTION
+)
+from metrics import render_metrics, get_fingerprint_stats, start_metrics_server
+from profiling import init_profiling
+from serialization import init_json
+from compression import init_compression
+from logging_config import configure_logging
+from alert_index import alert_index
+from comparisons import get_comparison, is_stale, record_view
+from search_index import init_search_index, search_products
+from webhooks import UnsafeWebhookURL, check_webhook_url
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+# Define IST timezone (UTC+5:30)
+IST = timezone(timedelta(hours=5, minutes=30))
 
-# Configure database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pricepulse.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+APP_CONFIG = {
+    # Run the background jobs inside the web process; otherwise start them
+    # in their own process with `flask --app main run-scheduler`
+    'SCHEDULER_ENABLED': os.getenv('SCHEDULER_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    # Port for the standalone scheduler's own /metrics endpoint (0 disables it)
+    'SCHEDULER_METRICS_PORT': int(os.getenv('SCHEDULER_METRICS_PORT', 0))
+}
 
-# Initialize Flask-Login
+# Routes and CLI commands; commands keep their top-level names (flask --app main init-db)
+api = Blueprint('api', __name__, cli_group=None)
 login_manager = LoginManager()
-login_manager.init_app(app)
-def get_ist_time():
-    """Get current time in IST timezone"""
-    return datetime.now(IST)
 
-# Also, make sure you have these imports at the top of your main.py:
-from datetime import datetime, timedelta, timezone
-# Define IST timezone (UTC+5:30)
-IST = timezone(timedelta(hours=5, minutes=30))
 
-# Initialize the database
-init_db(app)
+def create_app(config=None):
+    """Build the Flask app without touching the schema or starting background jobs"""
+    # Non-blocking, leveled logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE)
+    configure_logging()
+    
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for all routes
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config.update(APP_CONFIG)
+    app.config.update(config or {})
+    
+    # Database (DATABASE_URL, SQLite pragmas, connection pool); no DDL here
+    init_db(app)
+    login_manager.init_app(app)
+    
+    # Opt-in per-request profiling (PROFILING_ENABLED)
+    init_profiling(app)
+    
+    # Fast JSON serialization (JSON_SERIALIZER) and gzip/brotli responses
+    init_json(app)
+    init_compression(app)
+    
+    app.register_blueprint(api)
+    
+    if app.config['SCHEDULER_ENABLED']:
+        start_scheduler(app)
+    return app
 
-# Import db after initialization
-from database import db
 
-# Create a scheduler for updating prices and checking alerts
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=update_all_products, trigger="interval", minutes=30)
-scheduler.add_job(func=check_price_alerts, trigger="interval", minutes=15)
-scheduler.start()
+def init_schema():
+    """Create tables, the search index and history partitions, migrate legacy history and build the series cache"""
+    from history_store import init_history_store
+    from series_cache import init_series_cache
+    
+    db.create_all()
+    # Columns and indexes added to models since the tables were created
+    add_missing_columns()
+    # Full-text index over product names and descriptions
+    init_search_index()
+    # Monthly price history partitions (and any rows still in the old table)
+    init_history_store()
+    # Memory-mapped price series shared by all workers (SERIES_CACHE_DIR)
+    init_series_cache()
+
+
+def start_scheduler(app, blocking=False):
+    """Schedule the refresh, alert, retention and comparison jobs, each run in an app context"""
+    from scraper import update_all_products
+    from email_service import check_price_alerts, flush_alert_digests, EMAIL_CONFIG
+    from history_store import apply_retention
+    from comparisons import precompute_comparisons
+    if blocking:
+        from apscheduler.schedulers.blocking import BlockingScheduler as Scheduler
+    else:
+        from apscheduler.schedulers.background import BackgroundScheduler as Scheduler
+    
+    def in_app_context(func):
+        @wraps(func)
+        def job():
+            with app.app_context():
+                return func()
+        return job
+    
+    scheduler = Scheduler()
+    scheduler.add_job(func=in_app_context(update_all_products), trigger="interval", minutes=30)
+    scheduler.add_job(func=in_app_context(check_price_alerts), trigger="interval", minutes=15)
+    if EMAIL_CONFIG['ALERT_DIGEST'] and EMAIL_CONFIG['ALERT_DIGEST_WINDOW']:
+        # Send digests whose coalescing window has elapsed between cycles
+        scheduler.add_job(func=in_app_context(flush_alert_digests), trigger="interval", minutes=1)
+    # Roll expired history partitions into daily aggregates
+    scheduler.add_job(func=in_app_context(apply_retention), trigger="interval", days=1)
+    # Spend the daily search quota on cross-platform comparisons
+    scheduler.add_job(func=in_app_context(precompute_comparisons), trigger="interval", hours=1)
+    app.extensions['scheduler'] = scheduler
+    scheduler.start()
+    return scheduler
+
+
+def get_ist_time():
+    """Get current time in IST timezone"""
+    return datetime.now(IST)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -65,7 +142,7 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
             
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
             current_user = User.query.get(data['user_id'])
         except:
             return jsonify({'error': 'Token is invalid'}), 401
@@ -74,15 +151,25 @@ def token_required(f):
         
     return decorated
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """API health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'timestamp': get_ist_time().isoformat()
+        'timestamp': get_ist_time().isoformat(),
+        'scraper': {
+            'fingerprint': get_fingerprint_stats()
+        }
     })
 
-@app.route('/api/auth/register', methods=['POST'])
+@api.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Scrape, alert and notification metrics in Prometheus text format"""
+    response = make_response(render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+@api.route('/api/auth/register', methods=['POST'])
 def register():
     """Register a new user"""
     data = request.json
@@ -108,14 +195,14 @@ def register():
     token = jwt.encode({
         'user_id': user.id,
         'exp': datetime.utcnow() + timedelta(days=30)
-    }, app.config['SECRET_KEY'])
+    }, current_app.config['SECRET_KEY'])
     
     return jsonify({
         'token': token,
         'user': user.to_dict()
     }), 201
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
 def login():
     """Login a user"""
     data = request.json
@@ -136,46 +223,156 @@ def login():
     token = jwt.encode({
         'user_id': user.id,
         'exp': datetime.utcnow() + timedelta(days=30)
-    }, app.config['SECRET_KEY'])
+    }, current_app.config['SECRET_KEY'])
     
     return jsonify({
         'token': token,
         'user': user.to_dict()
     })
 
-@app.route('/api/auth/logout', methods=['POST'])
+@api.route('/api/auth/logout', methods=['POST'])
 @token_required
 def logout(current_user):
     """Logout a user"""
     return jsonify({'message': 'Logged out successfully'})
 
-@app.route('/api/auth/me', methods=['GET'])
+@api.route('/api/auth/me', methods=['GET'])
 @token_required
 def get_current_user(current_user):
     """Get current user info"""
     return jsonify(current_user.to_dict())
 
-@app.route('/api/products', methods=['GET'])
+@api.route('/api/auth/webhook', methods=['PUT'])
+@token_required
+def set_webhook(current_user):
+    """Set (or clear with null) the URL the webhook alert channel POSTs this user's alerts to"""
+    data = request.json or {}
+    url = data.get('url') or None
+    if url is not None:
+        parts = urlsplit(url) if isinstance(url, str) else None
+        if not parts or parts.scheme not in ('http', 'https') or not parts.netloc or len(url) > 500:
+            return jsonify({'error': 'url must be an http(s) URL of at most 500 characters'}), 400
+        try:
+            # Alerts are POSTed from the server, so internal addresses are refused
+            check_webhook_url(url)
+        except UnsafeWebhookURL as e:
+            return jsonify({'error': str(e)}), 400
+
+    current_user.webhook_url = url
+    db.session.commit()
+    return jsonify(current_user.to_dict())
+
+@api.route('/api/products', methods=['GET'])
 @token_required
 def get_products(current_user):
-    """Get all tracked products for current user"""
+    """Get tracked products for current user
+    
+    Query parameters: fields (comma separated columns, default everything but
+    description), limit (page size, up to 500) and cursor (the next_cursor of
+    the previous page). Without limit or cursor the whole list is returned as
+    before; with them the response is {"items": [...], "next_cursor": ...}.
+    """
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_LIST_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    fields = ['id'] + [field for field in (fields or PRODUCT_LIST_FIELDS) if field != 'id']
+    
+    # Select only the requested columns; no ORM objects are built
+    query = db.session.query(*[getattr(Product, field) for field in fields]).filter(
+        Product.user_id == current_user.id
+    ).order_by(Product.id)
+    
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return jsonify([dict(zip(fields, row)) for row in query])
+    
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            # Keyset pagination: seek past the last id instead of OFFSET
+            query = query.filter(Product.id > int(cursor))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    rows = query.limit(limit + 1).all()
+    items = [dict(zip(fields, row)) for row in rows[:limit]]
+    next_cursor = str(items[-1]['id']) if len(rows) > limit else None
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@api.route('/api/products/search', methods=['GET'])
+@token_required
+def search_products_endpoint(current_user):
+    """Full-text search over the names and descriptions of the user's products
+    
+    Query parameters: q (words to match, prefixes allowed), limit (page size,
+    up to 100) and cursor (the next_cursor of the previous page). Responds
+    with {"items": [...], "next_cursor": ...}, best matches first.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    try:
+        # Results are ranked, so the cursor is a position in the ranking
+        offset = int(request.args.get('cursor') or 0)
+        if offset < 0:
+            raise ValueError(offset)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    ids = search_products(current_user.id, query, limit + 1, offset)
+    fields = PRODUCT_LIST_FIELDS
+    rows = {
+        row[0]: row
+        for row in db.session.query(*[getattr(Product, field) for field in fields]).filter(Product.id.in_(ids[:limit]))
+    }
+    items = [dict(zip(fields, rows[product_id])) for product_id in ids[:limit] if product_id in rows]
+    next_cursor = str(offset + limit) if len(ids) > limit else None
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@api.route('/api/products/analytics', methods=['GET'])
+@token_required
+def get_products_analytics_endpoint(current_user):
+    """Get price statistics for all tracked products of the current user"""
+    from analytics import get_products_analytics
     products = Product.query.filter_by(user_id=current_user.id).all()
-    return jsonify([product.to_dict() for product in products])
+    stats = get_products_analytics(products)
+    
+    return jsonify([
+        {'product_id': product.id, **stats.get(product.id, {'current_price': product.current_price, 'data_points': 0})}
+        for product in products
+    ])
 
-@app.route('/api/products/<int:product_id>', methods=['GET'])
+@api.route('/api/products/quarantined', methods=['GET'])
+@token_required
+def get_quarantined_products(current_user):
+    """List the user's products whose refreshes are backed off or whose listing looks dead"""
+    products = Product.query.filter(
+        Product.user_id == current_user.id,
+        Product.scrape_status.in_(QUARANTINE_STATUSES)
+    ).order_by(Product.next_check_at).all()
+    
+    return jsonify(QUARANTINE_PROJECTION.rows(products))
+
+@api.route('/api/products/<int:product_id>', methods=['GET'])
 @token_required
 def get_product(current_user, product_id):
     """Get a specific product by ID"""
     product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
-        
+    
+    record_view(product)
     return jsonify(product.to_dict())
 
-@app.route('/api/products', methods=['POST'])
+@api.route('/api/products', methods=['POST'])
 @token_required
 def add_product(current_user):
     """Add a new product to track"""
+    from scraper import AmazonScraper
+    from history_store import record_prices
     data = request.json
     
     if not data or 'url' not in data:
@@ -210,6 +407,8 @@ def add_product(current_user):
         description=product_data['description'],
         rating=product_data['rating'],
         in_stock=product_data['in_stock'],
+        baseline_price=product_data['current_price'],
+        page_fingerprint=product_data['fingerprint'],
         last_updated=get_ist_time()
     )
     
@@ -217,40 +416,115 @@ def add_product(current_user):
     db.session.commit()
     
     # Add initial price history entry
-    price_history = PriceHistory(
-        product_id=product.id,
-        price=product_data['current_price']
-    )
-    
-    db.session.add(price_history)
+    record_prices([{'product_id': product.id, 'price': product_data['current_price']}])
     db.session.commit()
     
     return jsonify(product.to_dict()), 201
 
-@app.route('/api/products/<int:product_id>', methods=['DELETE'])
+@api.route('/api/products/<int:product_id>', methods=['DELETE'])
 @token_required
 def delete_product(current_user, product_id):
     """Delete a product and its related data"""
+    from history_store import delete_product_history
     product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
         
     # Delete related price history
-    PriceHistory.query.filter_by(product_id=product_id).delete()
+    delete_product_history([product_id])
     
     # Delete related price alerts
     PriceAlert.query.filter_by(product_id=product_id).delete()
     
+    # Drop it from the deals list; the next detection run re-adds the deal
+    # if another user still tracks the same listing
+    Deal.query.filter_by(product_id=product_id).delete()
+    
     # Delete product
     db.session.delete(product)
     db.session.commit()
+    alert_index.remove_product(product_id)
     
     return jsonify({'success': True, 'message': 'Product deleted'})
 
-@app.route('/api/products/<int:product_id>/history', methods=['GET'])
+def downsample(timestamps, prices, max_points):
+    """Keep at most max_points evenly spaced samples, always including the first and last"""
+    count = len(prices)
+    if not max_points or count <= max_points:
+        return timestamps, prices
+    if max_points == 1:
+        return timestamps[-1:], prices[-1:]
+    step = (count - 1) / (max_points - 1)
+    indices = sorted({round(i * step) for i in range(max_points)})
+    return [timestamps[i] for i in indices], [prices[i] for i in indices]
+
+@api.route('/api/products/history', methods=['GET'])
+@token_required
+def get_price_history_batch(current_user):
+    """Get price history for several products in one request
+    
+    Query parameters: ids (comma separated, up to 200), days (default 30) and
+    optional max_points to downsample each series. Each series is returned
+    as parallel arrays of epoch-millisecond timestamps and prices.
+    """
+    from history_store import load_history
+    from series_cache import get_series_cache
+    try:
+        product_ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of product IDs'}), 400
+    if not product_ids:
+        return jsonify({'error': 'ids is required'}), 400
+    if len(product_ids) > 200:
+        return jsonify({'error': 'At most 200 products per request'}), 400
+    
+    days = request.args.get('days', 30, type=int)
+    if days <= 0:
+        days = 30
+    max_points = request.args.get('max_points', 0, type=int)
+    
+    cutoff_date = get_ist_time() - timedelta(days=days)
+    
+    # Ownership is enforced by the join, so foreign ids simply return nothing
+    owned_ids = {
+        product_id for product_id, in db.session.query(Product.id).filter(
+            Product.id.in_(product_ids),
+            Product.user_id == current_user.id
+        )
+    }
+    series = {product_id: ([], []) for product_id in owned_ids}
+    series_cache = get_series_cache()
+    cached = series_cache.read(owned_ids, cutoff_date) if series_cache else None
+    if cached is not None:
+        pids, _, timestamps, prices = cached
+        epoch_ms = timestamps.astype('datetime64[ms]').astype('int64')
+        ordered_ids = sorted(owned_ids)
+        bounds = list(pids.searchsorted(ordered_ids)) + [len(pids)]
+        for i, product_id in enumerate(ordered_ids):
+            series[product_id] = (epoch_ms[bounds[i]:bounds[i + 1]].tolist(), prices[bounds[i]:bounds[i + 1]].tolist())
+    else:
+        for _, product_id, price, timestamp in load_history(owned_ids, cutoff_date):
+            timestamps, prices = series[product_id]
+            timestamps.append(int(timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000) if timestamp else None)
+            prices.append(price)
+    
+    result = {}
+    for product_id, (timestamps, prices) in series.items():
+        timestamps, prices = downsample(timestamps, prices, max_points)
+        result[str(product_id)] = {'timestamps': timestamps, 'prices': prices}
+    
+    return jsonify({
+        'days': days,
+        'series': result,
+        'missing': [product_id for product_id in product_ids if product_id not in owned_ids]
+    })
+
+@api.route('/api/products/<int:product_id>/history', methods=['GET'])
 @token_required
 def get_price_history(current_user, product_id):
     """Get price history for a product"""
+    from history_store import load_history
+    from series_cache import get_series_cache
     # Check if product exists and belongs to user
     product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
     if not product:
@@ -264,43 +538,101 @@ def get_price_history(current_user, product_id):
     cutoff_date = get_ist_time() - timedelta(days=days)
     
     # Query price history
-    history = PriceHistory.query.filter_by(product_id=product_id).filter(
-        PriceHistory.timestamp >= cutoff_date
-    ).order_by(PriceHistory.timestamp).all()
+    series_cache = get_series_cache()
+    cached = series_cache.read([product_id], cutoff_date) if series_cache else None
+    if cached is not None:
+        _, ids, timestamps, prices = cached
+        return jsonify([
+            {'id': history_id if history_id >= 0 else None, 'product_id': product_id, 'price': price, 'timestamp': timestamp}
+            for history_id, price, timestamp in zip(ids.tolist(), prices.tolist(), timestamps.tolist())
+        ])
     
-    return jsonify([entry.to_dict() for entry in history])
+    history = load_history([product_id], cutoff_date)
+    
+    return jsonify(PRICE_HISTORY_PROJECTION.rows(history))
+
+def parse_export_filters(since, until):
+    """ISO date/datetime bounds (stored UTC times) for an export; raises ValueError"""
+    return {
+        'since': datetime.fromisoformat(since) if since else None,
+        'until': datetime.fromisoformat(until) if until else None
+    }
 
-@app.route('/api/products/<int:product_id>/refresh', methods=['POST'])
+@api.route('/api/export/history', methods=['GET'])
+@token_required
+def export_price_history(current_user):
+    """Stream the price history of all the user's products (or of ids) as CSV, NDJSON or Parquet
+
+    Rows are read through server-side cursors and written out batch by
+    batch, so memory use doesn't grow with the size of the export.
+    """
+    from history_export import EXPORT_FORMATS, available_formats, export_history
+    fmt = request.args.get('format', 'csv')
+    if fmt not in available_formats():
+        return jsonify({'error': f"format must be one of: {', '.join(available_formats())}"}), 400
+    try:
+        filters = parse_export_filters(request.args.get('since'), request.args.get('until'))
+        ids = request.args.get('ids')
+        if ids:
+            filters['product_ids'] = [int(value) for value in ids.split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO dates and ids a comma separated list of product IDs'}), 400
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    chunks = export_history(fmt, user_id=current_user.id, **filters)
+    return current_app.response_class(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f"attachment; filename=price-history.{extension}"}
+    )
+
+@api.route('/api/products/<int:product_id>/refresh', methods=['POST'])
 @token_required
 def refresh_product(current_user, product_id):
     """Manually refresh product data"""
+    from scraper import AmazonScraper, is_parse_failure, record_scrape_failure, record_scrape_success
+    from deals import update_baseline
+    from history_store import record_prices
+    from email_service import check_product_alerts
     product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
         
     scraper = AmazonScraper()
-    product_data = scraper.scrape_product(product.url)
+    product_data = scraper.scrape_product(product.url, previous_fingerprint=product.page_fingerprint)
+    if is_parse_failure(product_data):
+        product_data = {'error': 'No product name or price found on page', 'status_code': 'parse'}
     
     if 'error' in product_data:
+        if record_scrape_failure(product, product_data):
+            db.session.commit()
         return jsonify({'error': product_data['error']}), 400
+    
+    # A successful manual refresh also lifts any quarantine
+    record_scrape_success(product)
+    if product_data.get('unchanged'):
+        # Nothing price-relevant changed since the last fetch
+        product.last_updated = get_ist_time()
+        db.session.commit()
+        return jsonify(product.to_dict())
         
     # Update product
+    product.page_fingerprint = product_data['fingerprint']
     product.name = product_data['name'] or product.name
     product.image = product_data['image'] or product.image
     product.last_updated = get_ist_time()
     
     # Only add price history if price has changed
+    price_dropped = False
     if product_data['current_price'] and product_data['current_price'] != product.current_price:
         old_price = product.current_price
         product.current_price = product_data['current_price']
+        product.baseline_price = update_baseline(product.baseline_price, product_data['current_price'])
         
         # Add to price history
-        price_history = PriceHistory(product_id=product.id, price=product_data['current_price'])
-        db.session.add(price_history)
+        record_prices([{'product_id': product.id, 'price': product_data['current_price']}])
         
-        # Check alerts immediately if price decreased
-        if product_data['current_price'] < old_price:
-            check_price_alerts()
+        price_dropped = old_price is not None and product_data['current_price'] < old_price
     
     # Update additional attributes if available
     if product_data['original_price']:
@@ -316,12 +648,17 @@ def refresh_product(current_user, product_id):
         
     db.session.commit()
     
+    # Check alerts immediately if price decreased
+    if price_dropped:
+        check_product_alerts(product)
+    
     return jsonify(product.to_dict())
 
-@app.route('/api/alerts', methods=['POST'])
+@api.route('/api/alerts', methods=['POST'])
 @token_required
 def create_alert(current_user):
     """Create a price alert for a product"""
+    from email_service import check_product_alerts
     data = request.json
     
     required_fields = ['product_id', 'target_price']
@@ -344,14 +681,139 @@ def create_alert(current_user):
     
     db.session.add(alert)
     db.session.commit()
+    alert_index.add(alert.id, alert.product_id, alert.target_price)
     
     # Check immediately if the alert should be triggered
-    if product.current_price <= alert.target_price:
-        check_price_alerts()
+    if product.current_price is not None and product.current_price <= alert.target_price:
+        check_product_alerts(product)
     
     return jsonify(alert.to_dict()), 201
 
-@app.route('/api/alerts/<int:alert_id>', methods=['DELETE'])
+@api.route('/api/alerts/suggestions', methods=['GET'])
+@token_required
+def get_alert_suggestions(current_user):
+    """Suggested target prices (30-day low and percentiles) for up to 500 products (ids)"""
+    from analytics import suggest_target_prices
+    try:
+        product_ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of product IDs'}), 400
+    if len(product_ids) > 500:
+        return jsonify({'error': 'At most 500 products per request'}), 400
+
+    query = db.session.query(Product.id).filter(Product.user_id == current_user.id)
+    if product_ids:
+        query = query.filter(Product.id.in_(product_ids))
+    owned_ids = [product_id for product_id, in query.limit(500)]
+    suggestions = suggest_target_prices(owned_ids)
+    return jsonify({str(product_id): suggestions.get(product_id) for product_id in owned_ids})
+
+@api.route('/api/alerts/bulk', methods=['POST'])
+@token_required
+def bulk_upsert_alerts(current_user):
+    """Create or update up to 500 alerts in one transaction
+
+    Body: {"alerts": [{"product_id": 1, "target_price": 999.0}, {"id": 7,
+    "target_price": "p10_30d"}, ...]}. Items with an id update that alert
+    (target_price, and is_active if given); the others create one. A
+    target_price can name a suggestion (see /api/alerts/suggestions)
+    instead of a number. Nothing is written unless every item is valid, and
+    only the products the alerts are on are checked afterwards.
+    """
+    from analytics import TARGET_SUGGESTIONS, suggest_target_prices
+    from email_service import check_products_alerts
+    data = request.json or {}
+    items = data.get('alerts')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'alerts must be a non-empty list'}), 400
+    if len(items) > 500:
+        return jsonify({'error': 'At most 500 alerts per request'}), 400
+    if not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'Every alert must be an object'}), 400
+
+    # One query each for the alerts being updated and the products involved
+    alert_ids = {item['id'] for item in items if isinstance(item.get('id'), int)}
+    existing = {
+        alert.id: alert for alert in PriceAlert.query.filter(
+            PriceAlert.id.in_(alert_ids), PriceAlert.user_id == current_user.id
+        )
+    } if alert_ids else {}
+    product_ids = {item['product_id'] for item in items if isinstance(item.get('product_id'), int)}
+    product_ids.update(alert.product_id for alert in existing.values())
+    products = {
+        product.id: product for product in Product.query.filter(
+            Product.id.in_(product_ids), Product.user_id == current_user.id
+        )
+    } if product_ids else {}
+
+    named = any(isinstance(item.get('target_price'), str) for item in items)
+    suggestions = suggest_target_prices(list(products)) if named else {}
+
+    errors = []
+    changes = []
+    for position, item in enumerate(items):
+        alert = existing.get(item['id']) if isinstance(item.get('id'), int) else None
+        if 'id' in item and alert is None:
+            errors.append({'index': position, 'error': 'Alert not found'})
+            continue
+        product_id = alert.product_id if alert else item.get('product_id')
+        if not isinstance(product_id, int) or product_id not in products:
+            errors.append({'index': position, 'error': 'Product not found'})
+            continue
+
+        target_price = item.get('target_price')
+        if isinstance(target_price, str):
+            if target_price not in TARGET_SUGGESTIONS:
+                errors.append({'index': position, 'error': f"Unknown suggestion: {target_price}"})
+                continue
+            target_price = suggestions.get(product_id, {}).get(target_price)
+            if target_price is None:
+                errors.append({'index': position, 'error': 'No recent price history to suggest a target from'})
+                continue
+        elif target_price is None and alert is not None:
+            target_price = alert.target_price
+        if isinstance(target_price, bool) or not isinstance(target_price, (int, float)) or target_price <= 0:
+            errors.append({'index': position, 'error': 'target_price must be a positive number or a suggestion name'})
+            continue
+        changes.append((alert, product_id, float(target_price), bool(item.get('is_active', True if alert is None else alert.is_active))))
+
+    if errors:
+        return jsonify({'error': 'No alerts were saved', 'errors': errors}), 400
+
+    alerts = []
+    for alert, product_id, target_price, is_active in changes:
+        if alert is None:
+            alert = PriceAlert(user_id=current_user.id, product_id=product_id)
+            db.session.add(alert)
+        if alert.target_price != target_price or (is_active and not alert.is_active):
+            # Re-armed: the next trigger goes out on every channel again
+            alert.reset_delivery()
+        alert.target_price = target_price
+        alert.is_active = is_active
+        alerts.append(alert)
+    # Ids and defaults are known after the flush; reading them after the
+    # commit would reload every alert and product one by one
+    db.session.flush()
+    result = [alert.to_dict() for alert in alerts]
+    # Only products whose current price already meets one of these targets
+    affected = sorted({
+        alert.product_id for alert in alerts
+        if alert.is_active and products[alert.product_id].current_price is not None
+        and products[alert.product_id].current_price <= alert.target_price
+    })
+    db.session.commit()
+
+    for entry in result:
+        if entry['is_active']:
+            alert_index.add(entry['id'], entry['product_id'], entry['target_price'])
+        else:
+            alert_index.remove(entry['id'])
+    if affected:
+        check_products_alerts([products[product_id] for product_id in affected])
+
+    return jsonify({'alerts': result, 'checked_products': len(affected)})
+
+@api.route('/api/alerts/<int:alert_id>', methods=['DELETE'])
 @token_required
 def delete_alert(current_user, alert_id):
     """Delete a price alert"""
@@ -361,10 +823,11 @@ def delete_alert(current_user, alert_id):
         
     db.session.delete(alert)
     db.session.commit()
+    alert_index.remove(alert_id)
     
     return jsonify({'success': True, 'message': 'Alert deleted'})
 
-@app.route('/api/products/<int:product_id>/alerts', methods=['GET'])
+@api.route('/api/products/<int:product_id>/alerts', methods=['GET'])
 @token_required
 def get_product_alerts(current_user, product_id):
     """Get all alerts for a specific product"""
@@ -377,10 +840,11 @@ def get_product_alerts(current_user, product_id):
     
     return jsonify([alert.to_dict() for alert in alerts])
 
-@app.route('/api/alerts/test', methods=['POST'])
+@api.route('/api/alerts/test', methods=['POST'])
 @token_required
 def test_email_alert(current_user):
     """Test the email alert functionality"""
+    from email_service import send_email_alert
     subject = "PricePulse Test Alert"
     message = f"""
     <html>
@@ -397,88 +861,90 @@ def test_email_alert(current_user):
         return jsonify({'success': True, 'message': 'Test email sent successfully'})
     else:
         return jsonify({'error': 'Failed to send test email'}), 500
-@app.route('/api/products/<int:product_id>/alternatives', methods=['GET'])
+@api.route('/api/products/<int:product_id>/alternatives', methods=['GET'])
 @token_required
 def get_product_alternatives(current_user, product_id):
-    """Get alternative products from other platforms using LLM"""
+    """Get alternative products from other platforms, as last computed by the comparisons job"""
     # Check if product exists and belongs to user
     product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    try:
-        # Initialize LLM service
-        llm_service = LLMService()
-        
-        # Extract metadata from product
-        metadata = llm_service.extract_product_metadata(
-            product.name, 
-            product.description or ""
-        )
-        
-        # Search across platforms
-        searcher = MultiPlatformSearcher()
-        alternatives = searcher.search_across_platforms(metadata, product.name)
-        
+    record_view(product)
+    comparison = get_comparison(product.url)
+    if comparison is None:
+        # Same shape as a computed result, so clients can render it as is
         return jsonify({
-            'metadata': metadata,
-            'alternatives': alternatives,
-            'total_found': len(alternatives)
-        })
-        
-    except Exception as e:
-        print(f"Error finding alternatives: {e}")
-        return jsonify({'error': 'Failed to find alternatives'}), 500
+            'metadata': None,
+            'alternatives': [],
+            'total_found': 0,
+            'computed_at': None,
+            'stale': False,
+            'pending': True
+        }), 202
+    
+    return jsonify({
+        'metadata': comparison.product_metadata,
+        'alternatives': comparison.alternatives,
+        'total_found': len(comparison.alternatives),
+        'computed_at': comparison.computed_at,
+        'stale': is_stale(comparison),
+        'pending': False
+    })
 
-@app.route('/api/products/<int:product_id>/compare', methods=['GET'])
+@api.route('/api/products/<int:product_id>/compare', methods=['GET'])
 @token_required
 def compare_product_prices(current_user, product_id):
-    """Compare product prices across platforms"""
+    """Compare product prices across platforms using the stored comparison"""
     # Check if product exists and belongs to user
     product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    try:
-        # Get alternatives
-        llm_service = LLMService()
-        metadata = llm_service.extract_product_metadata(product.name, product.description or "")
-        
-        searcher = MultiPlatformSearcher()
-        alternatives = searcher.search_across_platforms(metadata, product.name)
-        
-        # Create comparison data
-        comparison = {
-            'primary_product': {
-                'platform': 'Amazon',
-                'name': product.name,
-                'price': product.current_price,
-                'currency': product.currency,
-                'url': product.url,
-                'image': product.image
-            },
-            'alternatives': alternatives,
-            'cheapest': None,
-            'savings': 0
-        }
-        
-        # Find cheapest alternative
-        if alternatives:
-            cheapest = min(alternatives, key=lambda x: x.get('price', float('inf')))
-            if cheapest['price'] < product.current_price:
-                comparison['cheapest'] = cheapest
-                comparison['savings'] = product.current_price - cheapest['price']
-        
-        return jsonify(comparison)
-        
-    except Exception as e:
-        print(f"Error comparing prices: {e}")
-        return jsonify({'error': 'Failed to compare prices'}), 500
+    record_view(product)
+    comparison = get_comparison(product.url)
+    alternatives = comparison.alternatives if comparison else []
+    result = {
+        'primary_product': {
+            'platform': 'Amazon',
+            'name': product.name,
+            'price': product.current_price,
+            'currency': product.currency,
+            'url': product.url,
+            'image': product.image
+        },
+        'alternatives': alternatives,
+        'cheapest': None,
+        'savings': 0,
+        'computed_at': comparison.computed_at if comparison else None,
+        'stale': is_stale(comparison) if comparison else False,
+        # Not computed yet: no alternatives until the comparisons job gets to it
+        'pending': comparison is None
+    }
+    
+    # Savings are against the current Amazon price, not the one at compute time
+    if alternatives and product.current_price:
+        cheapest = min(alternatives, key=lambda x: x.get('price', float('inf')))
+        if cheapest.get('price', float('inf')) < product.current_price:
+            result['cheapest'] = cheapest
+            result['savings'] = product.current_price - cheapest['price']
+    
+    return jsonify(result), 202 if comparison is None else 200
 
-@app.route('/api/llm/test', methods=['POST'])
+@api.route('/api/deals', methods=['GET'])
+@token_required
+def get_deals(current_user):
+    """Get the biggest price drops across all tracked listings"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    deals = Deal.query.order_by(Deal.rank).limit(limit).all()
+    
+    return jsonify([deal.to_dict() for deal in deals])
+
+@api.route('/api/llm/test', methods=['POST'])
 @token_required
 def test_llm_service(current_user):
     """Test the LLM service with a sample product"""
+    from llm_service import LLMService
     try:
         data = request.json
         product_name = data.get('product_name', 'Samsung Galaxy M14')
@@ -497,12 +963,106 @@ def test_llm_service(current_user):
             'status': 'error',
             'error': str(e)
         }), 500
+
+@api.cli.command('reprocess-snapshots')
+@click.option('--snapshot-dir', default=None, help='Snapshot store to read (defaults to SNAPSHOT_DIR)')
+@click.option('--all', 'all_snapshots', is_flag=True, help='Reprocess every stored fetch, not just the latest per URL')
+@click.option('--apply', is_flag=True, help='Write the re-extracted fields back to tracked products')
+def reprocess_snapshots_command(snapshot_dir, all_snapshots, apply):
+    """Rerun extraction over stored page snapshots offline"""
+    from scraper import reprocess_snapshots
+    from snapshot_store import get_snapshot_store, SnapshotStore
+    store = SnapshotStore(snapshot_dir) if snapshot_dir else get_snapshot_store()
+    if not store:
+        raise click.ClickException('No snapshot store configured - set SNAPSHOT_DIR or pass --snapshot-dir')
+    
+    results = reprocess_snapshots(store, latest_only=not all_snapshots, apply=apply)
+    for data in results:
+        click.echo(json.dumps(data, default=str, ensure_ascii=False))
+    click.echo(f"Reprocessed {len(results)} snapshots", err=True)
+
+@api.cli.command('apply-history-retention')
+@click.option('--months', type=int, default=None, help='Months of raw history to keep (defaults to HISTORY_RETENTION_MONTHS)')
+@click.option('--archive-dir', default=None, help='Where to write compressed partition archives (defaults to HISTORY_ARCHIVE_DIR)')
+def apply_history_retention_command(months, archive_dir):
+    """Aggregate, archive and drop price history partitions past retention"""
+    from history_store import apply_retention
+    retired = apply_retention(retention_months=months, archive_dir=archive_dir)
+    for partition in retired:
+        click.echo(json.dumps(partition))
+    click.echo(f"Retired {len(retired)} partitions", err=True)
+
+@api.cli.command('rebuild-series-cache')
+def rebuild_series_cache_command():
+    """Rebuild the shared price series cache from the database"""
+    from series_cache import get_series_cache
+    series_cache = get_series_cache()
+    if not series_cache:
+        raise click.ClickException('No series cache configured - set SERIES_CACHE_DIR')
+    series_cache.rebuild()
+
+@api.cli.command('precompute-comparisons')
+@click.option('--daily-queries', type=int, default=None, help='Daily Custom Search budget (defaults to CSE_DAILY_QUERIES)')
+def precompute_comparisons_command(daily_queries):
+    """Refresh stored cross-platform comparisons within the daily search quota"""
+    from comparisons import precompute_comparisons
+    click.echo(json.dumps(precompute_comparisons(daily_queries=daily_queries)))
+
+@api.cli.command('export-history')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'parquet']), default='csv')
+@click.option('--output', '-o', default='-', help='File to write (default: stdout)')
+@click.option('--user-id', type=int, default=None, help="Only this user's products (default: the whole catalog)")
+@click.option('--since', default=None, help='ISO date or datetime (UTC) to start from')
+@click.option('--until', default=None, help='ISO date or datetime (UTC) to stop before')
+def export_history_command(fmt, output, user_id, since, until):
+    """Stream price history to a CSV, NDJSON or Parquet file"""
+    from history_export import available_formats, export_history
+    if fmt not in available_formats():
+        raise click.ClickException('Parquet export needs pyarrow (pip install pyarrow)')
+    try:
+        filters = parse_export_filters(since, until)
+    except ValueError:
+        raise click.BadParameter('since/until must be ISO dates or datetimes')
+
+    written = 0
+    with click.open_file(output, 'wb') as stream:
+        for chunk in export_history(fmt, user_id=user_id, **filters):
+            stream.write(chunk)
+            written += len(chunk)
+    click.echo(f"Wrote {written} bytes", err=True)
+
+@api.cli.command('init-db')
+def init_db_command():
+    """Create the database schema and history partitions, migrating old history"""
+    init_schema()
+    click.echo('Database initialized', err=True)
+
+@api.cli.command('run-scheduler')
+def run_scheduler_command():
+    """Run the background jobs in this process until interrupted"""
+    # Cycle, scrape, limiter and quarantine metrics are recorded here, not in the web workers
+    port = current_app.config['SCHEDULER_METRICS_PORT']
+    if port:
+        start_metrics_server(port)
+        click.echo(f"Serving scheduler metrics on :{port}/metrics", err=True)
+    start_scheduler(current_app._get_current_object(), blocking=True)
+
 if __name__ == '__main__':
+    app = create_app({'SCHEDULER_ENABLED': False})
+    
     # Ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
     
+    # The development server sets up its own database
+    with app.app_context():
+        init_schema()
+    
+    # Only the reloader's serving process runs the jobs
+    if APP_CONFIG['SCHEDULER_ENABLED'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler(app)
+    
     # Start the Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000)
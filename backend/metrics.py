@@ -0,0 +1,293 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds - covers everything from a single extractor up to a full refresh cycle
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+REGISTRY = []
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        """Drop every labelled value, e.g. before publishing a fresh snapshot"""
+        with self._lock:
+            self._values.clear()
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the wrapped block (also usable as a decorator)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serve this process's metrics at http://host:port/metrics from a daemon thread
+
+    Metrics live in the process that records them, so a process without the
+    web app (the standalone scheduler) exports its own this way.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+# Scraping
+SCRAPE_STAGE_SECONDS = Histogram(
+    'pricepulse_scrape_stage_seconds',
+    'Time spent in each stage of scraping a product page',
+    ['stage']
+)
+SCRAPE_EXTRACTOR_SECONDS = Histogram(
+    'pricepulse_scrape_extractor_seconds',
+    'Time spent in each field extractor',
+    ['extractor']
+)
+SCRAPE_REQUESTS = Counter(
+    'pricepulse_scrape_requests_total',
+    'Product page fetches by outcome status code',
+    ['status']
+)
+SCRAPE_RATE_LIMIT = Gauge(
+    'pricepulse_scrape_rate_limit',
+    'Requests per second currently allowed per domain by the adaptive limiter',
+    ['domain']
+)
+SCRAPE_THROTTLED = Counter(
+    'pricepulse_scrape_throttled_total',
+    "Throttling responses that cut a domain's request rate",
+    ['domain', 'reason']
+)
+FINGERPRINT_CHECKS = Counter(
+    'pricepulse_fingerprint_checks_total',
+    'Fetches compared against a stored page fingerprint'
+)
+FINGERPRINT_SKIPS = Counter(
+    'pricepulse_fingerprint_skips_total',
+    'Fetches whose parsing was skipped because the fingerprint matched'
+)
+
+
+def get_fingerprint_stats():
+    """Return how often unchanged pages let the scraper skip parsing"""
+    checks = FINGERPRINT_CHECKS.value()
+    skips = FINGERPRINT_SKIPS.value()
+    return {
+        'checks': checks,
+        'skips': skips,
+        'skip_rate': skips / checks if checks else 0.0
+    }
+
+
+# Refresh cycles
+CYCLE_SECONDS = Histogram(
+    'pricepulse_refresh_cycle_seconds',
+    'Duration of a full update_all_products cycle'
+)
+CYCLE_PRODUCTS = Counter(
+    'pricepulse_refresh_cycle_products_total',
+    'Products processed by refresh cycles by result',
+    ['result']
+)
+LAST_CYCLE_PRODUCTS_PER_SECOND = Gauge(
+    'pricepulse_last_refresh_cycle_products_per_second',
+    'Throughput of the most recent refresh cycle'
+)
+LAST_CYCLE_FAILURE_RATE = Gauge(
+    'pricepulse_last_refresh_cycle_failure_rate',
+    'Fraction of products that failed in the most recent refresh cycle'
+)
+LAST_CYCLE_FAILURES = Gauge(
+    'pricepulse_last_refresh_cycle_failures',
+    'Failures in the most recent refresh cycle by status code',
+    ['status']
+)
+QUARANTINED_PRODUCTS = Gauge(
+    'pricepulse_quarantined_products',
+    'Products whose refreshes are backed off (failing) or reduced to probes (dead)',
+    ['status']
+)
+
+# Alerts and notifications
+ALERT_CHECK_SECONDS = Histogram(
+    'pricepulse_alert_check_seconds',
+    'Time spent checking price alerts',
+    ['source']
+)
+EMAIL_SEND_SECONDS = Histogram(
+    'pricepulse_email_send_seconds',
+    'Time spent sending alert emails'
+)
+EMAILS_SENT = Counter(
+    'pricepulse_emails_total',
+    'Alert emails by result',
+    ['result']
+)
+WEBHOOK_EVENTS = Counter(
+    'pricepulse_webhook_events_total',
+    'Webhook alert events by result (delivered, failed, retried, dropped)',
+    ['result']
+)
+WEBHOOK_DELIVERY_SECONDS = Histogram(
+    'pricepulse_webhook_delivery_seconds',
+    'Time per webhook batch POST'
+)
+WEBHOOK_QUEUE_DEPTH = Gauge(
+    'pricepulse_webhook_queue_depth',
+    'Webhook events accepted but not yet delivered or given up on'
+)
+
+# External APIs
+EXTERNAL_CALL_SECONDS = Histogram(
+    'pricepulse_external_call_seconds',
+    'Latency of calls to external APIs',
+    ['service']
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    'pricepulse_external_call_errors_total',
+    'Failed calls to external APIs',
+    ['service']
+)
+SEARCH_QUOTA_REMAINING = Gauge(
+    'pricepulse_search_quota_remaining',
+    'Custom Search queries left in the daily budget after the last comparison precompute'
+)
+COMPARISONS_COMPUTED = Counter(
+    'pricepulse_comparisons_computed_total',
+    'Cross-platform comparisons computed by the background job'
+)
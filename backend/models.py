@@ -2,6 +2,7 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from database import db
+from serialization import Projection
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,6 +12,8 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
+    # Where the webhook alert channel POSTs this user's alerts
+    webhook_url = db.Column(db.String(500))
     
     # Relationship to products
     products = db.relationship('Product', backref='user', lazy=True)
@@ -28,63 +31,118 @@ class User(db.Model, UserMixin):
             'email': self.email,
             'name': self.name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'last_login': self.last_login.isoformat() if self.last_login else None
+            'last_login': self.last_login.isoformat() if self.last_login else None,
+            'webhook_url': self.webhook_url
         }
 
+class UserSession(db.Model):
+    """Opaque bearer token issued by the auth module"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    session_token = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    
+    user = db.relationship('User')
+    
+    def is_expired(self):
+        return datetime.utcnow() >= self.expires_at
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     url = db.Column(db.String(500))
     name = db.Column(db.String(200))
     image = db.Column(db.String(500))
     current_price = db.Column(db.Float)
     original_price = db.Column(db.Float)
     currency = db.Column(db.String(10), default="₹")
-    description = db.Column(db.Text, nullable=True)
+    # Unbounded text is only loaded when accessed (detail view, LLM lookups)
+    description = db.deferred(db.Column(db.Text, nullable=True))
     rating = db.Column(db.Float, nullable=True)
     in_stock = db.Column(db.Boolean, default=True)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Relationship to price history
-    price_history = db.relationship('PriceHistory', backref='product', lazy=True)
+    page_fingerprint = db.Column(db.String(40), nullable=True)
+    baseline_price = db.Column(db.Float, nullable=True)
+    # Scrape health: 'active', 'failing' (backing off) or 'dead' (probed only)
+    scrape_status = db.Column(db.String(10), default='active', nullable=False)
+    failure_count = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(200), nullable=True)
+    # Refresh cycles skip the product until then; None means every cycle
+    next_check_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Detail and comparison views; ranks listings for comparison precompute
+    view_count = db.Column(db.Integer, default=0, nullable=False)
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'url': self.url,
-            'name': self.name,
-            'image': self.image,
-            'current_price': self.current_price,
-            'original_price': self.original_price,
-            'currency': self.currency,
-            'description': self.description,
-            'rating': self.rating,
-            'in_stock': self.in_stock,
-            'last_updated': self.last_updated.isoformat() if self.last_updated else None
-        }
+        return PRODUCT_PROJECTION.row(self)
 
-class PriceHistory(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
-    price = db.Column(db.Float)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+# Column projections used for JSON responses; datetimes are encoded by the JSON provider
+PRODUCT_PROJECTION = Projection(
+    'id', 'user_id', 'url', 'name', 'image', 'current_price', 'original_price',
+    'currency', 'description', 'rating', 'in_stock', 'last_updated', 'scrape_status'
+)
+
+# Columns the list endpoint may return; description is left to the detail view
+PRODUCT_LIST_FIELDS = tuple(column for column in PRODUCT_PROJECTION.columns if column != 'description')
+
+# Products whose refreshes are currently backed off
+QUARANTINE_STATUSES = ('failing', 'dead')
+QUARANTINE_PROJECTION = Projection(
+    'id', 'name', 'url', 'scrape_status', 'failure_count', 'last_error', 'next_check_at', 'last_updated'
+)
+
+# Raw price history lives in monthly partitions managed by history_store;
+# rows come back with these attributes
+PRICE_HISTORY_PROJECTION = Projection('id', 'product_id', 'price', 'timestamp')
+
+class PriceHistoryDaily(db.Model):
+    """Daily rollup of raw history from partitions past the retention window"""
+    __table_args__ = (db.UniqueConstraint('product_id', 'day'),)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'product_id': self.product_id,
-            'price': self.price,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None
-        }
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    avg_price = db.Column(db.Float)
+    close_price = db.Column(db.Float)
+    samples = db.Column(db.Integer)
 
 class PriceAlert(db.Model):
+    # Request paths look up a product's active alerts directly
+    __table_args__ = (db.Index('ix_price_alert_product_active', 'product_id', 'is_active'),)
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
     target_price = db.Column(db.Float)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Delivery of the current trigger: comma-separated channels that took it,
+    # and the failed rounds so far, so a retry only goes to the channels
+    # that failed. Cleared when the alert is re-armed.
+    sent_channels = db.Column(db.String(100), default='', nullable=False)
+    failed_attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_failed_at = db.Column(db.DateTime)
+    
+    def channels_sent(self):
+        return set(filter(None, (self.sent_channels or '').split(',')))
+    
+    def mark_sent(self, channel):
+        self.sent_channels = ','.join(sorted(self.channels_sent() | {channel}))
+    
+    def record_failure(self, channel=None):
+        """Count a failed delivery round; channel, if given, has to be sent again"""
+        if channel is not None:
+            self.sent_channels = ','.join(sorted(self.channels_sent() - {channel}))
+        self.failed_attempts = (self.failed_attempts or 0) + 1
+        self.last_failed_at = datetime.utcnow()
+    
+    def reset_delivery(self):
+        self.sent_channels = ''
+        self.failed_attempts = 0
+        self.last_failed_at = None
     
     def to_dict(self):
         return {
@@ -94,4 +152,46 @@ class PriceAlert(db.Model):
             'target_price': self.target_price,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class Deal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
+    rank = db.Column(db.Integer, index=True)
+    name = db.Column(db.String(200))
+    image = db.Column(db.String(500))
+    currency = db.Column(db.String(10), default="₹")
+    current_price = db.Column(db.Float)
+    baseline_price = db.Column(db.Float)
+    drop_pct = db.Column(db.Float)
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'rank': self.rank,
+            'url': self.url,
+            'name': self.name,
+            'image': self.image,
+            'currency': self.currency,
+            'current_price': self.current_price,
+            'baseline_price': self.baseline_price,
+            'drop_pct': self.drop_pct,
+            'detected_at': self.detected_at.isoformat() if self.detected_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class Comparison(db.Model):
+    """Cross-platform search results for a listing, precomputed by the comparisons job"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    product_metadata = db.Column(db.JSON)
+    alternatives = db.Column(db.JSON)
+    queries_used = db.Column(db.Integer, default=0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SearchQuotaUsage(db.Model):
+    """Custom Search queries sent per day, shared by every worker"""
+    day = db.Column(db.Date, primary_key=True)
+    queries = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,65 @@
+import cProfile
+import os
+import time
+from flask import request, g
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILING_CONFIG = {
+    'PROFILING_ENABLED': os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    'PROFILER': os.getenv('PROFILER', 'cprofile'),
+    'PROFILE_DIR': os.getenv('PROFILE_DIR', 'profiles')
+}
+
+
+def init_profiling(app):
+    """Register the opt-in per-request profiler
+
+    Only active when PROFILING_ENABLED is set; a request is then profiled when
+    it carries an ``X-Profile: 1`` header or a ``_profile=1`` query parameter.
+    The profile is written to PROFILE_DIR and its path returned in the
+    ``X-Profile-File`` response header.
+    """
+    if not PROFILING_CONFIG['PROFILING_ENABLED']:
+        return
+
+    profile_dir = PROFILING_CONFIG['PROFILE_DIR']
+    if not os.path.isabs(profile_dir):
+        profile_dir = os.path.join(app.instance_path, profile_dir)
+    os.makedirs(profile_dir, exist_ok=True)
+
+    use_pyinstrument = PROFILING_CONFIG['PROFILER'] == 'pyinstrument' and pyinstrument is not None
+
+    @app.before_request
+    def start_profiler():
+        if request.headers.get('X-Profile') != '1' and request.args.get('_profile') != '1':
+            return
+        if use_pyinstrument:
+            g.profiler = pyinstrument.Profiler()
+            g.profiler.start()
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}-{os.getpid()}"
+        if use_pyinstrument:
+            profiler.stop()
+            path = os.path.join(profile_dir, f"{name}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            path = os.path.join(profile_dir, f"{name}.prof")
+            profiler.dump_stats(path)
+
+        response.headers['X-Profile-File'] = path
+        return response
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+from metrics import SCRAPE_RATE_LIMIT, SCRAPE_THROTTLED
+
+RATE_LIMIT_CONFIG = {
+    # Requests per second per domain to start from, and the bounds AIMD moves between
+    'SCRAPE_RATE_INITIAL': float(os.getenv('SCRAPE_RATE_INITIAL', 0.5)),
+    'SCRAPE_RATE_MIN': float(os.getenv('SCRAPE_RATE_MIN', 0.05)),
+    'SCRAPE_RATE_MAX': float(os.getenv('SCRAPE_RATE_MAX', 5)),
+    # Requests per second gained per second of clean responses
+    'SCRAPE_RATE_INCREASE': float(os.getenv('SCRAPE_RATE_INCREASE', 0.05)),
+    # Rate multiplier on a 429/503 or captcha page
+    'SCRAPE_RATE_DECREASE': float(os.getenv('SCRAPE_RATE_DECREASE', 0.5)),
+    # Requests that may go out back to back after an idle period
+    'SCRAPE_BURST': float(os.getenv('SCRAPE_BURST', 1))
+}
+
+
+class _Bucket:
+    __slots__ = ('rate', 'tokens', 'updated', 'last_decrease')
+
+    def __init__(self, rate, tokens):
+        self.rate = rate
+        self.tokens = tokens
+        self.updated = time.monotonic()
+        self.last_decrease = 0.0
+
+
+class AIMDRateLimiter:
+    """Token bucket per domain whose refill rate adapts with AIMD
+
+    Clean responses raise the domain's rate linearly over time (each adds
+    increase / rate, so a second's worth adds about ``increase``). A throttle
+    signal multiplies it down and empties the bucket, so all callers sharing
+    the limiter converge on the highest rate the site tolerates. Throttle
+    signals arriving within one request interval of the last cut (responses
+    to requests already in flight) are not counted again.
+    """
+
+    def __init__(self, initial_rate=RATE_LIMIT_CONFIG['SCRAPE_RATE_INITIAL'],
+                 min_rate=RATE_LIMIT_CONFIG['SCRAPE_RATE_MIN'],
+                 max_rate=RATE_LIMIT_CONFIG['SCRAPE_RATE_MAX'],
+                 increase=RATE_LIMIT_CONFIG['SCRAPE_RATE_INCREASE'],
+                 decrease=RATE_LIMIT_CONFIG['SCRAPE_RATE_DECREASE'],
+                 burst=RATE_LIMIT_CONFIG['SCRAPE_BURST']):
+        self.initial_rate = min(max(initial_rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def acquire(self, domain):
+        """Take a token for domain, sleeping until one is available; returns the time waited"""
+        with self._lock:
+            bucket = self._bucket(domain)
+            self._refill(bucket)
+            # Reserve the token now so concurrent callers queue up behind it
+            bucket.tokens -= 1
+            wait = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def record_success(self, domain):
+        with self._lock:
+            bucket = self._bucket(domain)
+            self._refill(bucket)
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase / bucket.rate)
+            SCRAPE_RATE_LIMIT.set(bucket.rate, domain=domain)
+
+    def record_throttle(self, domain, reason):
+        with self._lock:
+            bucket = self._bucket(domain)
+            now = time.monotonic()
+            if now - bucket.last_decrease < 1 / bucket.rate:
+                return
+            self._refill(bucket)
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.last_decrease = now
+            SCRAPE_RATE_LIMIT.set(bucket.rate, domain=domain)
+        SCRAPE_THROTTLED.inc(domain=domain, reason=reason)
+
+    def rate(self, domain):
+        with self._lock:
+            return self._bucket(domain).rate
+
+    def _bucket(self, domain):
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = self._buckets[domain] = _Bucket(self.initial_rate, self.burst)
+            SCRAPE_RATE_LIMIT.set(bucket.rate, domain=domain)
+        return bucket
+
+    def _refill(self, bucket):
+        now = time.monotonic()
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+        bucket.updated = now
+
+
+# Shared by every AmazonScraper in the process (scheduler, add and refresh endpoints).
+# Each process paces itself, so the standalone scheduler and every web worker
+# each get their own rate; size SCRAPE_RATE_MAX for the number of processes.
+domain_limiter = AIMDRateLimiter()
@@ -1,14 +1,85 @@
 import requests
+import os
 import re
+import logging
+import hashlib
 from bs4 import BeautifulSoup
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
-import random
-from models import Product, PriceHistory, PriceAlert
+from urllib.parse import urlsplit
+from models import Product, QUARANTINE_STATUSES
 from database import db
+from snapshot_store import get_snapshot_store
+from rate_limiter import domain_limiter
+from deals import update_baseline, update_deals
+from history_store import record_prices
+from email_service import check_product_alerts, flush_alert_digests, EMAIL_CONFIG
+from alert_index import rebuild_alert_index
+from metrics import (
+    SCRAPE_STAGE_SECONDS, SCRAPE_EXTRACTOR_SECONDS, SCRAPE_REQUESTS,
+    FINGERPRINT_CHECKS, FINGERPRINT_SKIPS, CYCLE_SECONDS, CYCLE_PRODUCTS,
+    LAST_CYCLE_PRODUCTS_PER_SECOND, LAST_CYCLE_FAILURE_RATE, LAST_CYCLE_FAILURES,
+    QUARANTINED_PRODUCTS, get_fingerprint_stats
+)
+
+logger = logging.getLogger(__name__)
+
+# Byte markers of the page regions that carry price and availability.
+# Hashing a window after each one is far cheaper than building a soup.
+FINGERPRINT_MARKERS = (
+    b'id="productTitle"',
+    b'id="corePrice_feature_div"',
+    b'a-price-whole',
+    b'id="priceblock_ourprice"',
+    b'id="priceblock_dealprice"',
+    b'a-text-price',
+    b'id="availability"',
+    b'id="add-to-cart-button"'
+)
+FINGERPRINT_WINDOW = 512
+
+# Responses that mean the site wants us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+CAPTCHA_MARKERS = (b'/errors/validateCaptcha', b'<title dir="ltr">Robot Check</title>')
+
+FAILURE_CONFIG = {
+    # Seconds before a failing product is retried; doubles with each consecutive failure
+    'SCRAPE_BACKOFF_BASE': int(os.getenv('SCRAPE_BACKOFF_BASE', 1800)),
+    'SCRAPE_BACKOFF_MAX': int(os.getenv('SCRAPE_BACKOFF_MAX', 2 * 86400)),
+    # Failure score at which a listing is treated as dead (a 404/410 scores 2)
+    'SCRAPE_DEAD_AFTER': int(os.getenv('SCRAPE_DEAD_AFTER', 6)),
+    # Seconds between revalidation probes of a dead listing
+    'SCRAPE_DEAD_PROBE_INTERVAL': int(os.getenv('SCRAPE_DEAD_PROBE_INTERVAL', 7 * 86400))
+}
+
+# Responses that say the listing itself is gone
+GONE_STATUS_CODES = (404, 410)
+# Outcomes that say nothing about the listing (site-wide throttling, network
+# trouble); the rate limiter deals with those
+TRANSIENT_STATUSES = THROTTLE_STATUS_CODES + (500, 502, 504, 'captcha', 'exception')
+
+
+def page_fingerprint(content):
+    """Hash the price/availability regions of a raw page, or None if none are found"""
+    digest = hashlib.sha1()
+    found = False
+    
+    for marker in FINGERPRINT_MARKERS:
+        start = content.find(marker)
+        if start == -1:
+            continue
+        found = True
+        digest.update(content[start:start + FINGERPRINT_WINDOW])
+    
+    return digest.hexdigest() if found else None
+
 
 class AmazonScraper:
-    def __init__(self):
+    def __init__(self, snapshot_store=None, rate_limiter=None):
+        # Raw pages are kept only when a snapshot store is configured
+        self.snapshot_store = snapshot_store or get_snapshot_store()
+        # Pacing is shared with every other scraper in the process
+        self.rate_limiter = rate_limiter or domain_limiter
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36',
             'Accept-Language': 'en-US,en;q=0.9',
@@ -40,43 +111,126 @@ class AmazonScraper:
             # Add more domains as needed
         return url
     
-    def scrape_product(self, url):
-        """Scrape product details from Amazon URL"""
+    def scrape_product(self, url, previous_fingerprint=None):
+        """Scrape product details from Amazon URL
+        
+        When previous_fingerprint matches the fetched page, parsing is skipped
+        and {'unchanged': True, ...} is returned instead of the full details.
+        """
         if not self.is_valid_amazon_url(url):
             return {'error': 'Invalid Amazon URL'}
         
         # Normalize URL
         normalized_url = self.normalize_url(url)
+        domain = urlsplit(normalized_url).netloc
+        response = None
         
         try:
-            # Add a random delay to avoid being blocked
-            time.sleep(random.uniform(1, 3))
+            # Wait for the per-domain limiter, which adapts to how the site responds
+            with SCRAPE_STAGE_SECONDS.time(stage='delay'):
+                self.rate_limiter.acquire(domain)
             
-            response = requests.get(normalized_url, headers=self.headers, timeout=10)
+            # With stream=True the call returns once headers arrive, so the
+            # body download can be timed separately from DNS/connect/TTFB
+            start = time.perf_counter()
+            response = requests.get(normalized_url, headers=self.headers, timeout=10, stream=True)
+            SCRAPE_STAGE_SECONDS.observe(time.perf_counter() - start, stage='connect')
+            SCRAPE_REQUESTS.inc(status=response.status_code)
+            if response.status_code in THROTTLE_STATUS_CODES:
+                self.rate_limiter.record_throttle(domain, str(response.status_code))
             if response.status_code != 200:
-                return {'error': f'Failed to fetch product page: {response.status_code}'}
+                response.close()
+                return {
+                    'error': f'Failed to fetch product page: {response.status_code}',
+                    'status_code': response.status_code
+                }
+            
+            with SCRAPE_STAGE_SECONDS.time(stage='download'):
+                content = response.content
+            
+            if any(marker in content for marker in CAPTCHA_MARKERS):
+                self.rate_limiter.record_throttle(domain, 'captcha')
+                return {'error': 'Amazon returned a captcha page', 'status_code': 'captcha'}
+            self.rate_limiter.record_success(domain)
             
-            soup = BeautifulSoup(response.text, 'html.parser')
+            if self.snapshot_store:
+                try:
+                    self.snapshot_store.put(normalized_url, content)
+                except OSError as e:
+                    logger.warning('Failed to store page snapshot', extra={'url': normalized_url, 'error': str(e)})
             
-            # Extract product details
-            product_data = {
-                'url': normalized_url,
-                'name': self._extract_name(soup),
-                'image': self._extract_image(soup),
-                'current_price': self._extract_current_price(soup),
-                'original_price': self._extract_original_price(soup),
-                'description': self._extract_description(soup),
-                'rating': self._extract_rating(soup),
-                'in_stock': self._check_in_stock(soup),
-                'currency': self._extract_currency(soup) or "₹",
-                'last_updated': datetime.utcnow()
-            }
+            with SCRAPE_STAGE_SECONDS.time(stage='fingerprint'):
+                fingerprint = page_fingerprint(content)
+            if previous_fingerprint:
+                FINGERPRINT_CHECKS.inc()
+                if fingerprint is not None and fingerprint == previous_fingerprint:
+                    FINGERPRINT_SKIPS.inc()
+                    return {
+                        'url': normalized_url,
+                        'unchanged': True,
+                        'fingerprint': fingerprint,
+                        'last_updated': datetime.utcnow()
+                    }
             
+            product_data = self.extract_product_data(response.text, normalized_url)
+            product_data['fingerprint'] = fingerprint
             return product_data
             
         except Exception as e:
-            print(f"Error scraping product: {str(e)}")
-            return {'error': f'Error scraping product: {str(e)}'}
+            if response is None:
+                SCRAPE_REQUESTS.inc(status='exception')
+            logger.warning('Error scraping product', extra={'url': normalized_url, 'error': str(e)})
+            return {'error': f'Error scraping product: {str(e)}', 'status_code': 'exception'}
+    
+    def probe(self, url):
+        """Cheap revalidation check: returns the status of a product page without downloading it"""
+        if not self.is_valid_amazon_url(url):
+            return 'invalid'
+        
+        normalized_url = self.normalize_url(url)
+        domain = urlsplit(normalized_url).netloc
+        
+        try:
+            with SCRAPE_STAGE_SECONDS.time(stage='delay'):
+                self.rate_limiter.acquire(domain)
+            # Headers only; the body is never read
+            response = requests.get(normalized_url, headers=self.headers, timeout=10, stream=True)
+            response.close()
+        except Exception as e:
+            SCRAPE_REQUESTS.inc(status='exception')
+            logger.warning('Error probing product', extra={'url': normalized_url, 'error': str(e)})
+            return 'exception'
+        
+        SCRAPE_REQUESTS.inc(status=response.status_code)
+        if response.status_code in THROTTLE_STATUS_CODES:
+            self.rate_limiter.record_throttle(domain, str(response.status_code))
+        return response.status_code
+    
+    def extract_product_data(self, html, url, fetched_at=None):
+        """Extract product details from a product page's HTML"""
+        with SCRAPE_STAGE_SECONDS.time(stage='parse'):
+            soup = BeautifulSoup(html, 'html.parser')
+        
+        extractors = (
+            ('name', self._extract_name),
+            ('image', self._extract_image),
+            ('current_price', self._extract_current_price),
+            ('original_price', self._extract_original_price),
+            ('description', self._extract_description),
+            ('rating', self._extract_rating),
+            ('in_stock', self._check_in_stock),
+            ('currency', self._extract_currency)
+        )
+        
+        product_data = {'url': url}
+        for field, extractor in extractors:
+            start = time.perf_counter()
+            product_data[field] = extractor(soup)
+            SCRAPE_EXTRACTOR_SECONDS.observe(time.perf_counter() - start, extractor=field)
+        
+        product_data['currency'] = product_data['currency'] or "₹"
+        product_data['last_updated'] = fetched_at or datetime.utcnow()
+        return product_data
     
     def _extract_name(self, soup):
         """Extract product name"""
@@ -210,14 +364,89 @@ class AmazonScraper:
         return None
 
 
+def is_parse_failure(data):
+    """True when a fetched page yielded neither a name nor a price"""
+    return 'error' not in data and not data.get('unchanged') and not data['name'] and not data['current_price']
+
+
+def record_scrape_failure(product, data, now=None):
+    """Back a product off after a failed scrape; returns False for transient failures
+    
+    Consecutive failures double the delay before the next attempt, and once
+    the failure score reaches SCRAPE_DEAD_AFTER the listing is marked dead
+    and only probed every SCRAPE_DEAD_PROBE_INTERVAL.
+    """
+    status = data.get('status_code', 'invalid')
+    if status in TRANSIENT_STATUSES:
+        return False
+    
+    now = now or datetime.utcnow()
+    product.failure_count = (product.failure_count or 0) + (2 if status in GONE_STATUS_CODES else 1)
+    product.last_error = data['error'][:200]
+    if product.failure_count >= FAILURE_CONFIG['SCRAPE_DEAD_AFTER']:
+        if product.scrape_status != 'dead':
+            logger.info('Product listing marked dead', extra={'product_id': product.id, 'error': product.last_error})
+        product.scrape_status = 'dead'
+        delay = FAILURE_CONFIG['SCRAPE_DEAD_PROBE_INTERVAL']
+    else:
+        product.scrape_status = 'failing'
+        delay = min(FAILURE_CONFIG['SCRAPE_BACKOFF_MAX'], FAILURE_CONFIG['SCRAPE_BACKOFF_BASE'] * 2 ** (product.failure_count - 1))
+    product.next_check_at = now + timedelta(seconds=delay)
+    return True
+
+
+def record_scrape_success(product):
+    """Return a product to the regular refresh schedule"""
+    if product.scrape_status != 'active' or product.failure_count:
+        product.scrape_status = 'active'
+        product.failure_count = 0
+        product.last_error = None
+        product.next_check_at = None
+
+
 def update_all_products():
-    """Update all products in the database"""
+    """Update every product that is due for a refresh"""
     scraper = AmazonScraper()
-    products = Product.query.all()
+    now = datetime.utcnow()
+    # Backed-off and dead products wait until their next check
+    products = Product.query.filter(db.or_(Product.next_check_at.is_(None), Product.next_check_at <= now)).all()
+    # Alerts created since the last cycle, possibly by other processes
+    rebuild_alert_index()
+    cycle_start = time.perf_counter()
+    failures = {}
+    history_rows = []
     
     for product in products:
-        data = scraper.scrape_product(product.url)
-        if 'error' not in data:
+        if product.scrape_status == 'dead':
+            # Only a listing that answers again is worth a full fetch and parse
+            status = scraper.probe(product.url)
+            if status != 200:
+                record_scrape_failure(product, {'error': f'Revalidation probe: {status}', 'status_code': status}, now=now)
+                CYCLE_PRODUCTS.inc(result='probe_failed')
+                continue
+        
+        data = scraper.scrape_product(product.url, previous_fingerprint=product.page_fingerprint)
+        if is_parse_failure(data):
+            data = {'error': 'No product name or price found on page', 'status_code': 'parse'}
+        if 'error' in data:
+            status = str(data.get('status_code', 'invalid'))
+            failures[status] = failures.get(status, 0) + 1
+            CYCLE_PRODUCTS.inc(result='error')
+            record_scrape_failure(product, data, now=now)
+        elif data.get('unchanged'):
+            # Price and availability regions are identical to the last fetch
+            product.last_updated = datetime.utcnow()
+            CYCLE_PRODUCTS.inc(result='unchanged')
+            record_scrape_success(product)
+            # Still one history point per cycle, as a full parse would write
+            if product.current_price:
+                product.baseline_price = update_baseline(product.baseline_price, product.current_price)
+                history_rows.append({'product_id': product.id, 'price': product.current_price, 'timestamp': datetime.utcnow()})
+        else:
+            CYCLE_PRODUCTS.inc(result='updated')
+            record_scrape_success(product)
+            product.page_fingerprint = data['fingerprint']
+            
             # Always update these fields
             product.name = data['name'] or product.name
             product.image = data['image'] or product.image
@@ -227,42 +456,79 @@ def update_all_products():
             if data['current_price']:
                 old_price = product.current_price
                 product.current_price = data['current_price']
+                product.baseline_price = update_baseline(product.baseline_price, data['current_price'])
                 
                 # Add to price history regardless of change
-                price_history = PriceHistory(product_id=product.id, price=data['current_price'])
-                db.session.add(price_history)
+                history_rows.append({'product_id': product.id, 'price': data['current_price'], 'timestamp': datetime.utcnow()})
                 
                 # Only check alerts if price actually decreased
                 if old_price and data['current_price'] < old_price:
-                    check_price_alerts(product)
+                    check_product_alerts(product, use_index=True)
             
             # Update additional attributes
             product.original_price = data['original_price'] or product.original_price
             product.currency = data['currency'] or product.currency
-            product.description = data['description'] or product.description
+            if data['description']:
+                product.description = data['description']
             product.rating = data['rating'] or product.rating
             product.in_stock = data['in_stock'] if data['in_stock'] is not None else product.in_stock
-                
-    db.session.commit()
+    
+    with SCRAPE_STAGE_SECONDS.time(stage='db_write'):
+        record_prices(history_rows)
+        db.session.commit()
+    
+    # One digest per user for everything this cycle triggered
+    if EMAIL_CONFIG['ALERT_DIGEST']:
+        flush_alert_digests()
+    
+    # Re-rank catalog-wide deals against the fresh prices
+    with SCRAPE_STAGE_SECONDS.time(stage='deals'):
+        update_deals()
+    
+    # Per-cycle summary
+    elapsed = time.perf_counter() - cycle_start
+    CYCLE_SECONDS.observe(elapsed)
+    LAST_CYCLE_PRODUCTS_PER_SECOND.set(len(products) / elapsed if elapsed else 0)
+    LAST_CYCLE_FAILURE_RATE.set(sum(failures.values()) / len(products) if products else 0)
+    LAST_CYCLE_FAILURES.clear()
+    for status, count in failures.items():
+        LAST_CYCLE_FAILURES.set(count, status=status)
+    quarantined = dict(
+        db.session.query(Product.scrape_status, db.func.count(Product.id))
+        .filter(Product.scrape_status.in_(QUARANTINE_STATUSES))
+        .group_by(Product.scrape_status)
+    )
+    for status in QUARANTINE_STATUSES:
+        QUARANTINED_PRODUCTS.set(quarantined.get(status, 0), status=status)
 
 
-def check_price_alerts(product):
-    """Check if any price alerts should be triggered for a product"""
-    # This is where you would implement logic to send email notifications
-    # when current_price falls below target_price for active alerts
-    active_alerts = PriceAlert.query.filter_by(
-        product_id=product.id, 
-        is_active=True
-    ).filter(
-        PriceAlert.target_price >= product.current_price
-    ).all()
+def reprocess_snapshots(store, latest_only=True, apply=False):
+    """Rerun extraction over stored page snapshots without touching the network"""
+    scraper = AmazonScraper(snapshot_store=store)
+    results = []
     
-    for alert in active_alerts:
-        # In a real implementation, you would send an email here
-        print(f"ALERT: Product {product.name} price dropped to {product.current_price}, "
-              f"below target of {alert.target_price}. Notifying {alert.email}")
+    for url, fetched_at, html in store.iter_snapshots(latest_only=latest_only):
+        data = scraper.extract_product_data(html, url, fetched_at=fetched_at)
+        results.append(data)
         
-        # Mark alert as inactive after triggering
-        alert.is_active = False
+        if not apply:
+            continue
         
-    db.session.commit()
\ No newline at end of file
+        # Refresh the extracted fields of every product tracking this page
+        for product in Product.query.filter_by(url=url).all():
+            product.name = data['name'] or product.name
+            product.image = data['image'] or product.image
+            product.current_price = data['current_price'] or product.current_price
+            product.original_price = data['original_price'] or product.original_price
+            product.currency = data['currency'] or product.currency
+            if data['description']:
+                product.description = data['description']
+            product.rating = data['rating'] or product.rating
+            if data['in_stock'] is not None:
+                product.in_stock = data['in_stock']
+    
+    if apply:
+        db.session.commit()
+    
+    return results
+
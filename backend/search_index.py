@@ -0,0 +1,141 @@
+import logging
+import os
+import re
+
+from sqlalchemy import inspect, text
+
+from database import db
+from models import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = {
+    # Postgres text search configuration; 'simple' indexes words without stemming
+    'SEARCH_TS_CONFIG': os.getenv('SEARCH_TS_CONFIG', 'english')
+}
+
+FTS_TABLE = 'product_fts'
+VECTOR_COLUMN = 'search_vector'
+TOKEN_PATTERN = re.compile(r'\w+')
+# Words of a query that are used; the rest are ignored
+MAX_TERMS = 8
+
+# SQLite: an external-content FTS5 table over product, kept in sync by
+# triggers, so every insert, refresh and delete updates it in the same
+# transaction. Only changes to name or description touch the index.
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, content='product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON product BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON product BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, description ON product BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+)
+
+_index_ready = False
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _ts_config():
+    config = SEARCH_CONFIG['SEARCH_TS_CONFIG']
+    if not re.fullmatch(r'\w+', config):
+        raise ValueError(f"Invalid SEARCH_TS_CONFIG: {config!r}")
+    return config
+
+
+def init_search_index():
+    """Create the full-text index over product names and descriptions if it is missing"""
+    connection = db.session.connection()
+    inspector = inspect(connection)
+
+    if _is_postgres():
+        # A generated column is maintained by Postgres itself; names weigh more than descriptions
+        config = _ts_config()
+        connection.execute(text(
+            f"ALTER TABLE product ADD COLUMN IF NOT EXISTS {VECTOR_COLUMN} tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{config}', coalesce(name, '')), 'A') || "
+            f"setweight(to_tsvector('{config}', coalesce(description, '')), 'B')) STORED"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_product_{VECTOR_COLUMN} ON product USING GIN ({VECTOR_COLUMN})"
+        ))
+    elif not inspector.has_table(FTS_TABLE):
+        try:
+            for statement in SQLITE_DDL:
+                connection.execute(text(statement))
+        except Exception:
+            # SQLite builds without FTS5; search falls back to LIKE
+            db.session.rollback()
+            logger.exception('Could not create the product search index')
+            return False
+        rebuild_search_index()
+
+    db.session.commit()
+    return True
+
+
+def rebuild_search_index():
+    """Re-index every product (SQLite only; the Postgres column is always current)"""
+    if not _is_postgres():
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+def _has_index():
+    global _index_ready
+    if not _index_ready:
+        inspector = inspect(db.session.connection())
+        if _is_postgres():
+            _index_ready = any(column['name'] == VECTOR_COLUMN for column in inspector.get_columns('product'))
+        else:
+            _index_ready = inspector.has_table(FTS_TABLE)
+    return _index_ready
+
+
+def search_products(user_id, query, limit, offset=0):
+    """Ids of a user's products matching query, best match first
+
+    Every word of the query has to match the start of a word in the name or
+    the description, so partial input finds results while typing. Matches in
+    the name rank above matches in the description.
+    """
+    terms = TOKEN_PATTERN.findall(query.lower())[:MAX_TERMS]
+    if not terms:
+        return []
+    params = {'user_id': user_id, 'limit': limit, 'offset': offset}
+
+    if not _has_index():
+        # No index (init-db not run, or SQLite without FTS5): substring scan
+        conditions = [
+            db.or_(Product.name.ilike(f"%{term}%"), Product.description.ilike(f"%{term}%"))
+            for term in terms
+        ]
+        return [product_id for product_id, in db.session.query(Product.id).filter(
+            Product.user_id == user_id, *conditions
+        ).order_by(Product.id).limit(limit).offset(offset)]
+
+    if _is_postgres():
+        params.update(query=' & '.join(f"{term}:*" for term in terms), config=_ts_config())
+        statement = text(
+            f"SELECT id FROM product, to_tsquery(CAST(:config AS regconfig), :query) AS q "
+            f"WHERE user_id = :user_id AND {VECTOR_COLUMN} @@ q "
+            f"ORDER BY ts_rank_cd({VECTOR_COLUMN}, q) DESC, id LIMIT :limit OFFSET :offset"
+        )
+    else:
+        # Quoted terms can't be read as FTS5 operators or column filters
+        params['query'] = ' '.join(f'"{term}"*' for term in terms)
+        statement = text(
+            f"SELECT product.id FROM {FTS_TABLE} JOIN product ON product.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :query AND product.user_id = :user_id "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0), product.id LIMIT :limit OFFSET :offset"
+        )
+    return [product_id for product_id, in db.session.execute(statement, params)]
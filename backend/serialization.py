@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import date, datetime
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SERIALIZATION_CONFIG = {
+    # 'orjson' (when installed) or 'json' for the standard library encoder
+    'JSON_SERIALIZER': os.getenv('JSON_SERIALIZER', 'orjson')
+}
+
+
+class Projection:
+    """Precomputed column projection turning model rows into plain dicts
+
+    Attribute lookups are bound once into an attrgetter, and datetimes are
+    left as-is for the JSON provider to encode (orjson does that natively).
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self._getter = attrgetter(*columns)
+
+    def row(self, obj):
+        return dict(zip(self.columns, self._getter(obj)))
+
+    def rows(self, objs):
+        columns = self.columns
+        getter = self._getter
+        return [dict(zip(columns, getter(obj))) for obj in objs]
+
+
+class PricePulseJSONProvider(DefaultJSONProvider):
+    """JSON provider that writes datetimes as ISO 8601 and keeps key order"""
+
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(PricePulseJSONProvider):
+    """Fast path serializing responses with orjson straight to bytes"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for json.dumps options (indent, separators...)
+            return json.dumps(obj, default=self.default, **kwargs)
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option), mimetype=self.mimetype
+        )
+
+
+def init_json(app, serializer=None):
+    """Install the configured JSON provider on the app"""
+    serializer = serializer or SERIALIZATION_CONFIG['JSON_SERIALIZER']
+    provider_class = OrjsonProvider if serializer == 'orjson' and orjson is not None else PricePulseJSONProvider
+    app.json = provider_class(app)
+    return app.json
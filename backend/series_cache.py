@@ -0,0 +1,409 @@
+import logging
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import event
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+SERIES_CONFIG = {
+    # Unset disables the cache; every worker on the host should share the directory
+    'SERIES_CACHE_DIR': os.getenv('SERIES_CACHE_DIR'),
+    # Days of history kept; requests reaching further back go to the database
+    'SERIES_CACHE_DAYS': int(os.getenv('SERIES_CACHE_DAYS', 366)),
+    # Appended records that trigger folding the tail into a new base file
+    'SERIES_TAIL_MAX': int(os.getenv('SERIES_TAIL_MAX', 50000))
+}
+
+HEADER_SIZE = 64
+BASE_MAGIC = b'PPSERIE1'
+TAIL_MAGIC = b'PPTAIL01'
+BASE_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('products', '<i8'), ('records', '<i8'), ('horizon', '<i8'), ('tail_generation', '<i8')
+])
+TAIL_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('generation', '<i8'), ('committed', '<i8')])
+INDEX_DTYPE = np.dtype([('product_id', '<i8'), ('offset', '<i8'), ('count', '<i8')])
+# Timestamps are naive epoch microseconds, as stored in the database
+RECORD_DTYPE = np.dtype([('id', '<i8'), ('ts', '<i8'), ('price', '<f8')])
+TAIL_DTYPE = np.dtype([('product_id', '<i8'), ('id', '<i8'), ('ts', '<i8'), ('price', '<f8')])
+
+# Tail record discarding everything cached before it for its product
+TOMBSTONE_ID = -1
+# Point rebuilt from a daily aggregate, served with id None
+AGGREGATED_ID = -2
+
+PENDING_KEY = 'series_cache_pending'
+
+
+def to_microseconds(value):
+    """Epoch microseconds of a datetime, ignoring tzinfo as the database comparisons do"""
+    return int(np.datetime64(value.replace(tzinfo=None), 'us').astype(np.int64))
+
+
+def _header_bytes(dtype, **fields):
+    header = np.zeros(1, dtype)
+    for name, value in fields.items():
+        header[name] = value
+    return header.tobytes().ljust(HEADER_SIZE, b'\0')
+
+
+class SeriesCache:
+    """Memory-mapped price series shared zero-copy by every worker process on a host
+
+    Layout under ``root``:
+        series.base   immutable snapshot: header, product index (id, offset, count)
+                      and fixed-width records grouped by product, sorted by time
+        series.tail   records appended since the snapshot; the header's committed
+                      count only moves once the records are on disk
+        series.lock   advisory lock serializing writers across processes
+
+    When the tail grows past ``tail_max`` it is folded into a new base file,
+    which replaces the old one atomically. The tail carries the generation of
+    the base it belongs to, so a tail already folded in is never read twice.
+    """
+
+    def __init__(self, root, days=SERIES_CONFIG['SERIES_CACHE_DAYS'], tail_max=SERIES_CONFIG['SERIES_TAIL_MAX']):
+        self.root = root
+        self.days = days
+        self.tail_max = tail_max
+        self.base_path = os.path.join(root, 'series.base')
+        self.tail_path = os.path.join(root, 'series.tail')
+        self.lock_path = os.path.join(root, 'series.lock')
+        self._map_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._base = None
+        self._tail_map = None
+
+        os.makedirs(root, exist_ok=True)
+
+    def is_built(self):
+        return os.path.exists(self.base_path)
+
+    def read(self, product_ids, since):
+        """Cached series of several products since a time
+
+        Returns (product_ids, ids, timestamps, prices) arrays sorted by product
+        then time, with datetime64[us] timestamps, or None when the cache does
+        not cover the window. A single product without recent appends is
+        returned as views straight into the mapped file.
+        """
+        base = self._mapped_base()
+        if base is None:
+            return None
+        since_us = to_microseconds(since)
+        if since_us < base['horizon']:
+            return None
+
+        wanted = np.unique(np.asarray(list(product_ids), dtype=np.int64))
+        index = base['index']
+        records = base['records']
+        positions = np.searchsorted(index['product_id'], wanted)
+
+        # Recent appends for the requested products, grouped by product in append order
+        tail = self._mapped_tail(base['tail_generation'])
+        if len(tail):
+            tail = tail[np.isin(tail['product_id'], wanted)]
+            tail = tail[np.argsort(tail['product_id'], kind='stable')]
+        tail_bounds = np.searchsorted(tail['product_id'], np.concatenate((wanted, [np.iinfo(np.int64).max])))
+
+        pieces = []
+        for i, product_id in enumerate(wanted):
+            position = positions[i]
+            if position < len(index) and index['product_id'][position] == product_id:
+                start = index['offset'][position]
+                series = records[start:start + index['count'][position]]
+            else:
+                series = records[:0]
+
+            appended = tail[tail_bounds[i]:tail_bounds[i + 1]]
+            if len(appended):
+                tombstones = np.flatnonzero(appended['id'] == TOMBSTONE_ID)
+                if len(tombstones):
+                    series = records[:0]
+                    appended = appended[tombstones[-1] + 1:]
+                recent = np.empty(len(appended), RECORD_DTYPE)
+                for name in RECORD_DTYPE.names:
+                    recent[name] = appended[name]
+                series = np.concatenate((series, recent))
+                series = series[np.argsort(series['ts'], kind='stable')]
+
+            series = series[np.searchsorted(series['ts'], since_us):]
+            if len(series):
+                pieces.append((product_id, series))
+
+        if len(pieces) == 1:
+            product_id, series = pieces[0]
+            return (
+                np.full(len(series), product_id, dtype=np.int64),
+                series['id'],
+                series['ts'].view('datetime64[us]'),
+                series['price']
+            )
+        if not pieces:
+            return (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, 'datetime64[us]'), np.empty(0, np.float64))
+
+        series = np.concatenate([series for _, series in pieces])
+        return (
+            np.repeat([product_id for product_id, _ in pieces], [len(s) for _, s in pieces]).astype(np.int64),
+            series['id'],
+            series['ts'].view('datetime64[us]'),
+            series['price']
+        )
+
+    def append(self, rows):
+        """Durably append (product_id, id, timestamp_us, price) rows"""
+        records = np.array(rows, dtype=TAIL_DTYPE)
+        if not len(records):
+            return
+        with self._writer_lock():
+            base = self._mapped_base()
+            if base is None:
+                return
+            generation = base['tail_generation']
+            with self._open_tail() as f:
+                header = self._read_tail_header(f)
+                committed = int(header['committed']) if header is not None and header['generation'] == generation else 0
+                # Records past the committed count are leftovers of an
+                # interrupted append and are simply overwritten
+                f.seek(HEADER_SIZE + committed * TAIL_DTYPE.itemsize)
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+                # Publish: a crash before this point leaves the records invisible
+                f.seek(0)
+                f.write(_header_bytes(TAIL_HEADER_DTYPE, magic=TAIL_MAGIC, generation=generation,
+                                      committed=committed + len(records)))
+                f.flush()
+                os.fsync(f.fileno())
+
+            if committed + len(records) > self.tail_max:
+                self._compact(base)
+
+    def rebuild(self):
+        """Rebuild the base file from the database"""
+        from history_store import load_history
+        from models import Product
+
+        with self._writer_lock():
+            since = datetime.utcnow() - timedelta(days=self.days)
+            product_ids = [product_id for product_id, in db.session.query(Product.id)]
+            rows = load_history(product_ids, since)
+
+            records = np.empty(len(rows), RECORD_DTYPE)
+            pids = np.empty(len(rows), np.int64)
+            if rows:
+                ids, pids[:], records['price'], timestamps = zip(*rows)
+                records['id'] = [AGGREGATED_ID if history_id is None else history_id for history_id in ids]
+                records['ts'] = np.array(timestamps, dtype='datetime64[us]').astype(np.int64)
+
+            base = self._mapped_base()
+            generation = (base['tail_generation'] if base else 0) + 1
+            self._write_base(pids, records, to_microseconds(since), generation)
+            logger.info('Rebuilt price series cache', extra={'products': len(product_ids), 'records': len(rows)})
+
+    def _compact(self, base):
+        """Fold the committed tail into a new base file (writer lock held)"""
+        index = base['index']
+        pids = np.repeat(index['product_id'], index['count'])
+        records = np.array(base['records'])
+
+        with open(self.tail_path, 'rb') as f:
+            header = self._read_tail_header(f)
+            f.seek(HEADER_SIZE)
+            tail = np.frombuffer(f.read(int(header['committed']) * TAIL_DTYPE.itemsize), TAIL_DTYPE)
+
+        keep_tail = tail['id'] != TOMBSTONE_ID
+        if not keep_tail.all():
+            last_tombstone = {}
+            for position in np.flatnonzero(~keep_tail):
+                last_tombstone[int(tail['product_id'][position])] = position
+            records = records[~np.isin(pids, list(last_tombstone))]
+            pids = pids[~np.isin(pids, list(last_tombstone))]
+            cutoffs = np.array([last_tombstone.get(int(product_id), -1) for product_id in tail['product_id']])
+            keep_tail &= np.arange(len(tail)) > cutoffs
+        tail = tail[keep_tail]
+
+        recent = np.empty(len(tail), RECORD_DTYPE)
+        for name in RECORD_DTYPE.names:
+            recent[name] = tail[name]
+        pids = np.concatenate((pids, tail['product_id']))
+        records = np.concatenate((records, recent))
+
+        horizon = max(base['horizon'], to_microseconds(datetime.utcnow() - timedelta(days=self.days)))
+        keep = records['ts'] >= horizon
+        pids, records = pids[keep], records[keep]
+        order = np.lexsort((records['ts'], pids))
+        pids, records = pids[order], records[order]
+
+        self._write_base(pids, records, horizon, base['tail_generation'] + 1)
+        logger.info('Compacted price series cache', extra={'records': len(records), 'folded': len(tail)})
+
+    def _write_base(self, pids, records, horizon, tail_generation):
+        product_ids, offsets, counts = np.unique(pids, return_index=True, return_counts=True)
+        index = np.empty(len(product_ids), INDEX_DTYPE)
+        index['product_id'] = product_ids
+        index['offset'] = offsets
+        index['count'] = counts
+
+        tmp_path = f"{self.base_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_header_bytes(BASE_HEADER_DTYPE, magic=BASE_MAGIC, products=len(index), records=len(records),
+                                  horizon=horizon, tail_generation=tail_generation))
+            f.write(index.tobytes())
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.base_path)
+
+        # Start an empty tail for the new base. The file is never truncated,
+        # since readers may still have its old length mapped.
+        with self._open_tail() as f:
+            f.write(_header_bytes(TAIL_HEADER_DTYPE, magic=TAIL_MAGIC, generation=tail_generation, committed=0))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _mapped_base(self):
+        try:
+            stat = os.stat(self.base_path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._map_lock:
+            if self._base is None or self._base['key'] != key:
+                with open(self.base_path, 'rb') as f:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                header = np.frombuffer(buffer, BASE_HEADER_DTYPE, count=1)[0]
+                products = int(header['products'])
+                self._base = {
+                    'key': key,
+                    'horizon': int(header['horizon']),
+                    'tail_generation': int(header['tail_generation']),
+                    'index': np.frombuffer(buffer, INDEX_DTYPE, count=products, offset=HEADER_SIZE),
+                    'records': np.frombuffer(buffer, RECORD_DTYPE, count=int(header['records']),
+                                             offset=HEADER_SIZE + products * INDEX_DTYPE.itemsize)
+                }
+            return self._base
+
+    def _mapped_tail(self, generation):
+        empty = np.empty(0, TAIL_DTYPE)
+        try:
+            size = os.path.getsize(self.tail_path)
+        except FileNotFoundError:
+            return empty
+        if size < HEADER_SIZE:
+            return empty
+        with self._map_lock:
+            buffer = self._tail_map
+            if buffer is None or len(buffer) < size:
+                with open(self.tail_path, 'rb') as f:
+                    buffer = self._tail_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(buffer, TAIL_HEADER_DTYPE, count=1)[0]
+        if header['magic'] != TAIL_MAGIC or header['generation'] != generation:
+            return empty
+        committed = min(int(header['committed']), (len(buffer) - HEADER_SIZE) // TAIL_DTYPE.itemsize)
+        return np.frombuffer(buffer, TAIL_DTYPE, count=committed, offset=HEADER_SIZE)
+
+    def _open_tail(self):
+        return os.fdopen(os.open(self.tail_path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+
+    @staticmethod
+    def _read_tail_header(f):
+        f.seek(0)
+        data = f.read(HEADER_SIZE)
+        if len(data) < HEADER_SIZE:
+            return None
+        header = np.frombuffer(data, TAIL_HEADER_DTYPE, count=1)[0]
+        return header if header['magic'] == TAIL_MAGIC else None
+
+    @contextmanager
+    def _writer_lock(self):
+        with self._thread_lock:
+            with open(self.lock_path, 'a+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+_series_cache = None
+_hooks_installed = False
+
+
+def get_series_cache():
+    """Return the configured series cache, or None when SERIES_CACHE_DIR is unset"""
+    global _series_cache
+    if _series_cache is None and SERIES_CONFIG['SERIES_CACHE_DIR']:
+        _series_cache = SeriesCache(SERIES_CONFIG['SERIES_CACHE_DIR'])
+    return _series_cache
+
+
+def track_history(rows):
+    """Queue (product_id, id, timestamp, price) history rows for the cache once the session commits"""
+    if get_series_cache() is None:
+        return
+    _install_hooks()
+    db.session.info.setdefault(PENDING_KEY, []).extend(
+        (product_id, history_id, to_microseconds(timestamp), price)
+        for product_id, history_id, timestamp, price in rows
+        if price is not None
+    )
+
+
+def track_deletion(product_ids):
+    """Queue dropping the cached series of deleted products once the session commits"""
+    if get_series_cache() is None:
+        return
+    _install_hooks()
+    db.session.info.setdefault(PENDING_KEY, []).extend(
+        (product_id, TOMBSTONE_ID, 0, float('nan')) for product_id in product_ids
+    )
+
+
+def _after_commit(session):
+    rows = session.info.pop(PENDING_KEY, None)
+    if not rows:
+        return
+    try:
+        get_series_cache().append(rows)
+    except OSError:
+        # The database stays authoritative; a rebuild brings the cache back in line
+        logger.exception('Could not append to the price series cache')
+
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def _install_hooks():
+    # Registered on the first queued write, so processes that never write
+    # history (and never import this module) pay nothing
+    global _hooks_installed
+    if not _hooks_installed:
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+        _hooks_installed = True
+
+
+def init_series_cache():
+    """Build the cache if it does not exist yet (flask --app main init-db)"""
+    cache = get_series_cache()
+    if cache is None:
+        return None
+    _install_hooks()
+    if not cache.is_built():
+        cache.rebuild()
+    return cache
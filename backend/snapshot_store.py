@@ -0,0 +1,242 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SNAPSHOT_CONFIG = {
+    'SNAPSHOT_DIR': os.getenv('SNAPSHOT_DIR'),
+    'SNAPSHOT_MAX_BYTES': int(os.getenv('SNAPSHOT_MAX_BYTES', 512 * 1024 * 1024)),
+    'SNAPSHOT_CODEC': os.getenv('SNAPSHOT_CODEC', 'zstd' if zstandard else 'gzip'),
+    'SNAPSHOT_INDEX_MAX_BYTES': int(os.getenv('SNAPSHOT_INDEX_MAX_BYTES', 16 * 1024 * 1024))
+}
+
+
+class SnapshotStore:
+    """Content-addressed, compressed store of raw product pages on local disk.
+
+    Layout under ``root``:
+        objects/<2 hex>/<sha256>.<codec>   compressed page bodies, one per unique page
+        index.jsonl                        one line per fetch: url, digest, fetched_at
+        index.lock                         held by writers; holds the object byte total shared by all processes
+
+    The index counts toward ``max_bytes``. Once it passes ``index_max_bytes``
+    it is compacted down to the latest fetch of each (url, digest).
+    """
+
+    def __init__(self, root, max_bytes=SNAPSHOT_CONFIG['SNAPSHOT_MAX_BYTES'], codec=SNAPSHOT_CONFIG['SNAPSHOT_CODEC'],
+                 index_max_bytes=SNAPSHOT_CONFIG['SNAPSHOT_INDEX_MAX_BYTES']):
+        if codec == 'zstd' and zstandard is None:
+            codec = 'gzip'
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_max_bytes = index_max_bytes
+        self.codec = codec
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.lock_path = os.path.join(root, 'index.lock')
+        self._lock = threading.Lock()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._compacted_index_bytes = 0
+
+    def put(self, url, content, fetched_at=None):
+        """Store a fetched page body and return its digest"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        fetched_at = fetched_at or datetime.utcnow()
+
+        with self._store_lock() as lock_file:
+            total = self._read_total(lock_file)
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                # Identical page already stored - just mark it as recently used
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(self._compress(content))
+                os.replace(tmp_path, path)
+                total += os.path.getsize(path)
+
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    'url': url,
+                    'digest': digest,
+                    'fetched_at': fetched_at.isoformat()
+                }) + '\n')
+
+            index_bytes = self._index_bytes()
+            if total + index_bytes > self.max_bytes:
+                total = self._evict()
+            elif index_bytes > max(self.index_max_bytes, 2 * self._compacted_index_bytes):
+                self._compact_index()
+            self._write_total(lock_file, total)
+
+        return digest
+
+    def get(self, digest):
+        """Return the decompressed page body for a digest, or None if evicted"""
+        for codec in (self.codec, 'zstd', 'gzip'):
+            path = self._object_path(digest, codec)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return self._decompress(f.read(), codec)
+        return None
+
+    def iter_snapshots(self, latest_only=True):
+        """Yield (url, fetched_at, html) for stored snapshots, skipping evicted pages"""
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        if latest_only:
+            latest = {}
+            for entry in entries:
+                latest[entry['url']] = entry
+            entries = list(latest.values())
+
+        for entry in entries:
+            content = self.get(entry['digest'])
+            if content is None:
+                continue
+            yield entry['url'], datetime.fromisoformat(entry['fetched_at']), content.decode('utf-8', errors='replace')
+
+    def total_bytes(self):
+        with self._store_lock() as lock_file:
+            return self._read_total(lock_file) + self._index_bytes()
+
+    def _evict(self):
+        """Delete least recently stored objects until the store is back under 90% of its limit.
+
+        Returns the remaining object bytes, re-counted from disk.
+        """
+        self._compact_index()
+        objects = sorted(self._scan_objects(), key=lambda o: o[2])
+        total = sum(size for _, size, _ in objects)
+        target = int(self.max_bytes * 0.9) - self._index_bytes()
+        evicted = set()
+        for path, size, _ in objects:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted.add(os.path.basename(path).split('.', 1)[0])
+            except OSError:
+                continue
+        if evicted:
+            self._compact_index(evicted)
+        return total
+
+    def _compact_index(self, evicted=()):
+        """Rewrite the index keeping the latest fetch of each (url, digest), minus evicted objects"""
+        if not os.path.exists(self.index_path):
+            return
+        latest = {}
+        with open(self.index_path, encoding='utf-8') as src:
+            for line in src:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry['digest'] in evicted:
+                    continue
+                # Re-insert so the kept lines stay in order of their latest fetch
+                key = (entry['url'], entry['digest'])
+                latest.pop(key, None)
+                latest[key] = line if line.endswith('\n') else line + '\n'
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as dst:
+            dst.writelines(latest.values())
+        os.replace(tmp_path, self.index_path)
+        self._compacted_index_bytes = self._index_bytes()
+
+    def _index_bytes(self):
+        try:
+            return os.path.getsize(self.index_path)
+        except OSError:
+            return 0
+
+    def _read_total(self, lock_file):
+        lock_file.seek(0)
+        data = lock_file.read()
+        if data.strip():
+            return int(data)
+        # First writer on this store - count what is already on disk
+        return sum(size for _, size, _ in self._scan_objects())
+
+    @staticmethod
+    def _write_total(lock_file, total):
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(total).encode('ascii'))
+        lock_file.flush()
+
+    @contextmanager
+    def _store_lock(self):
+        """Serialise writers across threads, and across processes where flock is available"""
+        with self._lock:
+            with open(self.lock_path, 'a+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield f
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _scan_objects(self):
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _object_path(self, digest, codec=None):
+        codec = codec or self.codec
+        extension = 'zst' if codec == 'zstd' else 'gz'
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.{extension}")
+
+    def _compress(self, content):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=10).compress(content)
+        return gzip.compress(content, compresslevel=6)
+
+    def _decompress(self, data, codec):
+        if codec == 'zstd':
+            if zstandard is None:
+                return None
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+
+_snapshot_store = None
+
+
+def get_snapshot_store():
+    """Return the configured snapshot store, or None when SNAPSHOT_DIR is unset"""
+    global _snapshot_store
+    if _snapshot_store is None and SNAPSHOT_CONFIG['SNAPSHOT_DIR']:
+        _snapshot_store = SnapshotStore(SNAPSHOT_CONFIG['SNAPSHOT_DIR'])
+    return _snapshot_store
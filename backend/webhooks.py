@@ -0,0 +1,461 @@
+import asyncio
+import atexit
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+    from aiohttp.abc import AbstractResolver
+except ImportError:
+    aiohttp = None
+    AbstractResolver = object
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+from metrics import WEBHOOK_DELIVERY_SECONDS, WEBHOOK_EVENTS, WEBHOOK_QUEUE_DEPTH
+from models import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_CONFIG = {
+    # Endpoint for users without a webhook_url of their own; empty means none
+    'WEBHOOK_URL': os.getenv('WEBHOOK_URL', ''),
+    # Signs every body as X-PricePulse-Signature: sha256=<HMAC of the body>
+    'WEBHOOK_SECRET': os.getenv('WEBHOOK_SECRET', ''),
+    # Events per POST to one URL, and how long a partial batch waits for more
+    'WEBHOOK_BATCH_SIZE': int(os.getenv('WEBHOOK_BATCH_SIZE', 100)),
+    'WEBHOOK_BATCH_WAIT': float(os.getenv('WEBHOOK_BATCH_WAIT', 0.05)),
+    # Requests (and pooled connections) in flight across all endpoints
+    'WEBHOOK_CONCURRENCY': int(os.getenv('WEBHOOK_CONCURRENCY', 64)),
+    'WEBHOOK_TIMEOUT': float(os.getenv('WEBHOOK_TIMEOUT', 10)),
+    'WEBHOOK_MAX_ATTEMPTS': int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 5)),
+    'WEBHOOK_BACKOFF_BASE': float(os.getenv('WEBHOOK_BACKOFF_BASE', 1.0)),
+    'WEBHOOK_BACKOFF_MAX': float(os.getenv('WEBHOOK_BACKOFF_MAX', 60)),
+    # Undelivered events held in memory; beyond this submit() refuses new ones
+    'WEBHOOK_QUEUE_SIZE': int(os.getenv('WEBHOOK_QUEUE_SIZE', 100000)),
+    # Comma-separated hosts webhooks may go to, trusted whatever they resolve
+    # to; when empty any host is allowed that resolves only to public addresses
+    'WEBHOOK_ALLOWED_HOSTS': {host.strip().lower() for host in os.getenv('WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()}
+}
+
+# Responses worth retrying; any other non-2xx status fails the batch at once
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class UnsafeWebhookURL(ValueError):
+    """A webhook URL outside WEBHOOK_ALLOWED_HOSTS, or one that reaches a non-public address"""
+
+
+class _BlockedAddress(OSError):
+    pass
+
+
+def _is_public(address):
+    address = ipaddress.ip_address(address.split('%', 1)[0])
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    # Not private, loopback, link-local, shared, reserved or multicast
+    return address.is_global and not address.is_multicast
+
+
+def _check_host(url):
+    """Return url's host and whether its DNS addresses still have to be checked
+
+    Raises UnsafeWebhookURL for hosts outside the allowlist and for IP
+    literals that are not public.
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    if not host:
+        raise UnsafeWebhookURL('Webhook URL has no host')
+    allowed = WEBHOOK_CONFIG['WEBHOOK_ALLOWED_HOSTS']
+    if allowed:
+        if host not in allowed:
+            raise UnsafeWebhookURL(f"{host} is not an allowed webhook host")
+        return host, False
+    try:
+        public = _is_public(host)
+    except ValueError:
+        # A name, not an address
+        return host, True
+    if not public:
+        raise UnsafeWebhookURL(f"{host} is not a public address")
+    return host, False
+
+
+def check_webhook_url(url):
+    """Raise UnsafeWebhookURL unless url may receive webhooks
+
+    Names are resolved here, and again by the dispatcher when it connects,
+    so a name re-pointed at an internal address later is still refused.
+    """
+    host, resolve = _check_host(url)
+    if not resolve:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)}
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeWebhookURL(f"{host} does not resolve")
+    if not all(_is_public(address) for address in addresses):
+        raise UnsafeWebhookURL(f"{host} resolves to a non-public address")
+
+
+class _PublicResolver(AbstractResolver):
+    """aiohttp's default resolver, keeping only public addresses"""
+
+    def __init__(self):
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        results = [result for result in await self._resolver.resolve(host, port, family) if _is_public(result['host'])]
+        if not results:
+            raise _BlockedAddress(f"{host} resolves to a non-public address")
+        return results
+
+    async def close(self):
+        await self._resolver.close()
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=str).encode('utf-8')
+
+
+class WebhookDispatcher:
+    """Delivers webhook events from a background event loop over pooled connections
+
+    submit() only appends to an in-memory queue, so callers such as the
+    alert sweep never wait on the network. The loop groups queued events by
+    URL into batches, POSTs them concurrently over keep-alive connections
+    and retries failed batches with exponential backoff and jitter. Events
+    of a batch that is given up on are handed to their on_failure callback;
+    price alerts use it to retry the webhook on a later sweep, so delivery
+    is at least once and receivers should dedupe on the event's alert_id.
+    """
+
+    def __init__(self, batch_size=None, batch_wait=None, concurrency=None, timeout=None, max_attempts=None,
+                 backoff_base=None, backoff_max=None, queue_size=None, secret=None):
+        self.batch_size = batch_size or WEBHOOK_CONFIG['WEBHOOK_BATCH_SIZE']
+        self.batch_wait = WEBHOOK_CONFIG['WEBHOOK_BATCH_WAIT'] if batch_wait is None else batch_wait
+        self.concurrency = concurrency or WEBHOOK_CONFIG['WEBHOOK_CONCURRENCY']
+        self.timeout = timeout or WEBHOOK_CONFIG['WEBHOOK_TIMEOUT']
+        self.max_attempts = max_attempts or WEBHOOK_CONFIG['WEBHOOK_MAX_ATTEMPTS']
+        self.backoff_base = WEBHOOK_CONFIG['WEBHOOK_BACKOFF_BASE'] if backoff_base is None else backoff_base
+        self.backoff_max = WEBHOOK_CONFIG['WEBHOOK_BACKOFF_MAX'] if backoff_max is None else backoff_max
+        self.queue_size = queue_size or WEBHOOK_CONFIG['WEBHOOK_QUEUE_SIZE']
+        secret = WEBHOOK_CONFIG['WEBHOOK_SECRET'] if secret is None else secret
+        self._secret = secret.encode('utf-8') if secret else None
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # (url, event, on_failure) not yet picked up by the loop
+        self._pending = deque()
+        # Accepted events not yet delivered or given up on
+        self._outstanding = 0
+        self._wakeup_scheduled = False
+        self._loop = None
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, url, event, on_failure=None):
+        """Queue an event for url; returns False (and drops it) when the queue is full
+
+        on_failure(url, events, permanent) is called from a worker thread
+        with this event (and others sharing the callback) if it is dropped or
+        delivery is given up on. permanent is True when the endpoint refused
+        the batch with a status that is not worth retrying (most 4xx), or
+        the URL may not be posted to (see check_webhook_url).
+        """
+        with self._lock:
+            full = self._outstanding >= self.queue_size
+            if full:
+                WEBHOOK_EVENTS.inc(result='dropped')
+            else:
+                if self._thread is None:
+                    self._start_locked()
+                self._pending.append((url, event, on_failure))
+                self._outstanding += 1
+                WEBHOOK_QUEUE_DEPTH.set(self._outstanding)
+                wake = not self._wakeup_scheduled
+                self._wakeup_scheduled = True
+        if full:
+            if on_failure is not None:
+                threading.Thread(target=on_failure, args=(url, [event], False), daemon=True).start()
+            return False
+        if wake:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def flush(self, timeout=None):
+        """Block until every accepted event is delivered or given up on; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def close(self, timeout=None):
+        """Send what is queued (without waiting out backoffs) and stop the loop thread"""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+        thread.join(timeout)
+        if not thread.is_alive():
+            with self._lock:
+                # A later submit() starts a fresh loop
+                self._thread = None
+                self._stopping = False
+
+    def __len__(self):
+        return self._outstanding
+
+    def _start_locked(self):
+        if aiohttp is None:
+            raise RuntimeError('Webhook delivery needs aiohttp (pip install aiohttp)')
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = asyncio.Event()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._run(),),
+                                        name='webhook-dispatcher', daemon=True)
+        self._thread.start()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        # url -> (event, on_failure) pairs waiting to fill a batch, and when
+        # that partial batch is sent anyway
+        batches = {}
+        deadlines = {}
+
+        # Allowlisted hosts are trusted; otherwise every connection is checked
+        # against the addresses the name resolves to at that moment
+        resolver = None if WEBHOOK_CONFIG['WEBHOOK_ALLOWED_HOSTS'] else _PublicResolver()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, resolver=resolver)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            def send(url, items):
+                task = loop.create_task(self._deliver(session, url, items))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            while True:
+                wait = max(0.0, min(deadlines.values()) - loop.time()) if deadlines else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                with self._lock:
+                    drained = list(self._pending)
+                    self._pending.clear()
+                    self._wakeup_scheduled = False
+                    stopping = self._stopping
+
+                now = loop.time()
+                for url, event, on_failure in drained:
+                    batch = batches.setdefault(url, [])
+                    if not batch:
+                        deadlines[url] = now + self.batch_wait
+                    batch.append((event, on_failure))
+                    if len(batch) >= self.batch_size:
+                        send(url, batches.pop(url))
+                        del deadlines[url]
+                for url in [url for url, deadline in deadlines.items() if stopping or deadline <= now]:
+                    send(url, batches.pop(url))
+                    del deadlines[url]
+
+                if stopping:
+                    break
+            if tasks:
+                await asyncio.gather(*tasks)
+
+    async def _deliver(self, session, url, items):
+        events = [event for event, _ in items]
+        body = _dumps({'events': events})
+        headers = {'Content-Type': 'application/json'}
+        if self._secret:
+            headers['X-PricePulse-Signature'] = 'sha256=' + hmac.new(self._secret, body, hashlib.sha256).hexdigest()
+
+        delivered = False
+        status = None
+        attempt = -1
+        try:
+            _check_host(url)
+        except UnsafeWebhookURL:
+            status = 'blocked'
+        for attempt in range(self.max_attempts if status is None else 0):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    # Redirects are not followed; they could lead anywhere
+                    async with session.post(url, data=body, headers=headers, allow_redirects=False) as response:
+                        await response.read()
+                        status = response.status
+                        retry_after = response.headers.get('Retry-After')
+                    WEBHOOK_DELIVERY_SECONDS.observe(time.perf_counter() - start)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                blocked = isinstance(getattr(e, 'os_error', None), _BlockedAddress)
+                status = 'blocked' if blocked else type(e).__name__
+
+            if isinstance(status, int) and 200 <= status < 300:
+                delivered = True
+                break
+            if status == 'blocked' or (isinstance(status, int) and status not in RETRY_STATUS_CODES):
+                break
+            if attempt + 1 < self.max_attempts and not self._stopping:
+                WEBHOOK_EVENTS.inc(len(events), result='retried')
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+            else:
+                break
+
+        if delivered:
+            WEBHOOK_EVENTS.inc(len(events), result='delivered')
+        else:
+            WEBHOOK_EVENTS.inc(len(events), result='failed')
+            # Never log the full URL - it may carry a token
+            logger.warning('Webhook delivery failed', extra={
+                'host': urlsplit(url).netloc, 'status': status, 'events': len(events), 'attempts': attempt + 1
+            })
+            permanent = status == 'blocked' or (isinstance(status, int) and status not in RETRY_STATUS_CODES)
+            await self._report_failure(url, items, permanent)
+        with self._idle:
+            self._outstanding -= len(events)
+            WEBHOOK_QUEUE_DEPTH.set(self._outstanding)
+            if self._outstanding == 0:
+                self._idle.notify_all()
+
+    async def _report_failure(self, url, items, permanent=False):
+        by_callback = {}
+        for event, on_failure in items:
+            if on_failure is not None:
+                by_callback.setdefault(on_failure, []).append(event)
+        loop = asyncio.get_running_loop()
+        for on_failure, events in by_callback.items():
+            try:
+                # Callbacks may block (database writes), so keep them off the loop
+                await loop.run_in_executor(None, on_failure, url, events, permanent)
+            except Exception:
+                logger.exception('Webhook failure callback failed', extra={'events': len(events)})
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Equal jitter: half the exponential delay plus a random half
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_webhook_dispatcher():
+    """Return the process-wide dispatcher, created on first use"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = WebhookDispatcher()
+            # Give queued events a few seconds to go out when the process exits
+            atexit.register(_dispatcher.close, 5)
+        return _dispatcher
+
+
+def alert_event(alert, product):
+    """JSON-ready payload describing a triggered price alert"""
+    return {
+        'type': 'price_alert',
+        'alert_id': alert.id,
+        'user_id': alert.user_id,
+        'product_id': product.id,
+        'name': product.name,
+        'url': product.url,
+        'image': product.image,
+        'currency': product.currency,
+        'price': product.current_price,
+        'target_price': alert.target_price,
+        'triggered_at': datetime.utcnow().isoformat()
+    }
+
+
+@lru_cache(maxsize=None)
+def _alert_reactivator(app):
+    """on_failure callback putting alerts whose webhook was given up on back in the next sweep
+
+    Only the webhook channel is marked unsent, so the retry does not repeat
+    the other channels, and the sweep backs off and caps the retries. An
+    endpoint that refused the events outright is not retried.
+    """
+    def reactivate(url, events, permanent=False):
+        alert_ids = [event['alert_id'] for event in events]
+        if permanent:
+            logger.warning('Webhook endpoint refused alerts; not retrying', extra={
+                'host': urlsplit(url).netloc, 'alerts': len(alert_ids)
+            })
+            return
+        with app.app_context():
+            for alert in PriceAlert.query.filter(PriceAlert.id.in_(alert_ids)):
+                alert.record_failure('webhook')
+                alert.is_active = True
+            db.session.commit()
+        logger.warning('Reactivated alerts after failed webhook delivery', extra={
+            'host': urlsplit(url).netloc, 'alerts': len(alert_ids)
+        })
+    return reactivate
+
+
+def send_webhook_alert(alert, product, user):
+    """Queue a price alert for the user's webhook
+
+    True once it is accepted, None when the channel does not apply (no
+    webhook URL, or aiohttp missing). The event is handed to the dispatcher
+    when the current transaction commits, after the alert's deactivation,
+    so the reactivation of an alert whose delivery is given up on always
+    lands last.
+    """
+    url = getattr(user, 'webhook_url', None) or WEBHOOK_CONFIG['WEBHOOK_URL']
+    if not url:
+        return None
+    if aiohttp is None:
+        logger.warning('Webhook alerts need aiohttp; skipping', extra={'alert_id': alert.id})
+        return None
+    on_failure = _alert_reactivator(current_app._get_current_object())
+    db.session.info.setdefault('pending_webhooks', []).append((url, alert_event(alert, product), on_failure))
+    return True
+
+
+@event.listens_for(Session, 'after_commit')
+def _submit_pending_webhooks(session):
+    pending = session.info.pop('pending_webhooks', None)
+    if pending:
+        dispatcher = get_webhook_dispatcher()
+        for url, payload, on_failure in pending:
+            dispatcher.submit(url, payload, on_failure=on_failure)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending_webhooks(session):
+    # The alerts were not deactivated either, so the next sweep sends them again
+    session.info.pop('pending_webhooks', None)